@@ -3,6 +3,22 @@ class ClinoteBackground {
   constructor() {
     this.isRecording = false;
     this.transcriptionChunks = [];
+    this.nativePort = null;
+    this.nativeRequests = new Map();
+    this.nativeRequestId = 0;
+    this.nativeHostUnavailable = false;
+    // Lets the local server pin the detected language for this browser session
+    this.sessionId = crypto.randomUUID();
+    // Give up on a local transcription after this long and cancel it on the server
+    this.localTranscribeTimeoutMs = 10 * 60 * 1000;
+    // Ask the server for whatever it has by then; the rest finishes as a job
+    this.localDeadlineMs = 2 * 60 * 1000;
+    // Local server state pushed over /events, so transcriptions skip the /ping round-trip
+    this.localServerState = null;
+    this.localServerEvents = null;
+    this.localServerRetryMs = 3000;
+    // Last /ping answer and its ETag, for conditional pings when the stream is down
+    this.localPing = null;
     this.initializeExtension();
   }
 
@@ -224,7 +240,13 @@ class ClinoteBackground {
   }
 
   async processLocally(transcript, specialty) {
-    // Simplified local processing (would integrate with local models in production)
+    // Prefer the local server's lexicon-based extractor when it is available
+    try {
+      return await this.callLocalSummarizeAPI(transcript, specialty);
+    } catch (error) {
+      console.log('Local summarizer unavailable, using basic extraction:', error.message);
+    }
+
     const template = this.getSpecialtyTemplate(specialty);
     
     return {
@@ -523,41 +545,188 @@ class ClinoteBackground {
     }
   }
 
+  connectNativeHost() {
+    // Native messaging avoids TCP, CORS and the pre-flight ping to localhost
+    const port = chrome.runtime.connectNative('com.clinote.whisper');
+
+    port.onMessage.addListener((message) => {
+      const pending = this.nativeRequests.get(message.id);
+      if (!pending) {
+        return;
+      }
+      this.nativeRequests.delete(message.id);
+      if (message.type === 'error') {
+        const error = new Error(`Local Whisper host error: ${message.status} - ${message.error}`);
+        error.fromHost = true;
+        pending.reject(error);
+      } else {
+        pending.resolve(message);
+      }
+    });
+
+    port.onDisconnect.addListener(() => {
+      const reason = chrome.runtime.lastError?.message || 'Native Whisper host disconnected';
+      console.log('Native Whisper host disconnected:', reason);
+      if (reason.includes('not found') || reason.includes('forbidden')) {
+        this.nativeHostUnavailable = true;
+      }
+      for (const pending of this.nativeRequests.values()) {
+        pending.reject(new Error(reason));
+      }
+      this.nativeRequests.clear();
+      this.nativePort = null;
+    });
+
+    return port;
+  }
+
+  sendNativeMessage(message) {
+    return new Promise((resolve, reject) => {
+      if (!this.nativePort) {
+        this.nativePort = this.connectNativeHost();
+      }
+      const id = ++this.nativeRequestId;
+      this.nativeRequests.set(id, { resolve, reject });
+      this.nativePort.postMessage({ ...message, id: id });
+    });
+  }
+
+  // W3C trace context so server spans join this request's trace. The sampled
+  // flag is left off; the server decides whether to record it.
+  makeTraceparent() {
+    const hex = (bytes) => Array.from(crypto.getRandomValues(new Uint8Array(bytes)),
+      (b) => b.toString(16).padStart(2, '0')).join('');
+    return `00-${hex(16)}-${hex(8)}-00`;
+  }
+
+  async callNativeWhisperHost(audioBase64, originalAudioType, traceparent, requestId) {
+    let timer;
+    const timeout = new Promise((_, reject) => {
+      timer = setTimeout(() => {
+        // Stop the host decoding audio nobody will read
+        this.nativePort?.postMessage({ type: 'cancel', requestId: requestId });
+        const error = new Error('Local transcription timed out');
+        error.fromHost = true;
+        reject(error);
+      }, this.localTranscribeTimeoutMs);
+    });
+    try {
+      return await Promise.race([
+        this.sendNativeMessage({
+          type: 'transcribe',
+          requestId: requestId,
+          audioBase64: audioBase64,
+          audioType: originalAudioType,
+          sessionId: this.sessionId,
+          deadlineMs: this.localDeadlineMs,
+          traceparent: traceparent
+        }),
+        timeout
+      ]);
+    } finally {
+      clearTimeout(timer);
+    }
+  }
+
+  async callLocalSummarizeAPI(transcript, specialty) {
+    if (!this.nativeHostUnavailable) {
+      try {
+        const { type, id, ...summary } = await this.sendNativeMessage({
+          type: 'summarize',
+          transcript: transcript,
+          specialty: specialty
+        });
+        return summary;
+      } catch (error) {
+        if (error.fromHost) {
+          throw error;
+        }
+      }
+    }
+
+    const response = await fetch('http://localhost:11434/summarize', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ transcript: transcript, specialty: specialty })
+    });
+
+    if (!response.ok) {
+      throw new Error(`Local summarize API error: ${response.status}`);
+    }
+
+    return response.json();
+  }
+
   async callLocalWhisperAPI(audioBase64, originalAudioType) {
+    const traceparent = this.makeTraceparent();
+    const traceId = traceparent.split('-')[1];
+    const started = performance.now();
+    // Names this transcription so it can be cancelled on the server
+    const requestId = crypto.randomUUID();
+
+    if (!this.nativeHostUnavailable) {
+      try {
+        console.log('Calling native Whisper host...');
+        const data = await this.callNativeWhisperHost(audioBase64, originalAudioType, traceparent, requestId);
+        console.log(`Native Whisper host responded in ${Math.round(performance.now() - started)}ms (trace ${traceId})`);
+        console.log('Native Whisper host response data:', data);
+        return await this.completePartialTranscript(data, started,
+          (jobId) => this.sendNativeMessage({ type: 'job', jobId: jobId }));
+      } catch (error) {
+        if (error.fromHost) {
+          throw error;
+        }
+        console.log('Native Whisper host unavailable, falling back to HTTP server:', error.message);
+      }
+    }
+
     try {
       console.log('Calling local Whisper server...');
       
       // First check if local server is running
-      const pingResponse = await fetch('http://localhost:11434/ping', {
-        method: 'GET',
-        headers: {
-          'Content-Type': 'application/json'
-        }
-      });
-      
-      if (!pingResponse.ok) {
+      const pingData = await this.getLocalServerState();
+      if (!pingData) {
         throw new Error('Local Whisper server is not running. Please install and start Clinote Whisper Server.');
       }
       
-      const pingData = await pingResponse.json();
-      console.log('Local server ping response:', pingData);
-      
-      if (!pingData.model_loaded) {
+      // An idle-unloaded model reloads on the next request
+      if (!pingData.model_loaded && pingData.model_state !== 'unloaded') {
         throw new Error('Local Whisper server model is not loaded. Please restart the server.');
       }
       
-      // Send transcription request to local server
-      const response = await fetch('http://localhost:11434/transcribe', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-          audioBase64: audioBase64,
-          audioType: originalAudioType
-        })
-      });
+      // Send transcription request to local server; aborting the fetch
+      // closes the connection, which the server notices and stops decoding
+      const controller = new AbortController();
+      const timer = setTimeout(() => {
+        controller.abort();
+        // Also cancel explicitly, in case a proxy keeps the server's connection open
+        fetch(`http://localhost:11434/requests/${requestId}`, { method: 'DELETE' }).catch(() => {});
+      }, this.localTranscribeTimeoutMs);
+      let response;
+      try {
+        response = await fetch('http://localhost:11434/transcribe', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'traceparent': traceparent,
+            'X-Request-Id': requestId
+          },
+          body: JSON.stringify({
+            requestId: requestId,
+            audioBase64: audioBase64,
+            audioType: originalAudioType,
+            sessionId: this.sessionId,
+            deadlineMs: this.localDeadlineMs
+          }),
+          signal: controller.signal
+        });
+      } finally {
+        clearTimeout(timer);
+      }
       
+      console.log(`Local Whisper API responded in ${Math.round(performance.now() - started)}ms (trace ${traceId})`);
       console.log('Local Whisper API response status:', response.status);
       
       if (!response.ok) {
@@ -569,13 +738,129 @@ class ClinoteBackground {
       const data = await response.json();
       console.log('Local Whisper API response data:', data);
       
-      return data.transcript;
+      return await this.completePartialTranscript(data, started, async (jobId) => {
+        const jobResponse = await fetch(`http://localhost:11434/jobs/${jobId}`);
+        return jobResponse.json();
+      });
     } catch (error) {
       console.error('Local Whisper API call failed:', error);
       throw error;
     }
   }
 
+  // The local server's readiness: from the /events stream while it is
+  // connected, otherwise from a conditional /ping that is usually a 304.
+  async getLocalServerState() {
+    this.watchLocalServer();
+    if (this.localServerState) {
+      return this.localServerState;
+    }
+    try {
+      const headers = this.localPing ? { 'If-None-Match': this.localPing.etag } : {};
+      const response = await fetch('http://localhost:11434/ping', { method: 'GET', headers: headers });
+      if (response.status === 304) {
+        return this.localPing.data;
+      }
+      if (!response.ok) {
+        return null;
+      }
+      const data = await response.json();
+      console.log('Local server ping response:', data);
+      const etag = response.headers.get('ETag');
+      this.localPing = etag ? { etag: etag, data: data } : null;
+      return data;
+    } catch (error) {
+      return null;
+    }
+  }
+
+  // Hold one /events connection to the local server. Service workers have no
+  // EventSource, so the stream is read from fetch; it reconnects with backoff.
+  async watchLocalServer() {
+    if (this.localServerEvents) {
+      return;
+    }
+    const controller = new AbortController();
+    this.localServerEvents = controller;
+    try {
+      const response = await fetch('http://localhost:11434/events', { signal: controller.signal });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      this.localServerRetryMs = 3000;
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffer += value;
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+          this.handleLocalServerEvent(buffer.slice(0, end));
+          buffer = buffer.slice(end + 2);
+        }
+      }
+    } catch (error) {
+      this.localServerRetryMs = Math.min(this.localServerRetryMs * 2, 60000);
+    } finally {
+      this.localServerState = null;
+      this.localServerEvents = null;
+    }
+    setTimeout(() => this.watchLocalServer(), this.localServerRetryMs);
+  }
+
+  handleLocalServerEvent(block) {
+    let event = 'message';
+    let data = '';
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event:')) {
+        event = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        data += line.slice(5).trim();
+      }
+    }
+    if (!data) {
+      return;
+    }
+    const payload = JSON.parse(data);
+    if (event === 'state') {
+      this.localServerState = payload;
+    } else if (event === 'shutdown') {
+      this.localServerState = null;
+    } else if (event === 'overload') {
+      console.warn('Local Whisper server is overloaded:', payload.error);
+    }
+  }
+
+  // A result cut short by its deadline covers the start of the recording; the
+  // server finishes the rest as a job. Wait for it while there is time left,
+  // otherwise keep the partial transcript rather than losing everything.
+  async completePartialTranscript(data, started, fetchJob) {
+    if (!data.partial || !data.job) {
+      return data.transcript;
+    }
+    console.log(`Partial transcript covers ${data.covered.end}s of ${data.duration}s; waiting for job ${data.job.id}`);
+    while (performance.now() - started < this.localTranscribeTimeoutMs) {
+      await new Promise(resolve => setTimeout(resolve, 5000));
+      try {
+        const job = await fetchJob(data.job.id);
+        if (job.status === 'done') {
+          return job.result.transcript;
+        }
+        if (job.status === 'failed' || job.error) {
+          console.error('Background transcription failed:', job.error);
+          break;
+        }
+      } catch (error) {
+        console.error('Could not fetch background transcription:', error);
+        break;
+      }
+    }
+    return data.transcript;
+  }
+
   async callOpenAIWhisperAPI(audioBase64, apiKey, originalAudioType) {
     console.log('Calling OpenAI Whisper API...');
     console.log('API Key present:', !!apiKey);
@@ -415,8 +415,16 @@ class ClinotePopup {
   }
 
   async checkServerStatus() {
-    const statusIndicator = document.getElementById('status-indicator');
-    const statusText = document.getElementById('status-text');
+    // While the popup is open, follow the server's state as it changes
+    if (!this.serverEvents && typeof EventSource !== 'undefined') {
+      this.serverEvents = new EventSource('http://localhost:11434/events');
+      this.serverEvents.addEventListener('state', (event) => {
+        this.renderServerStatus(JSON.parse(event.data));
+      });
+      this.serverEvents.addEventListener('shutdown', () => this.renderServerStatus(null));
+      this.serverEvents.onerror = () => this.renderServerStatus(null);
+      return;
+    }
     
     try {
       const response = await fetch('http://localhost:11434/ping', {
@@ -425,23 +433,28 @@ class ClinotePopup {
           'Content-Type': 'application/json'
         }
       });
-      
-      if (response.ok) {
-        const data = await response.json();
-        if (data.model_loaded) {
-          statusIndicator.className = 'status-indicator online';
-          statusText.textContent = 'Whisper Server: Online';
-        } else {
-          statusIndicator.className = 'status-indicator offline';
-          statusText.textContent = 'Whisper Server: Model Loading';
-        }
-      } else {
-        statusIndicator.className = 'status-indicator offline';
-        statusText.textContent = 'Whisper Server: Offline';
-      }
+      this.renderServerStatus(response.ok ? await response.json() : null);
     } catch (error) {
+      this.renderServerStatus(null);
+    }
+  }
+
+  renderServerStatus(data) {
+    const statusIndicator = document.getElementById('status-indicator');
+    const statusText = document.getElementById('status-text');
+    
+    if (!data) {
       statusIndicator.className = 'status-indicator offline';
       statusText.textContent = 'Whisper Server: Offline';
+    } else if (data.model_loaded) {
+      statusIndicator.className = 'status-indicator online';
+      statusText.textContent = 'Whisper Server: Online';
+    } else if (data.model_state === 'unloaded') {
+      statusIndicator.className = 'status-indicator online';
+      statusText.textContent = 'Whisper Server: Online (idle)';
+    } else {
+      statusIndicator.className = 'status-indicator offline';
+      statusText.textContent = 'Whisper Server: Model Loading';
     }
   }
 
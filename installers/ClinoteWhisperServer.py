@@ -6,11 +6,41 @@ A simple wrapper for the Whisper server
 
 import os
 import sys
+import json
+import signal
+import socket
+import struct
+import argparse
 import subprocess
 import threading
 import time
 import requests
 
+# Public port the extension talks to
+SERVER_PORT = 11434
+
+# Supervisor health checks against each worker's loopback side port
+HEALTH_CHECK_INTERVAL = 5
+HEALTH_CHECK_TIMEOUT = 5
+# Consecutive failed checks before a running worker is considered hung
+MAX_FAILED_HEALTH_CHECKS = 3
+# Allow for a first-run model download before giving up on a new worker
+STARTUP_TIMEOUT = 600
+# How long a replaced worker may spend finishing in-flight requests
+DRAIN_TIMEOUT = 120
+# Crash restart backoff, reset once a worker has stayed up this long
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 60
+STABLE_UPTIME = 300
+
+# Chrome native-messaging host registration
+NATIVE_HOST_NAME = "com.clinote.whisper"
+NATIVE_HOST_DESCRIPTION = "Clinote local Whisper transcription"
+# Chrome rejects messages from a native host larger than 1 MB
+NATIVE_MAX_MESSAGE_BYTES = 1024 * 1024
+# How long a forwarded native message may wait on the running server
+NATIVE_FORWARD_TIMEOUT = 600
+
 def log(message):
     """Print log message"""
     print(f"[{time.strftime('%H:%M:%S')}] {message}")
@@ -27,27 +57,42 @@ def check_python():
         log(f"❌ Python not found: {e}")
         return False
 
+def get_resources_dir():
+    """Return the directory that holds the bundled server files"""
+    if getattr(sys, 'frozen', False):
+        # Running as compiled app
+        app_dir = os.path.dirname(sys.executable)
+        # Go up to Contents/Resources
+        resources_dir = os.path.join(app_dir, "..", "Resources")
+        log(f"📁 App directory: {app_dir}")
+    else:
+        # Running as script
+        resources_dir = os.path.join(os.path.dirname(__file__), "local-server")
+        log(f"📁 Script directory: {os.path.dirname(__file__)}")
+    log(f"📁 Resources directory: {resources_dir}")
+    return resources_dir
+
+def find_whisper_script(resources_dir):
+    """Locate whisper_server.py in the app bundle or source checkout"""
+    candidates = [
+        os.path.join(resources_dir, "whisper_server.py"),
+        os.path.join(resources_dir, "local-server", "whisper_server.py"),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "local-server", "whisper_server.py"),
+    ]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return os.path.abspath(candidate)
+    return candidates[0]
+
 def start_server():
     """Start the Whisper server"""
     log("🎙️ Starting Clinote Whisper Server...")
     
     try:
-        # Get the directory where the app is located
-        if getattr(sys, 'frozen', False):
-            # Running as compiled app
-            app_dir = os.path.dirname(sys.executable)
-            # Go up to Contents/Resources
-            resources_dir = os.path.join(app_dir, "..", "Resources")
-            log(f"📁 App directory: {app_dir}")
-            log(f"📁 Resources directory: {resources_dir}")
-        else:
-            # Running as script
-            resources_dir = os.path.join(os.path.dirname(__file__), "local-server")
-            log(f"📁 Script directory: {os.path.dirname(__file__)}")
-            log(f"📁 Resources directory: {resources_dir}")
+        resources_dir = get_resources_dir()
         
         # Find whisper_server.py
-        whisper_script = os.path.join(resources_dir, "whisper_server.py")
+        whisper_script = find_whisper_script(resources_dir)
         log(f"🔍 Looking for whisper_server.py at: {whisper_script}")
         
         if not os.path.exists(whisper_script):
@@ -89,26 +134,9 @@ def start_server():
         log("⏹️  Press Ctrl+C to stop the server")
         log("")
         
-        # Run the server with full output
-        log("🔄 Executing server command...")
-        process = subprocess.Popen([python_cmd, whisper_script], 
-                                  cwd=os.path.dirname(whisper_script),
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.STDOUT,
-                                  text=True,
-                                  bufsize=1,
-                                  universal_newlines=True)
-        
-        log(f"✅ Server process started with PID: {process.pid}")
-        
-        # Monitor the output
-        for line in process.stdout:
-            print(line.strip())
-            sys.stdout.flush()
-        
-        # Wait for the process to complete
-        return_code = process.wait()
-        log(f"⏹️  Server process ended with return code: {return_code}")
+        # Run the server under the supervisor
+        log("🔄 Starting server supervisor...")
+        Supervisor(python_cmd, whisper_script).run()
         
     except KeyboardInterrupt:
         log("⏹️ Server stopped by user")
@@ -121,8 +149,566 @@ def start_server():
     
     return True
 
+def find_free_port():
+    """Ask the OS for an unused loopback port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Worker:
+    """One whisper_server.py process and its health-check state"""
+    
+    def __init__(self, process, health_port):
+        self.process = process
+        self.health_port = health_port
+        self.started_at = time.monotonic()
+        self.failed_checks = 0
+    
+    @property
+    def pid(self):
+        return self.process.pid
+    
+    def alive(self):
+        return self.process.poll() is None
+    
+    def ping(self):
+        """Return the worker's /ping body, or None if it did not answer"""
+        try:
+            response = requests.get(f"http://127.0.0.1:{self.health_port}/ping",
+                                    timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError):
+            return None
+
+class Supervisor:
+    """Keep a healthy Whisper server running on SERVER_PORT.
+    
+    The supervisor owns the listening socket and hands it to each worker,
+    so a replacement worker can load and warm its model while the old one
+    keeps serving, then take over without the port ever closing. Workers
+    are watched through /ping on a private loopback port, restarted with
+    backoff when they crash or hang, and replaced blue/green on SIGHUP or
+    when the server sources change on disk.
+    """
+    
+    def __init__(self, python_cmd, whisper_script):
+        self.python_cmd = python_cmd
+        self.whisper_script = whisper_script
+        self.server_dir = os.path.dirname(whisper_script)
+        self.listener = None
+        self.active = None
+        self.retiring = []
+        self.backoff = RESTART_BACKOFF_MIN
+        self.reload_requested = threading.Event()
+        self.stopping = threading.Event()
+        self.sources_mtime = self.get_sources_mtime()
+    
+    def open_listener(self):
+        """Bind the public port once; workers accept on the inherited socket"""
+        if os.name == "nt":
+            # No fd inheritance for sockets here, so workers bind the port themselves
+            log("⚠️  Socket handover is not supported on Windows, restarts will briefly drop the port")
+            return None
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("0.0.0.0", SERVER_PORT))
+        listener.listen(128)
+        listener.set_inheritable(True)
+        return listener
+    
+    def get_sources_mtime(self):
+        """Newest modification time of the server's Python sources"""
+        mtimes = [0]
+        for name in os.listdir(self.server_dir):
+            if name.endswith(".py"):
+                try:
+                    mtimes.append(os.path.getmtime(os.path.join(self.server_dir, name)))
+                except OSError:
+                    pass
+        return max(mtimes)
+    
+    def spawn(self):
+        """Start a worker process and forward its output"""
+        health_port = find_free_port()
+        command = [self.python_cmd, self.whisper_script, "--health-port", str(health_port)]
+        pass_fds = ()
+        if self.listener is not None:
+            command += ["--listen-fd", str(self.listener.fileno())]
+            pass_fds = (self.listener.fileno(),)
+        else:
+            command += ["--port", str(SERVER_PORT)]
+        
+        process = subprocess.Popen(command,
+                                   cwd=self.server_dir,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   text=True,
+                                   bufsize=1,
+                                   universal_newlines=True,
+                                   pass_fds=pass_fds)
+        worker = Worker(process, health_port)
+        threading.Thread(target=self.pump_output, args=(worker,), daemon=True).start()
+        log(f"✅ Server process started with PID: {worker.pid}")
+        return worker
+    
+    def pump_output(self, worker):
+        for line in worker.process.stdout:
+            print(f"[{worker.pid}] {line.rstrip()}")
+            sys.stdout.flush()
+    
+    def wait_ready(self, worker):
+        """Wait until the worker reports its models loaded and warmed"""
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline and not self.stopping.is_set():
+            if not worker.alive():
+                log(f"❌ Server process {worker.pid} exited during startup with code {worker.process.returncode}")
+                return False
+            status = worker.ping()
+            if status and status.get("ready"):
+                log(f"✅ Server process {worker.pid} is ready")
+                return True
+            time.sleep(1)
+        if not self.stopping.is_set():
+            log(f"❌ Server process {worker.pid} did not become ready in {STARTUP_TIMEOUT}s")
+        self.kill(worker)
+        return False
+    
+    def retire(self, worker):
+        """Ask a worker to drain and exit, killing it if it takes too long"""
+        if worker is None or not worker.alive():
+            return
+        self.retiring.append(worker)
+        
+        def drain():
+            log(f"⏳ Draining server process {worker.pid}")
+            worker.process.terminate()
+            try:
+                worker.process.wait(DRAIN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                log(f"⚠️  Server process {worker.pid} did not drain in {DRAIN_TIMEOUT}s, killing it")
+                self.kill(worker)
+            self.retiring.remove(worker)
+        
+        threading.Thread(target=drain, daemon=True).start()
+    
+    def kill(self, worker):
+        if worker.alive():
+            worker.process.kill()
+        worker.process.wait()
+    
+    def start_worker(self):
+        """Spawn workers with backoff until one becomes ready"""
+        while not self.stopping.is_set():
+            worker = self.spawn()
+            if self.wait_ready(worker):
+                return worker
+            self.wait_backoff()
+        return None
+    
+    def wait_backoff(self):
+        log(f"🔁 Restarting server in {self.backoff}s")
+        self.stopping.wait(self.backoff)
+        self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+    
+    def restart(self, reason):
+        """Replace the active worker after a crash or hang"""
+        log(f"⚠️  {reason}")
+        old = self.active
+        self.active = None
+        if old.alive():
+            self.kill(old)
+        if time.monotonic() - old.started_at >= STABLE_UPTIME:
+            self.backoff = RESTART_BACKOFF_MIN
+        self.wait_backoff()
+        self.active = self.start_worker()
+    
+    def blue_green(self):
+        """Bring up a new worker beside the old one, then hand over and drain"""
+        if self.listener is None:
+            # Both workers cannot hold the port, so this is a plain restart
+            log("🔄 Restarting server to load changes")
+            self.retire(self.active)
+            while self.retiring and not self.stopping.is_set():
+                time.sleep(0.5)
+            self.active = self.start_worker()
+            return
+        
+        log("🔄 Starting replacement server")
+        new = self.spawn()
+        if not self.wait_ready(new):
+            log("⚠️  Replacement server failed, keeping the current one")
+            return
+        old = self.active
+        self.active = new
+        self.retire(old)
+        log(f"✅ Server process {new.pid} took over from {old.pid}")
+    
+    def check_active(self):
+        """Health-check the active worker and restart it if needed"""
+        worker = self.active
+        if not worker.alive():
+            self.restart(f"Server process {worker.pid} exited with code {worker.process.returncode}")
+            return
+        if worker.ping() is None:
+            worker.failed_checks += 1
+            log(f"⚠️  Health check {worker.failed_checks}/{MAX_FAILED_HEALTH_CHECKS} failed for {worker.pid}")
+            if worker.failed_checks >= MAX_FAILED_HEALTH_CHECKS:
+                self.restart(f"Server process {worker.pid} is not responding")
+            return
+        worker.failed_checks = 0
+        if time.monotonic() - worker.started_at >= STABLE_UPTIME:
+            self.backoff = RESTART_BACKOFF_MIN
+    
+    def handle_signal(self, signum, frame):
+        if hasattr(signal, "SIGHUP") and signum == signal.SIGHUP:
+            self.reload_requested.set()
+        else:
+            self.stopping.set()
+            self.reload_requested.set()
+    
+    def run(self):
+        """Supervise workers until interrupted"""
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.handle_signal)
+        
+        try:
+            self.listener = self.open_listener()
+            self.active = self.start_worker()
+            while not self.stopping.is_set() and self.active is not None:
+                self.reload_requested.wait(HEALTH_CHECK_INTERVAL)
+                if self.stopping.is_set():
+                    break
+                
+                sources_mtime = self.get_sources_mtime()
+                if sources_mtime != self.sources_mtime:
+                    self.sources_mtime = sources_mtime
+                    log("📝 Server sources changed")
+                    self.reload_requested.set()
+                
+                if self.reload_requested.is_set():
+                    self.reload_requested.clear()
+                    self.blue_green()
+                else:
+                    self.check_active()
+        except KeyboardInterrupt:
+            log("⏹️ Server stopped by user")
+        finally:
+            self.shutdown()
+    
+    def shutdown(self):
+        """Stop every worker and release the port"""
+        self.stopping.set()
+        for worker in [self.active] + list(self.retiring):
+            if worker is not None and worker.alive():
+                worker.process.terminate()
+        for worker in [self.active] + list(self.retiring):
+            if worker is None:
+                continue
+            try:
+                worker.process.wait(DRAIN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.kill(worker)
+            log(f"⏹️  Server process {worker.pid} ended with return code: {worker.process.returncode}")
+        if self.listener is not None:
+            self.listener.close()
+
+def get_native_host_dirs():
+    """Return the per-user NativeMessagingHosts directories for Chrome and Chromium"""
+    home = os.path.expanduser("~")
+    if sys.platform == "darwin":
+        support = os.path.join(home, "Library", "Application Support")
+        return [
+            os.path.join(support, "Google", "Chrome", "NativeMessagingHosts"),
+            os.path.join(support, "Chromium", "NativeMessagingHosts"),
+        ]
+    if sys.platform.startswith("win"):
+        # Windows locates the manifest through the registry instead
+        return [os.path.join(os.environ.get("LOCALAPPDATA", home), "Clinote", "NativeMessagingHosts")]
+    return [
+        os.path.join(home, ".config", "google-chrome", "NativeMessagingHosts"),
+        os.path.join(home, ".config", "chromium", "NativeMessagingHosts"),
+    ]
+
+def write_native_host_launcher(host_dir):
+    """Write the executable Chrome starts; manifests cannot pass arguments"""
+    if getattr(sys, 'frozen', False):
+        # py2app exposes the app's main executable here
+        command = [os.environ.get("EXECUTABLEPATH", sys.executable)]
+    else:
+        command = [sys.executable, os.path.abspath(__file__)]
+    
+    if sys.platform.startswith("win"):
+        launcher = os.path.join(host_dir, "clinote-native-host.bat")
+        quoted = " ".join(f'"{part}"' for part in command)
+        with open(launcher, "w") as f:
+            f.write(f"@echo off\n{quoted} --native-messaging %*\n")
+    else:
+        launcher = os.path.join(host_dir, "clinote-native-host")
+        quoted = " ".join("'" + part.replace("'", "'\\''") + "'" for part in command)
+        with open(launcher, "w") as f:
+            f.write(f"#!/bin/sh\nexec {quoted} --native-messaging \"$@\"\n")
+        os.chmod(launcher, 0o755)
+    return launcher
+
+def register_native_host(extension_ids):
+    """Register this launcher as a Chrome native-messaging host"""
+    if not extension_ids:
+        log("❌ Pass the Clinote extension ID (see chrome://extensions) to register")
+        return False
+    
+    for host_dir in get_native_host_dirs():
+        os.makedirs(host_dir, exist_ok=True)
+        manifest = {
+            "name": NATIVE_HOST_NAME,
+            "description": NATIVE_HOST_DESCRIPTION,
+            "path": write_native_host_launcher(host_dir),
+            "type": "stdio",
+            "allowed_origins": [f"chrome-extension://{ext_id}/" for ext_id in extension_ids],
+        }
+        manifest_path = os.path.join(host_dir, f"{NATIVE_HOST_NAME}.json")
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        log(f"✅ Native host manifest written to: {manifest_path}")
+        
+        if sys.platform.startswith("win"):
+            import winreg
+            key_path = f"Software\\Google\\Chrome\\NativeMessagingHosts\\{NATIVE_HOST_NAME}"
+            with winreg.CreateKey(winreg.HKEY_CURRENT_USER, key_path) as key:
+                winreg.SetValueEx(key, "", 0, winreg.REG_SZ, manifest_path)
+            log(f"✅ Registered in HKEY_CURRENT_USER\\{key_path}")
+    return True
+
+def unregister_native_host():
+    """Remove native-messaging host manifests written by register_native_host()"""
+    for host_dir in get_native_host_dirs():
+        for name in (f"{NATIVE_HOST_NAME}.json", "clinote-native-host", "clinote-native-host.bat"):
+            path = os.path.join(host_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+                log(f"🗑️  Removed: {path}")
+    if sys.platform.startswith("win"):
+        import winreg
+        try:
+            winreg.DeleteKey(winreg.HKEY_CURRENT_USER,
+                             f"Software\\Google\\Chrome\\NativeMessagingHosts\\{NATIVE_HOST_NAME}")
+        except OSError:
+            pass
+    return True
+
+def read_native_message(stream):
+    """Read one length-prefixed frame from Chrome, or None at end of input
+    
+    Raises ValueError for a frame that is not a JSON object; the frame has
+    been consumed, so the caller can reply and keep reading.
+    """
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack("=I", header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    try:
+        message = json.loads(payload)
+    except ValueError as e:
+        raise ValueError(f"Malformed native message: {e}")
+    if not isinstance(message, dict):
+        raise ValueError("Malformed native message: expected a JSON object")
+    return message
+
+def write_native_message(stream, message):
+    """Write one length-prefixed frame to Chrome"""
+    payload = json.dumps(message).encode("utf-8")
+    if len(payload) > NATIVE_MAX_MESSAGE_BYTES:
+        payload = json.dumps({
+            "type": "error",
+            "id": message.get("id"),
+            "status": 413,
+            "error": "Response exceeds the 1 MB native-messaging limit"
+        }).encode("utf-8")
+    stream.write(struct.pack("=I", len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+def handle_native_message(whisper_server, message):
+    """Dispatch one native message to the in-process inference core"""
+    message_type = message.get("type")
+    message_id = message.get("id")
+    
+    if message_type == "ping":
+        return {
+            "type": "pong",
+            "id": message_id,
+            "model_loaded": whisper_server.whisper_model is not None,
+            "model_state": whisper_server.model_state,
+            "service": "clinote-whisper-server"
+        }
+    
+    if message_type == "transcribe":
+        span = whisper_server.tracer.start_trace("native transcribe", message.get("traceparent"))
+        error = None
+        try:
+            body, status = whisper_server.transcribe_payload(message)
+        except Exception as e:
+            error = e
+            body, status = {"error": f"Transcription failed: {str(e)}"}, 500
+        finally:
+            whisper_server.tracer.finish_trace(span, error)
+        if status != 200:
+            return {"type": "error", "id": message_id, "status": status, **body}
+        return {"type": "result", "id": message_id, **body}
+    
+    if message_type == "cancel":
+        cancelled = whisper_server.active_requests.cancel(str(message.get("requestId")))
+        return {"type": "cancelled", "id": message_id, "requestId": message.get("requestId"),
+                "cancelling": cancelled}
+    
+    if message_type == "job":
+        body, status = whisper_server.job_payload(str(message.get("jobId")))
+        if status != 200:
+            return {"type": "error", "id": message_id, "status": status, **body}
+        return {"type": "job", "id": message_id, **body}
+    
+    handlers = {
+        "summarize": whisper_server.summarize_payload,
+        "suggest_codes": whisper_server.suggest_codes_payload,
+    }
+    if message_type in handlers:
+        try:
+            body, status = handlers[message_type](message)
+        except Exception as e:
+            body, status = {"error": f"Request failed: {str(e)}"}, 500
+        if status != 200:
+            return {"type": "error", "id": message_id, "status": status, **body}
+        return {"type": "result", "id": message_id, **body}
+    
+    return {"type": "error", "id": message_id, "status": 400, "error": f"Unknown message type: {message_type}"}
+
+def forward_native_message(message):
+    """Dispatch one native message to the Whisper server already running on SERVER_PORT"""
+    message_type = message.get("type")
+    message_id = message.get("id")
+    base_url = f"http://127.0.0.1:{SERVER_PORT}"
+    body = {key: value for key, value in message.items() if key not in ("type", "id", "traceparent")}
+    headers = {"traceparent": message["traceparent"]} if message.get("traceparent") else {}
+    
+    routes = {
+        "ping": ("GET", "/ping", "pong"),
+        "transcribe": ("POST", "/transcribe", "result"),
+        "cancel": ("DELETE", f"/requests/{message.get('requestId')}", "cancelled"),
+        "job": ("GET", f"/jobs/{message.get('jobId')}", "job"),
+        "summarize": ("POST", "/summarize", "result"),
+        "suggest_codes": ("POST", "/codes/suggest", "result"),
+    }
+    if message_type not in routes:
+        return {"type": "error", "id": message_id, "status": 400, "error": f"Unknown message type: {message_type}"}
+    method, path, reply_type = routes[message_type]
+    
+    try:
+        response = requests.request(method, base_url + path, headers=headers,
+                                    json=body if method == "POST" else None,
+                                    timeout=NATIVE_FORWARD_TIMEOUT)
+        reply = response.json()
+    except (requests.RequestException, ValueError) as e:
+        return {"type": "error", "id": message_id, "status": 503, "error": f"Whisper server unavailable: {e}"}
+    
+    if message_type == "ping":
+        return {
+            "type": "pong",
+            "id": message_id,
+            "model_loaded": reply.get("model_loaded"),
+            "model_state": reply.get("model_state"),
+            "service": "clinote-whisper-server"
+        }
+    if message_type == "cancel":
+        return {"type": "cancelled", "id": message_id, "requestId": message.get("requestId"),
+                "cancelling": response.status_code == 202}
+    if response.status_code != 200:
+        return {"type": "error", "id": message_id, "status": response.status_code, **reply}
+    return {"type": reply_type, "id": message_id, **reply}
+
+def running_server_ready():
+    """True when a Whisper server (usually the supervised one) answers on SERVER_PORT with its model loaded"""
+    try:
+        response = requests.get(f"http://127.0.0.1:{SERVER_PORT}/ping", timeout=HEALTH_CHECK_TIMEOUT)
+        response.raise_for_status()
+        state = response.json()
+    except (requests.RequestException, ValueError):
+        return False
+    return state.get("service") == "clinote-whisper-server" and bool(state.get("model_loaded"))
+
+def run_native_host():
+    """Serve Chrome native messages over stdin/stdout until Chrome disconnects"""
+    # stdout carries the binary protocol, so everything else goes to stderr
+    channel_in = sys.stdin.buffer
+    channel_out = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    
+    log("🔌 Starting Clinote native-messaging host...")
+    whisper_server = None
+    if running_server_ready():
+        # The supervised server already has a warm model; loading a second copy
+        # here would cost a cold start and double the memory
+        log(f"🔁 Forwarding native messages to the server on port {SERVER_PORT}")
+        dispatch = forward_native_message
+    else:
+        whisper_script = find_whisper_script(get_resources_dir())
+        sys.path.insert(0, os.path.dirname(whisper_script))
+        import whisper_server
+        
+        if not whisper_server.load_model():
+            write_native_message(channel_out, {"type": "error", "status": 503, "error": "Whisper model not loaded"})
+            return False
+        dispatch = lambda message: handle_native_message(whisper_server, message)
+    
+    # Each message gets its own thread, so a cancel is read while its transcription runs
+    write_lock = threading.Lock()
+    
+    def handle(message):
+        reply = dispatch(message)
+        with write_lock:
+            write_native_message(channel_out, reply)
+    
+    while True:
+        try:
+            message = read_native_message(channel_in)
+        except ValueError as e:
+            with write_lock:
+                write_native_message(channel_out, {"type": "error", "status": 400, "error": str(e)})
+            continue
+        if message is None:
+            log("⏹️  Chrome closed the native-messaging port")
+            # Nobody is left to read the results; a forwarded request is
+            # left to the server, which keeps its result as a job
+            if whisper_server is not None:
+                whisper_server.active_requests.cancel_all("Chrome disconnected")
+            return True
+        threading.Thread(target=handle, args=(message,), daemon=True).start()
+
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="Clinote Whisper Server launcher")
+    parser.add_argument("--native-messaging", action="store_true",
+                        help="Run as a Chrome native-messaging host on stdin/stdout")
+    parser.add_argument("--register-native-host", nargs="*", metavar="EXTENSION_ID",
+                        help="Register the native-messaging host for the given extension IDs")
+    parser.add_argument("--unregister-native-host", action="store_true",
+                        help="Remove the native-messaging host registration")
+    # Chrome passes the caller origin (and on Windows --parent-window) as extra arguments
+    args, extra = parser.parse_known_args()
+    
+    if args.native_messaging or any(arg.startswith("chrome-extension://") for arg in extra):
+        run_native_host()
+        return
+    if args.register_native_host is not None:
+        register_native_host(args.register_native_host)
+        return
+    if args.unregister_native_host:
+        unregister_native_host()
+        return
+    
     log("🎙️ Clinote Whisper Server")
     log("================================")
     log("")
@@ -5,6 +5,14 @@ echo "Building Clinote Whisper Server macOS App..."
 # Install py2app if not already installed
 pip install py2app
 
+# Prebuild the code suggestion index bundled with the app
+python ../local-server/code_index.py build
+
+# Prefetch the Whisper models and bundle them so the app never downloads at runtime
+BUNDLED_MODELS="${BUNDLED_MODELS:-base}"
+python ../local-server/model_cache.py --cache-dir build-models prefetch $BUNDLED_MODELS
+python ../local-server/model_cache.py --cache-dir build-models pack $BUNDLED_MODELS --archive ../local-server/data/models.tar
+
 # Clean previous builds
 rm -rf build dist
 
@@ -8,7 +8,36 @@ import py2app
 
 APP = ['ClinoteWhisperServer.py']
 DATA_FILES = [
-    ('local-server', ['../local-server/whisper_server.py', '../local-server/requirements.txt']),
+    ('local-server', [
+        '../local-server/whisper_server.py',
+        '../local-server/requirements.txt',
+        '../local-server/automaton.py',
+        '../local-server/note_extractor.py',
+        '../local-server/code_index.py',
+        '../local-server/transcript_store.py',
+        '../local-server/model_cache.py',
+        '../local-server/coalescer.py',
+        '../local-server/memory_governor.py',
+        '../local-server/profiler.py',
+        '../local-server/tracing.py',
+        '../local-server/router.py',
+        '../local-server/diarization.py',
+        '../local-server/batch.py',
+        '../local-server/model_import.py',
+        '../local-server/cancellation.py',
+        '../local-server/jobs.py',
+        '../local-server/config.py',
+        '../local-server/events.py',
+        '../local-server/text_normalizer.py',
+        '../local-server/redaction.py',
+    ]),
+    # codes.idx and models.tar are prebuilt by build-app.sh; the bundled models
+    # let the app load Whisper offline without ever contacting the model hub
+    ('local-server/data', [
+        '../local-server/data/codes.tsv',
+        '../local-server/data/codes.idx',
+        '../local-server/data/models.tar',
+    ]),
     ('icons', ['../icons/icon-128.png'])
 ]
 OPTIONS = {
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Clinote multi-pattern matcher
+An Aho-Corasick automaton over word tokens, built once and shared by the
+text-processing stages of the local server.
+"""
+
+import re
+
+# Lowercase words, numbers and simple contractions ("we'll", "patient's")
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def tokenize(text):
+    """Split text into (token, start, end) tuples with character offsets."""
+    return [(m.group(), m.start(), m.end()) for m in WORD_PATTERN.finditer(text.lower())]
+
+class AhoCorasick:
+    """Aho-Corasick automaton whose alphabet is word tokens.
+
+    Patterns are added as phrases, the automaton is compiled once with
+    build(), and every occurrence of every pattern is then reported in a
+    single left-to-right pass over the tokens. Matching on whole words
+    means patterns never fire inside longer words.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, phrase, value):
+        """Add a phrase (string or token list) reporting value when matched."""
+        tokens = [token for token, _, _ in tokenize(phrase)] if isinstance(phrase, str) else list(phrase)
+        if not tokens:
+            return
+        node = 0
+        for token in tokens:
+            next_node = self._goto[node].get(token)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][token] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = next_node
+        self._out[node].append((len(tokens), value))
+        self._built = False
+
+    def build(self):
+        """Compute failure links breadth-first and merge their outputs."""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                if self._out[self._fail[child]]:
+                    self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+        return self
+
+    def iter_matches(self, tokens):
+        """Yield (start, end, value) token-index spans for every match.
+
+        tokens may be plain strings or (token, start, end) tuples as
+        returned by tokenize(). Matches are yielded in order of end index.
+        """
+        if not self._built:
+            self.build()
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        node = 0
+        for index, token in enumerate(tokens):
+            if not isinstance(token, str):
+                token = token[0]
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            if out[node]:
+                end = index + 1
+                for length, value in out[node]:
+                    yield end - length, end, value
+
+    def __len__(self):
+        return len(self._goto)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Clinote batch transcription
+Transcribes a backlog of recordings with the server's models and pipeline,
+without running the server. Files are scheduled largest first across all
+cores, finished files are recorded in a checkpoint so an interrupted run
+resumes where it stopped, and results go to one JSONL file or one JSON file
+per recording.
+
+Usage:
+    python batch.py recordings/ --output transcripts.jsonl
+    python batch.py --manifest backlog.txt --output-dir transcripts/ --speed-profile balanced
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import whisper_server
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".mp4", ".webm", ".ogg", ".opus", ".flac", ".aac", ".wma")
+# CPU threads per decoding worker; workers fill the remaining cores
+THREADS_PER_WORKER = 2
+CHECKPOINT_NAME = ".clinote-batch-checkpoint"
+
+def find_audio_files(inputs, manifest=None):
+    """Audio files under the given files/directories and in a manifest (one path per line)."""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                paths.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            paths.append(path)
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    # De-duplicate while keeping the first occurrence
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+def file_key(path):
+    """Identify a file version, so recordings changed since the checkpoint are redone."""
+    stat = os.stat(path)
+    return f"{path}|{stat.st_size}|{int(stat.st_mtime)}"
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+def output_path(output_dir, path, root):
+    """Per-file JSON path mirroring the recording's place under the common root."""
+    relative = os.path.relpath(path, root) if root else os.path.basename(path)
+    return os.path.join(output_dir, relative + ".json")
+
+def transcribe_file(path, speed_profile=None, language=None, diarize=False, store=False):
+    """Decode and transcribe one recording through the server pipeline."""
+    started = time.perf_counter()
+    audio = whisper_server.decode_audio(path, sampling_rate=whisper_server.SAMPLE_RATE)
+    timings = {"decode_ms": round((time.perf_counter() - started) * 1000, 2)}
+    result = whisper_server.transcribe_array(audio, speed_profile=speed_profile, timings=timings,
+                                             metadata={"source": path}, store=store,
+                                             language=language, diarize=diarize)
+    return dict(result, path=path)
+
+def run_batch(paths, output=None, output_dir=None, checkpoint=None, workers=1, speed_profile=None,
+              language=None, diarize=False, store=False):
+    """Transcribe paths largest first; returns (done, failed, audio seconds, wall seconds)."""
+    done_keys = load_checkpoint(checkpoint)
+    pending = []
+    for path in paths:
+        try:
+            key = file_key(path)
+        except OSError as e:
+            logger.error(f"Skipping {path}: {e}")
+            continue
+        if key not in done_keys:
+            pending.append((os.path.getsize(path), path, key))
+    # Longest jobs first, so the run does not end waiting on one big file
+    pending.sort(reverse=True)
+    skipped = len(paths) - len(pending)
+    if skipped:
+        logger.info(f"Resuming: {skipped} files already done according to {checkpoint}")
+    logger.info(f"Transcribing {len(pending)} files with {workers} workers")
+
+    # From every input, not just pending ones, so resumed runs write to the same places
+    root = os.path.commonpath(paths) if len(paths) > 1 else None
+    if root and os.path.isfile(root):
+        root = os.path.dirname(root)
+    jsonl = open(output, "a") if output else None
+    done = failed = 0
+    audio_seconds = 0.0
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    try:
+        futures = {
+            pool.submit(transcribe_file, path, speed_profile, language, diarize, store): (path, key)
+            for _, path, key in pending
+        }
+        with open(checkpoint, "a") as checkpoint_file:
+            for future in as_completed(futures):
+                path, key = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"[{done + failed}/{len(pending)}] {path}: {e}")
+                    record = {"path": path, "error": str(e)}
+                    if jsonl:
+                        jsonl.write(json.dumps(record) + "\n")
+                        jsonl.flush()
+                    continue
+
+                done += 1
+                audio_seconds += record["duration"]
+                if jsonl:
+                    jsonl.write(json.dumps(record) + "\n")
+                    jsonl.flush()
+                else:
+                    target = output_path(output_dir, path, root)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with open(target + ".tmp", "w") as f:
+                        json.dump(record, f, indent=2)
+                    os.replace(target + ".tmp", target)
+                # Only after the result is safely written
+                checkpoint_file.write(key + "\n")
+                checkpoint_file.flush()
+
+                elapsed = time.perf_counter() - started
+                logger.info(f"[{done + failed}/{len(pending)}] {os.path.basename(path)}: "
+                            f"{record['duration']:.1f}s audio in {record['timings']['total_ms'] / 1000:.1f}s "
+                            f"({audio_seconds / elapsed:.1f}x real time overall)")
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; finishing files in progress. Run the same command again to resume.")
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        if jsonl:
+            jsonl.close()
+    return done, failed, audio_seconds, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe directories of recordings with the Clinote pipeline")
+    parser.add_argument("inputs", nargs="*", help="Audio files or directories to scan")
+    parser.add_argument("--manifest", help="Text file listing one recording per line")
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument("--output", metavar="FILE", help="Append one JSON line per recording")
+    destination.add_argument("--output-dir", metavar="DIR", help="Write one JSON file per recording")
+    parser.add_argument("--checkpoint", metavar="PATH",
+                        help="Finished-file log used to resume (default: next to the output)")
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", type=int, default=max(1, cores // THREADS_PER_WORKER),
+                        help="Recordings transcribed at once")
+    parser.add_argument("--cpu-threads", type=int, default=0,
+                        help="CPU threads per worker (default: cores divided among the workers)")
+    parser.add_argument("--model", default=whisper_server.DEFAULT_MODEL, help="Whisper model size")
+    parser.add_argument("--speed-profile", choices=whisper_server.SPEED_PROFILES,
+                        help="Decoding tier (default: accurate)")
+    parser.add_argument("--language", help="Skip language detection and use this language code")
+    parser.add_argument("--diarize", action="store_true", help="Label segments by speaker")
+    parser.add_argument("--model-cache", metavar="DIR", default=whisper_server.MODEL_CACHE_DIR,
+                        help="Load models only from this offline cache (see model_cache.py)")
+    parser.add_argument("--model-archive", metavar="PATH", default=whisper_server.MODEL_ARCHIVE,
+                        help="Extract models missing from the cache out of this archive")
+    parser.add_argument("--store", metavar="PATH", help="Also save transcripts to this transcript store")
+    args = parser.parse_args()
+
+    paths = find_audio_files(args.inputs, args.manifest)
+    if not paths:
+        parser.error("no audio files found")
+    language, _, error = whisper_server.parse_language_request({"language": args.language})
+    if error:
+        parser.error(error)
+    checkpoint = args.checkpoint or (args.output + ".checkpoint" if args.output
+                                     else os.path.join(args.output_dir, CHECKPOINT_NAME))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # One model copy shared by all workers, as in the server
+    workers = max(1, args.workers)
+    whisper_server.DEFAULT_MODEL = args.model
+    whisper_server.NUM_WORKERS = workers
+    whisper_server.CPU_THREADS = args.cpu_threads or max(1, cores // workers)
+    whisper_server.MODEL_CACHE_DIR = args.model_cache
+    whisper_server.MODEL_ARCHIVE = args.model_archive
+    whisper_server.TRANSCRIPT_STORE_PATH = args.store
+    if not whisper_server.load_model():
+        return 1
+    whisper_server.open_transcript_store()
+
+    try:
+        done, failed, audio_seconds, wall_seconds = run_batch(
+            paths, args.output, args.output_dir, checkpoint, workers, args.speed_profile,
+            language, args.diarize, store=bool(args.store)
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if whisper_server.transcript_store is not None:
+            whisper_server.transcript_store.close()
+
+    audio_hours = audio_seconds / 3600
+    print(f"✅ {done} transcribed, {failed} failed: {audio_hours:.2f} audio hours in {wall_seconds / 3600:.2f} hours "
+          f"({audio_seconds / max(wall_seconds, 1e-9):.1f} audio-hours per hour)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
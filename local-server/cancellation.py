@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Clinote request cancellation
+Cooperative cancellation for long transcriptions. Each request gets a token
+that is cancelled explicitly (DELETE /requests/<id>) or when a probe sees
+the client has disconnected; the transcription loop checks the token
+between segments and stops pulling from the decoder.
+"""
+
+import time
+import uuid
+import select
+import socket
+import threading
+
+class RequestCancelled(Exception):
+    """Raised inside a transcription once its request has been cancelled."""
+
+class CancelToken:
+    """Cancellation state for one request.
+
+    disconnected is an optional probe returning True once the client is
+    gone. keep_alive, when set, returns True while other requests still
+    want this request's result, which then keeps running.
+    """
+
+    def __init__(self, request_id, disconnected=None):
+        self.request_id = request_id
+        self.disconnected = disconnected
+        self.keep_alive = None
+        self.started = time.time()
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if self.reason is None:
+            self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.disconnected is not None and self.disconnected():
+            self.cancel("client disconnected")
+        if not self._event.is_set():
+            return False
+        return not (self.keep_alive is not None and self.keep_alive())
+
+class RequestRegistry:
+    """Active requests by id, plus counters of what cancellation saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self.cancelled = 0
+        self.cancelled_audio_seconds = 0.0
+
+    def register(self, request_id=None, disconnected=None):
+        token = CancelToken(str(request_id)[:128] if request_id else uuid.uuid4().hex, disconnected)
+        with self._lock:
+            self._active[token.request_id] = token
+        return token
+
+    def finish(self, token):
+        with self._lock:
+            if self._active.get(token.request_id) is token:
+                del self._active[token.request_id]
+
+    def cancel(self, request_id, reason="cancelled by client"):
+        """Cancel an active request; False when no such request is running."""
+        with self._lock:
+            token = self._active.get(request_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def cancel_all(self, reason):
+        with self._lock:
+            tokens = list(self._active.values())
+        for token in tokens:
+            token.cancel(reason)
+        return len(tokens)
+
+    def record_cancelled(self, audio_seconds):
+        """Count a stopped transcription and the audio it did not decode."""
+        with self._lock:
+            self.cancelled += 1
+            self.cancelled_audio_seconds += max(0.0, audio_seconds)
+
+    def active(self):
+        now = time.time()
+        with self._lock:
+            return [
+                {"request_id": token.request_id, "age_seconds": round(now - token.started, 1),
+                 "cancelling": token.reason is not None}
+                for token in self._active.values()
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._active),
+                "cancelled": self.cancelled,
+                "cancelled_audio_seconds": round(self.cancelled_audio_seconds, 2),
+            }
+
+def socket_disconnect_probe(sock):
+    """Probe for a client that closed its connection while we work.
+
+    The request body has been read by then, so a readable socket that
+    returns no data means the peer hung up.
+    """
+    def disconnected():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError):
+            return True
+    return disconnected
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Clinote request coalescing
+Lets identical requests that arrive while the first one is still running
+wait for and share its result instead of repeating the work.
+"""
+
+import hashlib
+import threading
+
+def request_key(*parts):
+    """Hash request parts (bytes, text or anything with a stable repr()) into a key."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = repr(part).encode()
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class Coalescer:
+    """Run one computation per key at a time and share it with latecomers.
+
+    Only in-flight work is shared; once the leader finishes the key is
+    forgotten, so this is deduplication, not a result cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.saved = 0.0
+
+    def run(self, key, compute, cost=None):
+        """Return (result, shared) for key, computing it only if nobody else is.
+
+        cost(result) gives the amount of work a follower saved, summed into
+        the saved counter. Exceptions raised by the leader are re-raised in
+        every follower.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+                flight.waiters += 1
+
+        if leader:
+            try:
+                flight.result = compute()
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result, False
+
+        flight.done.wait()
+        with self._lock:
+            flight.waiters -= 1
+        if flight.error is not None:
+            raise flight.error
+        if cost is not None:
+            saved = cost(flight.result)
+            with self._lock:
+                self.saved += saved
+        return flight.result, True
+
+    def waiters(self, key):
+        """Requests currently waiting on the in-flight computation for key."""
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight.waiters if flight is not None else 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "saved": round(self.saved, 2),
+            }
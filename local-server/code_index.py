@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Clinote code suggestion index
+Compiles the CPT/ICD-10 code table into a compact binary inverted index
+(sorted term dictionary plus weighted postings) that the server memory-maps
+at startup, so suggestions need no network access and no parsing on load.
+
+Usage:
+    python code_index.py build [--source data/codes.tsv] [--output data/codes.idx]
+    python code_index.py query "patient has high blood pressure and chest pain"
+"""
+
+import os
+import re
+import sys
+import math
+import mmap
+import bisect
+import struct
+import hashlib
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(BASE_DIR, "data", "codes.tsv")
+DEFAULT_INDEX = os.path.join(BASE_DIR, "data", "codes.idx")
+
+MAGIC = b"CLNCODE1"
+VERSION = 1
+# magic, version, code count, term count, posting count, source sha256
+HEADER = struct.Struct("<8sIIII32s")
+# Byte offsets of the index sections that follow the header
+SECTIONS = [
+    "code_offsets", "code_blob", "desc_offsets", "desc_blob", "systems", "norms",
+    "term_offsets", "term_blob", "posting_starts", "posting_codes", "posting_weights",
+]
+SECTION_TABLE = struct.Struct("<" + "I" * len(SECTIONS))
+
+SYSTEMS = ["CPT", "ICD10"]
+
+# Codes like "E11.9" stay one token; other words split on punctuation
+TOKEN_PATTERN = re.compile(r"[a-z][0-9][0-9a-z]*\.[0-9a-z]+|[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have",
+    "he", "her", "his", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "our",
+    "she", "so", "that", "the", "their", "them", "then", "there", "they", "this", "to",
+    "was", "we", "were", "with", "you", "your", "unspecified", "other", "without", "patient",
+}
+
+# Query-side expansion of clinical shorthand that rarely appears in descriptions
+SYNONYMS = {
+    "htn": "hypertension",
+    "bp": "blood pressure",
+    "dm": "diabetes",
+    "t2dm": "type 2 diabetes",
+    "sob": "shortness of breath",
+    "cp": "chest pain",
+    "ekg": "ecg",
+    "cxr": "chest x ray",
+    "xray": "x ray",
+    "uti": "urinary tract infection",
+    "uri": "upper respiratory infection",
+    "afib": "atrial fibrillation",
+    "chf": "heart failure",
+    "cad": "coronary artery disease",
+    "copd": "chronic obstructive pulmonary disease",
+    "gerd": "reflux",
+    "cbc": "complete blood count",
+    "bmp": "basic metabolic panel",
+    "cmp": "comprehensive metabolic panel",
+    "ua": "urinalysis",
+    "tsh": "thyroid",
+    "a1c": "hemoglobin a1c",
+    "lbp": "low back pain",
+    "ha": "headache",
+}
+
+# Phrase terms are more specific than single words
+BIGRAM_BOOST = 2.0
+# Synonyms describe a code almost as well as its own description
+SYNONYM_WEIGHT = 0.8
+
+def normalize(word):
+    """Crude plural stripping shared by indexing and querying."""
+    if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def analyze(text):
+    """Return the unigram and bigram terms of a piece of text."""
+    words = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        expansion = SYNONYMS.get(word)
+        if expansion and expansion != word:
+            words.extend(TOKEN_PATTERN.findall(expansion))
+        else:
+            words.append(word)
+    words = [normalize(word) for word in words if word not in STOPWORDS]
+    terms = list(words)
+    terms.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return terms
+
+def read_code_table(source):
+    """Parse the tab-separated code table into (system, code, description, synonyms) rows."""
+    rows = []
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            parts = line.split("\t")
+            if len(parts) < 3 or parts[0] not in SYSTEMS:
+                logger.warning(f"Skipping malformed code table line {line_number}: {line!r}")
+                continue
+            synonyms = [s.strip() for s in parts[3].split(";")] if len(parts) > 3 else []
+            rows.append((parts[0], parts[1].strip(), parts[2].strip(), [s for s in synonyms if s]))
+    return rows
+
+def file_sha256(path):
+    """Return the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def pack_strings(strings):
+    """Pack strings into an offsets array (n + 1 entries) and a UTF-8 blob."""
+    offsets = [0]
+    blob = bytearray()
+    for value in strings:
+        blob.extend(value.encode("utf-8"))
+        offsets.append(len(blob))
+    return struct.pack(f"<{len(offsets)}I", *offsets), bytes(blob)
+
+def build_index(source=DEFAULT_SOURCE, output=DEFAULT_INDEX):
+    """Compile the code table into the binary index file."""
+    rows = read_code_table(source)
+
+    term_frequencies = []
+    document_frequency = {}
+    for system, code, description, synonyms in rows:
+        frequencies = {}
+        for term in analyze(f"{code} {description}"):
+            frequencies[term] = frequencies.get(term, 0) + 1.0
+        for synonym in synonyms:
+            for term in analyze(synonym):
+                frequencies[term] = max(frequencies.get(term, 0), SYNONYM_WEIGHT)
+        # The code itself ("e11.9") is searchable as a term
+        frequencies[code.lower()] = frequencies.get(code.lower(), 0) + 1.0
+        term_frequencies.append(frequencies)
+        for term in frequencies:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+
+    total = len(rows)
+    postings = {term: [] for term in document_frequency}
+    norms = []
+    for code_id, frequencies in enumerate(term_frequencies):
+        squared = 0.0
+        for term, frequency in frequencies.items():
+            weight = frequency * math.log(1.0 + total / document_frequency[term])
+            if " " in term:
+                weight *= BIGRAM_BOOST
+            postings[term].append((code_id, weight))
+            squared += weight * weight
+        norms.append(math.sqrt(squared) or 1.0)
+
+    # Terms are sorted by UTF-8 bytes so the reader can binary-search the mapped blob
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    posting_starts = [0]
+    posting_codes = []
+    posting_weights = []
+    for term in terms:
+        for code_id, weight in postings[term]:
+            posting_codes.append(code_id)
+            posting_weights.append(weight)
+        posting_starts.append(len(posting_codes))
+
+    code_offsets, code_blob = pack_strings([row[1] for row in rows])
+    desc_offsets, desc_blob = pack_strings([row[2] for row in rows])
+    term_offsets, term_blob = pack_strings(terms)
+    sections = {
+        "code_offsets": code_offsets,
+        "code_blob": code_blob,
+        "desc_offsets": desc_offsets,
+        "desc_blob": desc_blob,
+        "systems": bytes(SYSTEMS.index(row[0]) for row in rows),
+        "norms": struct.pack(f"<{len(norms)}f", *norms),
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "posting_starts": struct.pack(f"<{len(posting_starts)}I", *posting_starts),
+        "posting_codes": struct.pack(f"<{len(posting_codes)}I", *posting_codes),
+        "posting_weights": struct.pack(f"<{len(posting_weights)}f", *posting_weights),
+    }
+
+    header = HEADER.pack(MAGIC, VERSION, total, len(terms), len(posting_codes), file_sha256(source))
+    body = bytearray()
+    offsets = []
+    position = HEADER.size + SECTION_TABLE.size
+    for name in SECTIONS:
+        # Keep every section 4-byte aligned for memoryview.cast()
+        padding = (-position) % 4
+        body.extend(b"\0" * padding)
+        position += padding
+        offsets.append(position)
+        body.extend(sections[name])
+        position += len(sections[name])
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    temp_output = output + ".tmp"
+    with open(temp_output, "wb") as f:
+        f.write(header)
+        f.write(SECTION_TABLE.pack(*offsets))
+        f.write(body)
+    os.replace(temp_output, output)
+    logger.info(f"Built code index with {total} codes and {len(terms)} terms: {output}")
+    return output
+
+class CodeIndex:
+    """Read-only view of a memory-mapped code index file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.code_count, self.term_count, posting_count, self.source_sha256 = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"Not a version {VERSION} Clinote code index: {path}")
+        offsets = dict(zip(SECTIONS, SECTION_TABLE.unpack_from(self._mmap, HEADER.size)))
+
+        # Sections are little-endian, which matches every platform the server ships on
+        view = memoryview(self._mmap)
+        self._views = [view]
+        def section(name, count, fmt):
+            start = offsets[name]
+            sliced = view[start:start + count * struct.calcsize(fmt)]
+            self._views.append(sliced)
+            self._views.append(sliced.cast(fmt))
+            return self._views[-1]
+        def blob(name, offsets_view):
+            start = offsets[name]
+            self._views.append(view[start:start + offsets_view[-1]])
+            return self._views[-1]
+
+        self._code_offsets = section("code_offsets", self.code_count + 1, "I")
+        self._code_blob = blob("code_blob", self._code_offsets)
+        self._desc_offsets = section("desc_offsets", self.code_count + 1, "I")
+        self._desc_blob = blob("desc_blob", self._desc_offsets)
+        self._systems = section("systems", self.code_count, "B")
+        self._norms = section("norms", self.code_count, "f")
+        self._term_offsets = section("term_offsets", self.term_count + 1, "I")
+        self._term_blob = blob("term_blob", self._term_offsets)
+        self._posting_starts = section("posting_starts", self.term_count + 1, "I")
+        self._posting_codes = section("posting_codes", posting_count, "I")
+        self._posting_weights = section("posting_weights", posting_count, "f")
+        self._terms = _TermList(self._term_offsets, self._term_blob, self.term_count)
+
+    def size_bytes(self):
+        return len(self._mmap)
+
+    def code(self, code_id):
+        return bytes(self._code_blob[self._code_offsets[code_id]:self._code_offsets[code_id + 1]]).decode("utf-8")
+
+    def description(self, code_id):
+        return bytes(self._desc_blob[self._desc_offsets[code_id]:self._desc_offsets[code_id + 1]]).decode("utf-8")
+
+    def system(self, code_id):
+        return SYSTEMS[self._systems[code_id]]
+
+    def term_id(self, term):
+        """Binary-search the mapped term dictionary, returning the term id or None."""
+        key = term.encode("utf-8")
+        index = bisect.bisect_left(self._terms, key)
+        if index < self.term_count and self._terms[index] == key:
+            return index
+        return None
+
+    def prefix_terms(self, prefix, limit=50):
+        """Return ids of terms starting with prefix, in sorted order."""
+        key = prefix.encode("utf-8")
+        index = bisect.bisect_left(self._terms, key)
+        found = []
+        while index < self.term_count and len(found) < limit and self._terms[index].startswith(key):
+            found.append(index)
+            index += 1
+        return found
+
+    def postings(self, term_id):
+        start, end = self._posting_starts[term_id], self._posting_starts[term_id + 1]
+        return zip(self._posting_codes[start:end], self._posting_weights[start:end])
+
+    def suggest(self, text, limit=10, system=None):
+        """Rank codes for free text, returning dicts with code, system, description, score and matched terms."""
+        query = {}
+        for term in analyze(text):
+            query[term] = query.get(term, 0) + 1
+        return self._rank(query, limit, system)
+
+    def complete(self, prefix, limit=10, system=None):
+        """Rank codes whose terms start with the last word of prefix (typeahead)."""
+        words = TOKEN_PATTERN.findall(prefix.lower())
+        if not words:
+            return []
+        query = {term: 1 for term in analyze(" ".join(words[:-1]))}
+        partial = normalize(words[-1]) if len(words[-1]) > 4 else words[-1]
+        for term_id in self.prefix_terms(partial):
+            query[bytes(self._terms[term_id]).decode("utf-8")] = 1
+        return self._rank(query, limit, system)
+
+    def _rank(self, query, limit, system):
+        scores = {}
+        matched = {}
+        for term, count in query.items():
+            term_id = self.term_id(term)
+            if term_id is None:
+                continue
+            for code_id, weight in self.postings(term_id):
+                scores[code_id] = scores.get(code_id, 0.0) + count * weight
+                matched.setdefault(code_id, []).append(term)
+
+        ranked = sorted(
+            ((score / self._norms[code_id], code_id) for code_id, score in scores.items()
+             if system is None or self.system(code_id) == system),
+            reverse=True
+        )
+        return [
+            {
+                "code": self.code(code_id),
+                "system": self.system(code_id),
+                "description": self.description(code_id),
+                "score": round(score, 4),
+                "matched": sorted(matched[code_id]),
+            }
+            for score, code_id in ranked[:limit]
+        ]
+
+    def close(self):
+        # Views into the mapping must be released before it can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+class _TermList:
+    """Sequence view of the sorted term blob so bisect can search it in place."""
+
+    def __init__(self, offsets, blob, count):
+        self._offsets = offsets
+        self._blob = blob
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]])
+
+def load_index(source=DEFAULT_SOURCE, path=DEFAULT_INDEX):
+    """Map the prebuilt index, rebuilding it first if it is missing or older than the source table."""
+    if os.path.exists(path):
+        try:
+            index = CodeIndex(path)
+            if not os.path.exists(source) or index.source_sha256 == file_sha256(source):
+                return index
+            index.close()
+            logger.info("Code table changed since the index was built, rebuilding")
+        except (ValueError, OSError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable code index {path}: {e}")
+    build_index(source, path)
+    return CodeIndex(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the Clinote code suggestion index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Compile the code table into the binary index")
+    build_parser.add_argument("--source", default=DEFAULT_SOURCE)
+    build_parser.add_argument("--output", default=DEFAULT_INDEX)
+    query_parser = subparsers.add_parser("query", help="Suggest codes for a piece of text")
+    query_parser.add_argument("text")
+    query_parser.add_argument("--index", default=DEFAULT_INDEX)
+    query_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "build":
+        build_index(args.source, args.output)
+    else:
+        index = load_index(path=args.index)
+        for suggestion in index.suggest(args.text, args.limit):
+            print(f"{suggestion['system']:<6} {suggestion['code']:<9} {suggestion['score']:>7.3f}  {suggestion['description']}")
+
+if __name__ == "__main__":
+    sys.exit(main())
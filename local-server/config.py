@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Clinote server configuration
+Layers settings as defaults < config file < CLINOTE_* environment variables
+< command line. Each argparse option is also a config-file key (dashes or
+underscores) and an environment variable named CLINOTE_<OPTION>, so new
+options need no extra wiring.
+
+    {"model": "small", "workers": 2, "cpu-threads": 4, "compute-type": "int8"}
+"""
+
+import os
+import json
+import argparse
+
+ENV_PREFIX = "CLINOTE_"
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+class ConfigError(ValueError):
+    """Raised for an unreadable config file or a value of the wrong type."""
+
+def normalize_key(key):
+    return str(key).strip().lstrip("-").replace("-", "_").lower()
+
+def load_config_file(path):
+    """Read a JSON config file into {option dest: value}."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read config file {path}: {e}")
+    if not isinstance(data, dict):
+        raise ConfigError(f"Config file {path} must hold a JSON object")
+    return {normalize_key(key): value for key, value in data.items()}
+
+def coerce(action, value, source):
+    """Convert a file or environment value the way argparse would convert the flag."""
+    if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction)):
+        if isinstance(value, str):
+            value = value.strip().lower() in TRUE_VALUES
+        return bool(value)
+    if isinstance(action, argparse._AppendAction):
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(",") if item.strip()]
+        if not isinstance(value, list):
+            raise ConfigError(f"{source} must be a list")
+        return [coerce_scalar(action, item, source) for item in value]
+    if value is None:
+        return None
+    return coerce_scalar(action, value, source)
+
+def coerce_scalar(action, value, source):
+    if action.type is not None:
+        try:
+            value = action.type(value)
+        except (TypeError, ValueError):
+            raise ConfigError(f"{source} has an invalid value: {value!r}")
+    if action.choices is not None and value not in action.choices:
+        raise ConfigError(f"{source} must be one of: {', '.join(map(str, action.choices))}")
+    return value
+
+def layered_defaults(parser, file_values, environ):
+    """Defaults for parser from a config file, then the environment on top."""
+    actions = {action.dest: action for action in parser._actions if action.dest not in ("help", "config")}
+    unknown = sorted(set(file_values) - set(actions))
+    if unknown:
+        raise ConfigError(f"Unknown settings in config file: {', '.join(unknown)}")
+    defaults = {dest: coerce(actions[dest], value, f"config setting '{dest}'")
+                for dest, value in file_values.items()}
+    for dest, action in actions.items():
+        name = ENV_PREFIX + dest.upper()
+        if environ.get(name) not in (None, ""):
+            defaults[dest] = coerce(action, environ[name], name)
+    return defaults
+
+def parse_layered(parser, argv=None, environ=None):
+    """Parse argv with defaults taken from --config / CLINOTE_CONFIG and the environment.
+
+    Returns (args, the config file path or None).
+    """
+    environ = os.environ if environ is None else environ
+    parser.add_argument("--config", metavar="PATH", default=environ.get(ENV_PREFIX + "CONFIG"),
+                        help="JSON settings file; environment variables and flags override it")
+    known, _ = parser.parse_known_args(argv)
+    try:
+        file_values = load_config_file(known.config) if known.config else {}
+        parser.set_defaults(**layered_defaults(parser, file_values, environ))
+    except ConfigError as e:
+        parser.error(str(e))
+    return parser.parse_args(argv), known.config
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Clinote speaker diarization
+Labels who said each transcript segment. Silero VAD finds the speech, the
+speech is cut into short windows, each window gets a speaker embedding, and
+the windows are clustered with vectorized numpy average linkage. Clinician
+voice profiles are cached, so a returning clinician's cluster is recognised
+with one comparison per cluster.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from faster_whisper.feature_extractor import FeatureExtractor
+
+# Optional learned speaker embeddings; the built-in embedder needs no model
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# Speech is embedded in windows this long, stepping by WINDOW_STEP
+WINDOW_SECONDS = 1.5
+WINDOW_STEP = 0.75
+# Windows shorter than this carry too little voice to embed
+MIN_WINDOW_SECONDS = 0.5
+VAD_OPTIONS = VadOptions(min_silence_duration_ms=300, speech_pad_ms=100)
+
+# Average-linkage clustering stops when the closest clusters are less
+# similar than this. Embeddings are centred on the recording's mean voice,
+# so windows of the same speaker score above zero and different speakers below.
+CLUSTER_THRESHOLD = 0.0
+MAX_SPEAKERS = 4
+# Longer recordings cluster a sample of windows and assign the rest to the nearest cluster
+MAX_CLUSTER_WINDOWS = 400
+
+# A cluster is the clinician when it is this similar to their cached profile
+PROFILE_MATCH_THRESHOLD = 0.3
+# With a single speaker there is no second voice to centre on, so compare raw embeddings
+SINGLE_SPEAKER_MATCH_THRESHOLD = 0.9
+# Weight of a new session's voice when refreshing a profile
+PROFILE_SMOOTHING = 0.2
+MAX_PROFILES = 200
+
+def speech_windows(audio, sample_rate=SAMPLE_RATE):
+    """Cut the VAD speech regions into (start, end) windows in seconds."""
+    windows = []
+    for region in get_speech_timestamps(audio, VAD_OPTIONS, sampling_rate=sample_rate):
+        start, end = region["start"] / sample_rate, region["end"] / sample_rate
+        position = start
+        while end - position >= MIN_WINDOW_SECONDS:
+            windows.append((position, min(end, position + WINDOW_SECONDS)))
+            if position + WINDOW_SECONDS >= end:
+                break
+            position += WINDOW_STEP
+    return windows
+
+class MelStatsEmbedder:
+    """Model-free embedding: mean and spread of the log-mel spectrum per window.
+
+    Cheap and good enough to tell two voices apart in one room, which is
+    the clinician/patient case.
+    """
+
+    name = "mel-stats"
+
+    def __init__(self):
+        self.features = FeatureExtractor(feature_size=80, sampling_rate=SAMPLE_RATE)
+
+    def embed(self, audio, windows):
+        mel = self.features(audio, padding=0).T  # frames x 80
+        frames_per_second = SAMPLE_RATE / self.features.hop_length
+        vectors = []
+        for start, end in windows:
+            frames = mel[int(start * frames_per_second):max(int(end * frames_per_second), 1)]
+            deltas = np.diff(frames, axis=0) if len(frames) > 1 else np.zeros_like(frames)
+            vectors.append(np.concatenate([frames.mean(axis=0), frames.std(axis=0), np.abs(deltas).mean(axis=0)]))
+        return np.asarray(vectors, dtype=np.float32)
+
+class OnnxEmbedder:
+    """Speaker embeddings from an ONNX model that takes (batch, frames, 80) log-mel features.
+
+    Any small speaker-verification export with that input, e.g. a WeSpeaker
+    ResNet or ECAPA model, can be used.
+    """
+
+    def __init__(self, path, threads=1):
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime is required for ONNX speaker embeddings")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.name = os.path.basename(path)
+        self.features = FeatureExtractor(feature_size=80, sampling_rate=SAMPLE_RATE)
+
+    def embed(self, audio, windows):
+        mel = self.features(audio, padding=0).T
+        frames_per_second = SAMPLE_RATE / self.features.hop_length
+        length = int(WINDOW_SECONDS * frames_per_second)
+        batch = np.zeros((len(windows), length, mel.shape[1]), dtype=np.float32)
+        for i, (start, end) in enumerate(windows):
+            frames = mel[int(start * frames_per_second):int(start * frames_per_second) + length]
+            frames = frames - frames.mean(axis=0)
+            # Short windows repeat to a fixed length so the batch is one call
+            batch[i] = np.resize(frames, (length, mel.shape[1])) if len(frames) else 0
+        return self.session.run(None, {self.input_name: batch})[0].reshape(len(windows), -1)
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-9)
+
+def cluster_embeddings(embeddings, threshold=CLUSTER_THRESHOLD, max_speakers=MAX_SPEAKERS):
+    """Average-linkage clustering on cosine similarity; returns one label per row.
+
+    Labels are renumbered 0, 1, ... in order of first appearance.
+    """
+    count = len(embeddings)
+    if count == 0:
+        return np.zeros(0, dtype=int)
+    similarity = embeddings @ embeddings.T
+    np.fill_diagonal(similarity, -np.inf)
+    sizes = np.ones(count)
+    labels = np.arange(count)
+    clusters = count
+    while clusters > 1:
+        i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+        if similarity[i, j] < threshold and clusters <= max_speakers:
+            break
+        # Lance-Williams update for average linkage, merging j into i
+        merged = (similarity[i] * sizes[i] + similarity[j] * sizes[j]) / (sizes[i] + sizes[j])
+        similarity[i, :] = merged
+        similarity[:, i] = merged
+        similarity[i, i] = -np.inf
+        similarity[j, :] = -np.inf
+        similarity[:, j] = -np.inf
+        sizes[i] += sizes[j]
+        labels[labels == j] = i
+        clusters -= 1
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    return order[inverse]
+
+class VoiceProfiles:
+    """Cached clinician voice embeddings, optionally persisted to a JSON file."""
+
+    def __init__(self, path=None, max_profiles=MAX_PROFILES):
+        self.path = path
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for clinician_id, vector in json.load(f).items():
+                        self._profiles[clinician_id] = np.asarray(vector, dtype=np.float32)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read voice profiles from {path}: {e}")
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, clinician_id):
+        with self._lock:
+            profile = self._profiles.get(clinician_id)
+            if profile is not None:
+                self._profiles.move_to_end(clinician_id)
+            return profile
+
+    def update(self, clinician_id, embedding):
+        with self._lock:
+            previous = self._profiles.get(clinician_id)
+            if previous is not None and previous.shape == embedding.shape:
+                embedding = previous + PROFILE_SMOOTHING * (embedding - previous)
+            self._profiles[clinician_id] = embedding.astype(np.float32)
+            self._profiles.move_to_end(clinician_id)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+            snapshot = self._snapshot()
+        self._save(snapshot)
+
+    def delete(self, clinician_id):
+        with self._lock:
+            removed = self._profiles.pop(clinician_id, None) is not None
+            snapshot = self._snapshot() if removed else None
+        # Otherwise a forgotten profile comes back on the next restart
+        self._save(snapshot)
+        return removed
+
+    def _snapshot(self):
+        return {key: value.tolist() for key, value in self._profiles.items()} if self.path else None
+
+    def _save(self, snapshot):
+        if snapshot is None:
+            return
+        try:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save voice profiles to {self.path}: {e}")
+
+class Diarizer:
+    """Find speaker turns in a recording and label transcript segments with them."""
+
+    def __init__(self, embedder=None, profiles=None, max_speakers=MAX_SPEAKERS):
+        self.embedder = embedder or MelStatsEmbedder()
+        self.profiles = profiles if profiles is not None else VoiceProfiles()
+        self.max_speakers = max_speakers
+        self.runs = 0
+        self.profile_matches = 0
+
+    def diarize(self, audio, clinician_id=None):
+        """Return speaker turns, per-speaker talk time and how the clinician was found."""
+        started = time.perf_counter()
+        windows = speech_windows(audio)
+        result = {"turns": [], "speakers": {}, "clinician": None, "clinician_source": None, "windows": len(windows)}
+        if windows:
+            raw = self.embedder.embed(audio, windows)
+            center = raw.mean(axis=0)
+            embeddings = normalize(raw - center)
+            labels = self._cluster(embeddings)
+            names = self._name_clusters(raw, center, labels, clinician_id, result)
+            for (start, end), label in zip(windows, labels):
+                name = names[label]
+                turns = result["turns"]
+                if turns and turns[-1][2] == name and start <= turns[-1][1]:
+                    turns[-1][1] = end
+                else:
+                    # Windows overlap, so a new speaker's turn starts where the last one ended
+                    turns.append([max(start, turns[-1][1]) if turns else start, end, name])
+            for turn in result["turns"]:
+                turn[0], turn[1] = round(float(turn[0]), 2), round(float(turn[1]), 2)
+                result["speakers"][turn[2]] = round(result["speakers"].get(turn[2], 0.0) + turn[1] - turn[0], 2)
+        self.runs += 1
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def _cluster(self, embeddings):
+        if len(embeddings) <= MAX_CLUSTER_WINDOWS:
+            return cluster_embeddings(embeddings, max_speakers=self.max_speakers)
+        # Cluster an even sample, then give every window its nearest centroid
+        sample = np.linspace(0, len(embeddings) - 1, MAX_CLUSTER_WINDOWS).astype(int)
+        sample_labels = cluster_embeddings(embeddings[sample], max_speakers=self.max_speakers)
+        centroids = normalize(np.stack([
+            embeddings[sample][sample_labels == label].mean(axis=0) for label in range(sample_labels.max() + 1)
+        ]))
+        return np.argmax(embeddings @ centroids.T, axis=1)
+
+    def _name_clusters(self, raw, center, labels, clinician_id, result):
+        count = labels.max() + 1
+        centroids = np.stack([raw[labels == label].mean(axis=0) for label in range(count)])
+        names = [f"speaker_{label + 1}" for label in range(count)]
+        if clinician_id is None:
+            return names
+
+        clinician = None
+        profile = self.profiles.get(clinician_id)
+        if profile is not None and profile.shape == centroids[0].shape:
+            # One comparison per cluster against the cached voice
+            if count > 1:
+                similarity = normalize(centroids - center) @ normalize(profile - center)
+                threshold = PROFILE_MATCH_THRESHOLD
+            else:
+                similarity = normalize(centroids) @ normalize(profile)
+                threshold = SINGLE_SPEAKER_MATCH_THRESHOLD
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                clinician = best
+                result["clinician_source"] = "profile"
+                self.profile_matches += 1
+        elif profile is None:
+            # No profile yet: the clinician usually opens the encounter
+            clinician = int(labels[0])
+            result["clinician_source"] = "first_speaker"
+
+        if clinician is not None:
+            self.profiles.update(clinician_id, centroids[clinician])
+            names[clinician] = "clinician"
+            others = [label for label in range(count) if label != clinician]
+            if len(others) == 1:
+                names[others[0]] = "patient"
+            result["clinician"] = "clinician"
+        return names
+
+    def stats(self):
+        return {
+            "embedder": self.embedder.name,
+            "runs": self.runs,
+            "profiles": len(self.profiles),
+            "profile_matches": self.profile_matches,
+        }
+
+def label_segments(segments, turns):
+    """Set each segment's "speaker" to the speaker who overlaps it most."""
+    for segment in segments:
+        overlap = {}
+        for start, end, name in turns:
+            shared = min(segment["end"], end) - max(segment["start"], start)
+            if shared > 0:
+                overlap[name] = overlap.get(name, 0.0) + shared
+        segment["speaker"] = max(overlap, key=overlap.get) if overlap else None
+    return segments
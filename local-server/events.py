@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Clinote server events
+A small publish/subscribe bus behind the /events Server-Sent Events stream.
+Clients hold one connection and are told when the model loads or unloads,
+when the queue grows, when requests are refused and when settings change,
+instead of pinging before every request.
+"""
+
+import json
+import queue
+import threading
+
+# Seconds between keep-alive comments, which also reveal clients that went away
+HEARTBEAT_SECONDS = 15
+# Events buffered per client; a client that falls this far behind is dropped
+SUBSCRIBER_BUFFER = 100
+# Milliseconds browsers wait before reconnecting
+RETRY_MS = 3000
+
+class TooManySubscribers(Exception):
+    """Raised when the bus already has its maximum number of clients."""
+
+class Subscription:
+    def __init__(self, bus):
+        self.bus = bus
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.closed = False
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+class EventBus:
+    """Fan events out to subscribers, remembering the latest of each retained kind.
+
+    Retained events (the current model state, queue depth, settings) are
+    replayed to each new subscriber, so a client knows the server's state
+    as soon as it connects.
+    """
+
+    def __init__(self, max_subscribers=32):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._latest = {}
+        self._next_id = 1
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event, data, retain=False):
+        """Send an event to every subscriber; returns False if nothing changed."""
+        with self._lock:
+            if retain and self._latest.get(event, (None, None))[1] == data:
+                return False
+            message = (self._next_id, event, data)
+            self._next_id += 1
+            self.published += 1
+            if retain:
+                self._latest[event] = (message[0], data)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # A stalled client must not hold up the server; it can reconnect
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self.dropped += 1
+        return True
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"{len(self._subscribers)} clients are already subscribed")
+            subscription = Subscription(self)
+            for event, (event_id, data) in self._latest.items():
+                subscription.queue.put_nowait((event_id, event, data))
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                subscription.closed = True
+                # Drop the backlog so there is room for the sentinel that wakes the stream
+                try:
+                    while True:
+                        subscription.queue.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscription.queue.put_nowait(None)
+                except queue.Full:
+                    # A publisher refilled it meanwhile; the stream sees closed on its next wake
+                    pass
+
+    def close(self):
+        """End every stream, e.g. when the server is draining."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            self.unsubscribe(subscription)
+
+    def latest(self, event):
+        with self._lock:
+            entry = self._latest.get(event)
+        return None if entry is None else entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self.published, "dropped": self.dropped}
+
+def format_event(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def stream(subscription, heartbeat=HEARTBEAT_SECONDS):
+    """Yield a subscription as text/event-stream chunks until it is closed."""
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            if subscription.closed:
+                return
+            try:
+                message = subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if message is None or subscription.closed:
+                return
+            yield format_event(*message)
+    finally:
+        subscription.close()
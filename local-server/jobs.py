@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Clinote background jobs
+Work that outlives the request that started it, such as finishing a
+transcription that hit its deadline. Jobs run on a small thread pool and
+their results are kept for a while so clients can fetch them later with
+GET /jobs/<id>.
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# How long a finished job's result can still be fetched
+JOB_TTL = 3600
+# Jobs remembered at once; the oldest finished ones are forgotten first
+MAX_JOBS = 200
+
+class JobLimitReached(Exception):
+    """Raised when every remembered job is still unfinished."""
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    def to_dict(self):
+        job = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "age_seconds": round(time.time() - self.created, 1),
+        }
+        if self.status == "done":
+            job["result"] = self.result
+        elif self.status == "failed":
+            job["error"] = self.error
+        return job
+
+class JobStore:
+    """Run jobs in the background and keep their results for JOB_TTL seconds."""
+
+    def __init__(self, workers=1, ttl=JOB_TTL, max_jobs=MAX_JOBS):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return its job id."""
+        job = Job(kind)
+        with self._lock:
+            self._expire()
+            if len(self._jobs) >= self.max_jobs:
+                raise JobLimitReached(f"{len(self._jobs)} background jobs are still running")
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        job.finished = time.time()
+        with self._lock:
+            if job.status == "done":
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def _expire(self):
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished is not None]
+        for job in finished:
+            if now - job.finished > self.ttl or len(self._jobs) >= self.max_jobs:
+                del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return None if job is None else job.to_dict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": sum(job.finished is None for job in self._jobs.values()),
+                "kept": len(self._jobs),
+                "completed": self.completed,
+                "failed": self.failed,
+            }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Clinote memory governor
+Keeps the server inside a resident-memory budget. Requests reserve their
+estimated footprint before decoding, caches and models register how to
+shrink, and when RSS plus reservations would exceed the budget the governor
+evicts caches, drops models it can spare, and finally refuses new work.
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MB = 1000 * 1000
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a request cannot be admitted within the memory budget."""
+
+class MemoryGovernor:
+    """Account RSS, request reservations, caches and models against a budget.
+
+    budget is in bytes, None means unlimited (accounting only). rss is a
+    callable returning current resident bytes or None when unknown.
+    """
+
+    def __init__(self, budget, rss):
+        self.budget = budget
+        self._rss = rss
+        self._lock = threading.Lock()
+        self._caches = {}
+        self._reclaimers = []
+        self.reserved = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.evictions = 0
+        self.reclaims = 0
+        self.last_pressure = None
+
+    def register_cache(self, name, size, evict):
+        """Register a cache by size() -> bytes and evict() that empties it."""
+        self._caches[name] = (size, evict)
+
+    def register_reclaimer(self, name, reclaim, on_admission=True):
+        """Register a heavier step, tried in order after caches are evicted.
+
+        reclaim() returns True when it freed something. Steps with
+        on_admission=False only run from the background check, e.g. unloading
+        models that an incoming request would immediately reload.
+        """
+        self._reclaimers.append((name, reclaim, on_admission))
+
+    def usage(self):
+        """Resident bytes plus outstanding reservations."""
+        return (self._rss() or 0) + self.reserved
+
+    def over_budget(self, extra=0):
+        return self.budget is not None and self.usage() + extra > self.budget
+
+    def reclaim(self, extra=0, admission=False):
+        """Free memory until extra more bytes fit, returning True if they do."""
+        if not self.over_budget(extra):
+            return True
+        self.last_pressure = time.time()
+
+        caches = sorted(self._caches.items(), key=lambda item: item[1][0](), reverse=True)
+        for name, (size, evict) in caches:
+            freed = size()
+            if not freed:
+                continue
+            evict()
+            self.evictions += 1
+            logger.info(f"Memory governor evicted cache '{name}' ({freed / MB:.1f} MB)")
+            if not self.over_budget(extra):
+                return True
+
+        for name, reclaim, on_admission in self._reclaimers:
+            if admission and not on_admission:
+                continue
+            if reclaim():
+                self.reclaims += 1
+                logger.info(f"Memory governor reclaimed '{name}'")
+                if not self.over_budget(extra):
+                    return True
+        return not self.over_budget(extra)
+
+    def admit(self, nbytes):
+        """Reserve nbytes for a request or raise MemoryBudgetExceeded."""
+        with self._lock:
+            if not self.reclaim(nbytes, admission=True):
+                self.rejected += 1
+                usage = self.usage()
+                raise MemoryBudgetExceeded(
+                    f"Server is over its memory budget ({usage / MB:.0f} MB in use, "
+                    f"{nbytes / MB:.0f} MB requested, {self.budget / MB:.0f} MB budget)"
+                )
+            self.reserved += nbytes
+            self.admitted += 1
+        return nbytes
+
+    def release(self, nbytes):
+        with self._lock:
+            self.reserved -= nbytes
+
+    def check(self):
+        """Background pass: shrink if RSS alone has grown past the budget."""
+        with self._lock:
+            return self.reclaim()
+
+    def stats(self, models=None):
+        """Accounting for /status; models maps model names to estimated bytes."""
+        def mb(value):
+            return None if value is None else round(value / MB, 1)
+
+        rss = self._rss()
+        return {
+            "budget_mb": mb(self.budget),
+            "rss_mb": mb(rss),
+            "reserved_mb": mb(self.reserved),
+            "headroom_mb": mb(self.budget - (rss or 0) - self.reserved) if self.budget is not None else None,
+            "models_mb": {name: mb(size) for name, size in (models or {}).items()},
+            "caches_mb": {name: mb(size()) for name, (size, _) in self._caches.items()},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evictions": self.evictions,
+            "reclaims": self.reclaims,
+            "last_pressure": self.last_pressure,
+        }
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Clinote model cache
+Prefetches faster-whisper models into a local directory, records a sha256
+manifest for every file, and resolves models strictly from that directory
+(or a bundled archive) so the server never needs the Hugging Face hub.
+
+Usage:
+    python model_cache.py prefetch base small --cache-dir ~/.clinote/models
+    python model_cache.py verify --cache-dir ~/.clinote/models
+    python model_cache.py list --cache-dir ~/.clinote/models
+    python model_cache.py pack base --archive data/models.tar --cache-dir ~/.clinote/models
+    python model_cache.py unpack --archive data/models.tar --cache-dir ~/.clinote/models
+"""
+
+import os
+import sys
+import json
+import time
+import tarfile
+import hashlib
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.environ.get("CLINOTE_MODEL_CACHE", os.path.join(os.path.expanduser("~"), ".clinote", "models"))
+# Archive the installers ship next to the server
+DEFAULT_ARCHIVE = os.path.join(BASE_DIR, "data", "models.tar")
+
+MANIFEST_NAME = "manifest.json"
+# Without tokenizer.json faster-whisper fetches a tokenizer from the hub, so require it
+REQUIRED_FILES = ("model.bin", "config.json", "tokenizer.json")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class ModelCacheError(Exception):
+    """Raised when a model is missing from the cache or fails verification."""
+
+def model_dir(cache_dir, model_name):
+    """Directory holding one model inside the cache."""
+    return os.path.join(cache_dir, model_name.replace("/", "--"))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def model_files(path):
+    """Relative paths of the model files, skipping the manifest and hub metadata."""
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if name == MANIFEST_NAME or name.startswith("."):
+                continue
+            files.append(os.path.relpath(os.path.join(root, name), path).replace(os.sep, "/"))
+    return sorted(files)
+
+def write_manifest(path, model_name, source=None, compute_type=None):
+    """Hash every model file and record the result next to them.
+
+    compute_type records the quantization a converted model was saved with,
+    so the server loads it as-is instead of re-quantizing.
+    """
+    files = {name: file_sha256(os.path.join(path, name)) for name in model_files(path)}
+    manifest = {
+        "model": model_name,
+        "source": source,
+        "compute_type": compute_type,
+        "created_at": time.time(),
+        "files": files,
+        "size": sum(os.path.getsize(os.path.join(path, name)) for name in files),
+    }
+    tmp_path = os.path.join(path, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_NAME))
+    return manifest
+
+def read_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def verify(path):
+    """Return a list of problems with a cached model, empty when it is intact."""
+    manifest = read_manifest(path)
+    if manifest is None:
+        return [f"no {MANIFEST_NAME} in {path}"]
+    problems = [f"missing {name}" for name in REQUIRED_FILES if name not in manifest["files"]]
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            problems.append(f"missing {name}")
+        elif file_sha256(file_path) != expected:
+            problems.append(f"checksum mismatch for {name}")
+    return problems
+
+def prefetch(model_name, cache_dir=DEFAULT_CACHE_DIR):
+    """Download a model into the cache and write its manifest.
+
+    This is the only function here that touches the network; run it on a
+    machine with hub access and ship the cache or an archive of it.
+    """
+    from faster_whisper.utils import download_model, _MODELS
+
+    path = model_dir(cache_dir, model_name)
+    os.makedirs(path, exist_ok=True)
+    logger.info(f"Downloading '{model_name}' into {path}")
+    download_model(model_name, output_dir=path)
+    manifest = write_manifest(path, model_name, source=_MODELS.get(model_name, model_name))
+    logger.info(f"Cached '{model_name}': {len(manifest['files'])} files, {manifest['size'] / 1e6:.1f} MB")
+    return path
+
+def is_registered(model_name, cache_dir=DEFAULT_CACHE_DIR):
+    """True when a model is in the cache, e.g. one added by model_import.py."""
+    return read_manifest(model_dir(cache_dir, model_name)) is not None
+
+def list_models(cache_dir=DEFAULT_CACHE_DIR):
+    """Return the manifests of every model in the cache."""
+    if not os.path.isdir(cache_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(cache_dir)):
+        manifest = read_manifest(os.path.join(cache_dir, name))
+        if manifest is not None:
+            manifests.append(manifest)
+    return manifests
+
+def pack(model_names, archive, cache_dir=DEFAULT_CACHE_DIR):
+    """Bundle cached models and their manifests into an uncompressed tar."""
+    os.makedirs(os.path.dirname(os.path.abspath(archive)), exist_ok=True)
+    tmp_path = archive + ".tmp"
+    with tarfile.open(tmp_path, "w") as tar:
+        for model_name in model_names:
+            path = model_dir(cache_dir, model_name)
+            problems = verify(path)
+            if problems:
+                raise ModelCacheError(f"Cannot pack '{model_name}': {'; '.join(problems)}")
+            arcname = os.path.basename(path)
+            tar.add(os.path.join(path, MANIFEST_NAME), arcname=f"{arcname}/{MANIFEST_NAME}")
+            for name in read_manifest(path)["files"]:
+                tar.add(os.path.join(path, name), arcname=f"{arcname}/{name}")
+    os.replace(tmp_path, archive)
+    logger.info(f"Packed {', '.join(model_names)} into {archive}")
+    return archive
+
+def unpack(archive, cache_dir=DEFAULT_CACHE_DIR, model_names=None):
+    """Extract models from an archive into the cache and verify them."""
+    wanted = None if model_names is None else {os.path.basename(model_dir(cache_dir, m)) for m in model_names}
+    extracted = []
+    with tarfile.open(archive) as tar:
+        members = []
+        for member in tar.getmembers():
+            top = member.name.split("/", 1)[0]
+            if wanted is not None and top not in wanted:
+                continue
+            if not (member.isfile() or member.isdir()) or member.name.startswith("/") or ".." in member.name.split("/"):
+                raise ModelCacheError(f"Unsafe path in model archive: {member.name}")
+            members.append(member)
+            if top not in extracted:
+                extracted.append(top)
+        # Members are already checked above; the data filter also guards newer Pythons
+        extract_args = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        tar.extractall(cache_dir, members=members, **extract_args)
+    for name in extracted:
+        problems = verify(os.path.join(cache_dir, name))
+        if problems:
+            raise ModelCacheError(f"Model '{name}' from {archive} failed verification: {'; '.join(problems)}")
+    return extracted
+
+def resolve(model_name, cache_dir=DEFAULT_CACHE_DIR, archive=None, check=True):
+    """Return (path, info) for a model available offline.
+
+    Looks in the cache first and falls back to extracting it from the
+    archive. info reports whether it was a cache hit and whether the
+    checksums were verified. Raises ModelCacheError when the model is not
+    available locally or is corrupt.
+    """
+    path = model_dir(cache_dir, model_name)
+    info = {"path": path, "cache_hit": True, "source": "cache", "verified": False}
+    manifest = read_manifest(path)
+    if manifest is None:
+        if not archive or not os.path.exists(archive):
+            raise ModelCacheError(f"Model '{model_name}' is not in {cache_dir}; "
+                                  f"run 'python model_cache.py prefetch {model_name}'")
+        logger.info(f"Extracting '{model_name}' from {archive}")
+        os.makedirs(cache_dir, exist_ok=True)
+        unpack(archive, cache_dir, [model_name])
+        manifest = read_manifest(path)
+        if manifest is None:
+            raise ModelCacheError(f"Model '{model_name}' is not in {archive}")
+        # unpack() already verified the checksums
+        info.update(cache_hit=False, source="archive", verified=True, compute_type=manifest.get("compute_type"))
+        return path, info
+    info["compute_type"] = manifest.get("compute_type")
+    if check:
+        started = time.perf_counter()
+        problems = verify(path)
+        if problems:
+            raise ModelCacheError(f"Cached model '{model_name}' failed verification: {'; '.join(problems)}")
+        info["verified"] = True
+        info["verify_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return path, info
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the Clinote offline model cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    prefetch_parser = subparsers.add_parser("prefetch", help="Download models into the cache")
+    prefetch_parser.add_argument("models", nargs="+")
+    subparsers.add_parser("verify", help="Check every cached model against its manifest")
+    subparsers.add_parser("list", help="List cached models")
+    pack_parser = subparsers.add_parser("pack", help="Bundle cached models into an archive")
+    pack_parser.add_argument("models", nargs="+")
+    pack_parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    unpack_parser = subparsers.add_parser("unpack", help="Extract an archive into the cache")
+    unpack_parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        if args.command == "prefetch":
+            for model_name in args.models:
+                prefetch(model_name, args.cache_dir)
+        elif args.command == "verify":
+            failed = 0
+            for manifest in list_models(args.cache_dir):
+                problems = verify(model_dir(args.cache_dir, manifest["model"]))
+                failed += bool(problems)
+                print(f"{manifest['model']:<16} {'OK' if not problems else '; '.join(problems)}")
+            return 1 if failed else 0
+        elif args.command == "list":
+            for manifest in list_models(args.cache_dir):
+                print(f"{manifest['model']:<16} {manifest['size'] / 1e6:>8.1f} MB  {len(manifest['files'])} files"
+                      + (f"  {manifest['compute_type']}" if manifest.get("compute_type") else ""))
+        elif args.command == "pack":
+            pack(args.models, args.archive, args.cache_dir)
+        else:
+            for name in unpack(args.archive, args.cache_dir):
+                print(f"Extracted {name}")
+    except ModelCacheError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
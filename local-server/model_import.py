@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Clinote model import
+Converts a fine-tuned Hugging Face Whisper checkpoint to CTranslate2 at
+several quantization levels, registers each variant in the offline model
+cache, and compares the variants' speed, memory and word error rate on a
+local evaluation set so the cheapest one that meets the accuracy bar can
+be chosen.
+
+Usage:
+    python model_import.py convert ./whisper-medical --name medical
+    python model_import.py evaluate medical-int8 medical-int16 medical-float32 --eval-set eval/ --max-wer 0.12
+    python whisper_server.py --model medical-int8
+
+Conversion needs the transformers and torch packages; evaluation and the
+server do not.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+
+import model_cache
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ("int8", "int8_float32", "int16", "float32")
+# Files the server needs next to model.bin (see model_cache.REQUIRED_FILES)
+COPY_FILES = ("tokenizer.json", "preprocessor_config.json")
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".mp4", ".webm", ".ogg", ".opus", ".flac")
+EVAL_BEAM_SIZE = 5
+
+def variant_name(name, quantization):
+    return f"{name}-{quantization}"
+
+def convert(checkpoint, name, quantizations=QUANTIZATIONS, cache_dir=model_cache.DEFAULT_CACHE_DIR):
+    """Convert a Whisper checkpoint once per quantization and register the results."""
+    from ctranslate2.converters import TransformersConverter
+    try:
+        # The converter loads the checkpoint with these but only fails once it is running
+        import torch
+        import transformers
+    except ImportError:
+        raise ImportError("Converting checkpoints needs the transformers and torch packages: "
+                          "pip install transformers torch")
+
+    copy_files = list(COPY_FILES)
+    if os.path.isdir(checkpoint):
+        missing = [f for f in copy_files if not os.path.exists(os.path.join(checkpoint, f))]
+        if "tokenizer.json" in missing:
+            raise model_cache.ModelCacheError(
+                f"{checkpoint} has no tokenizer.json; save the tokenizer with the checkpoint "
+                "(WhisperTokenizerFast.save_pretrained) so the server never fetches one"
+            )
+        copy_files = [f for f in copy_files if f not in missing]
+
+    paths = []
+    for quantization in quantizations:
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of: {', '.join(QUANTIZATIONS)}")
+        model_name = variant_name(name, quantization)
+        path = model_cache.model_dir(cache_dir, model_name)
+        started = time.perf_counter()
+        logger.info(f"Converting {checkpoint} to '{model_name}'")
+        TransformersConverter(checkpoint, copy_files=copy_files).convert(path, quantization=quantization, force=True)
+        manifest = model_cache.write_manifest(path, model_name, source=os.path.abspath(checkpoint)
+                                              if os.path.exists(checkpoint) else checkpoint,
+                                              compute_type=quantization)
+        logger.info(f"Registered '{model_name}': {manifest['size'] / 1e6:.1f} MB "
+                    f"in {time.perf_counter() - started:.0f}s")
+        paths.append(path)
+    return paths
+
+def load_eval_set(path):
+    """(audio path, reference text) pairs: audio files with a .txt transcript beside them,
+    or a JSONL manifest of {"audio": ..., "text": ...} lines."""
+    pairs = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            stem, extension = os.path.splitext(name)
+            reference = os.path.join(path, stem + ".txt")
+            if extension.lower() in AUDIO_EXTENSIONS and os.path.exists(reference):
+                with open(reference, encoding="utf-8") as f:
+                    pairs.append((os.path.join(path, name), f.read()))
+    else:
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    pairs.append((os.path.join(base, item["audio"]), item["text"]))
+    return pairs
+
+def normalize_words(text):
+    """Lowercase words without punctuation, so WER counts wording only."""
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance between two texts and the reference length."""
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1], len(ref)
+
+def peak_rss_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def evaluate_variant(path, compute_type, pairs, cpu_threads=0):
+    """Measure one model on the eval set; runs in its own process so memory is its own."""
+    from faster_whisper import WhisperModel, decode_audio
+
+    rss_before = peak_rss_bytes()
+    started = time.perf_counter()
+    model = WhisperModel(path, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads,
+                         local_files_only=True)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = peak_rss_bytes()
+
+    errors = words = 0
+    audio_seconds = inference_seconds = 0.0
+    for audio_path, reference in pairs:
+        audio = decode_audio(audio_path)
+        started = time.perf_counter()
+        segments, _ = model.transcribe(audio, beam_size=EVAL_BEAM_SIZE)
+        hypothesis = " ".join(segment.text for segment in segments)
+        inference_seconds += time.perf_counter() - started
+        audio_seconds += len(audio) / 16000
+        file_errors, file_words = word_errors(reference, hypothesis)
+        errors += file_errors
+        words += file_words
+    return {
+        "load_ms": round(load_seconds * 1000, 1),
+        "model_memory_mb": round((rss_loaded - rss_before) / 1e6, 1),
+        "peak_rss_mb": round(peak_rss_bytes() / 1e6, 1),
+        "rtf": round(inference_seconds / audio_seconds, 4) if audio_seconds else None,
+        "wer": round(errors / words, 4) if words else None,
+        "audio_seconds": round(audio_seconds, 1),
+    }
+
+def evaluate(model_names, eval_set, cache_dir=model_cache.DEFAULT_CACHE_DIR, max_wer=None, cpu_threads=0):
+    """Compare registered variants and pick the cheapest one within max_wer."""
+    pairs = load_eval_set(eval_set)
+    if not pairs:
+        raise model_cache.ModelCacheError(f"No audio with reference transcripts in {eval_set}")
+    rows = []
+    # A fresh process per variant, so one model's memory does not inflate the next
+    context = multiprocessing.get_context("spawn")
+    for model_name in model_names:
+        path, info = model_cache.resolve(model_name, cache_dir)
+        compute_type = info.get("compute_type") or "default"
+        logger.info(f"Evaluating '{model_name}' ({compute_type}) on {len(pairs)} recordings")
+        with context.Pool(1) as pool:
+            result = pool.apply(evaluate_variant, (path, compute_type, pairs, cpu_threads))
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in model_cache.model_files(path))
+        rows.append(dict({"model": model_name, "compute_type": compute_type, "size_mb": round(size / 1e6, 1)}, **result))
+
+    # A variant with no measured speed cannot be compared, so it is never picked
+    eligible = [row for row in rows if row["rtf"] is not None
+                and (max_wer is None or (row["wer"] is not None and row["wer"] <= max_wer))]
+    # Cheapest: fastest, then smallest in memory
+    best = min(eligible, key=lambda row: (row["rtf"], row["model_memory_mb"]), default=None)
+    return {
+        "eval_set": eval_set,
+        "recordings": len(pairs),
+        "max_wer": max_wer,
+        "variants": rows,
+        "recommended": best["model"] if best else None,
+    }
+
+def print_report(report):
+    print(f"{'model':<28} {'type':<13} {'size MB':>8} {'mem MB':>8} {'RTF':>7} {'WER':>7}")
+    for row in report["variants"]:
+        marker = "  ← recommended" if row["model"] == report["recommended"] else ""
+        wer = f"{row['wer']:.2%}" if row["wer"] is not None else "-"
+        print(f"{row['model']:<28} {row['compute_type']:<13} {row['size_mb']:>8.1f} "
+              f"{row['model_memory_mb']:>8.1f} {row['rtf'] or 0:>7.3f} {wer:>7}{marker}")
+    if report["recommended"] is None and report["max_wer"] is not None:
+        print(f"No variant meets the WER bar of {report['max_wer']:.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and quantize custom Whisper models for Clinote")
+    parser.add_argument("--cache-dir", default=model_cache.DEFAULT_CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert a Hugging Face checkpoint and register it")
+    convert_parser.add_argument("checkpoint", help="Checkpoint directory or hub id")
+    convert_parser.add_argument("--name", required=True, help="Registered names are <name>-<quantization>")
+    convert_parser.add_argument("--quantizations", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    evaluate_parser = subparsers.add_parser("evaluate", help="Compare RTF, memory and WER of registered models")
+    evaluate_parser.add_argument("models", nargs="+")
+    evaluate_parser.add_argument("--eval-set", required=True,
+                                 help="Directory of audio files with .txt references, or a JSONL manifest")
+    evaluate_parser.add_argument("--max-wer", type=float, help="Accuracy bar, e.g. 0.12 for 12%% WER")
+    evaluate_parser.add_argument("--cpu-threads", type=int, default=0)
+    evaluate_parser.add_argument("--report", metavar="PATH", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        if args.command == "convert":
+            convert(args.checkpoint, args.name, args.quantizations, args.cache_dir)
+        else:
+            report = evaluate(args.models, args.eval_set, args.cache_dir, args.max_wer, args.cpu_threads)
+            print_report(report)
+            if args.report:
+                with open(args.report, "w") as f:
+                    json.dump(report, f, indent=2)
+    except (model_cache.ModelCacheError, ImportError) as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
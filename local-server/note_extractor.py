@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Clinote local note extraction
+Builds the structured clinical summary used by the extension's local mode
+(chiefComplaint, hpi, ros, assessment, plan, medications, followUp) from a
+transcript in one pass of a compiled medical-lexicon automaton.
+"""
+
+import re
+
+from automaton import AhoCorasick, tokenize
+
+NOT_SPECIFIED = "Not specified"
+
+# Summary sections in the order the extension displays them
+SECTIONS = ["chiefComplaint", "hpi", "ros", "assessment", "plan", "medications", "followUp"]
+
+# Cue phrases that place a sentence in a section, with a weight. Spoken
+# section headers weigh more than conversational cues.
+SECTION_CUES = {
+    "chiefComplaint": {
+        3: ["chief complaint", "reason for visit", "reason for the visit"],
+        2: ["here for", "here today for", "in today for", "came in for", "coming in for",
+            "presents with", "presenting with", "complains of", "complaining of",
+            "main concern", "what brings you in", "brings you in"],
+    },
+    "hpi": {
+        3: ["history of present illness", "hpi"],
+        1: ["started", "began", "for the past", "for about", "since", "onset", "ago",
+            "getting worse", "gotten worse", "worse when", "better when", "comes and goes",
+            "on and off", "first noticed", "been having", "has been", "hurts", "pain is"],
+    },
+    "ros": {
+        3: ["review of systems", "ros"],
+        1: ["denies", "no history of", "negative for", "any fever", "any chest pain"],
+    },
+    "assessment": {
+        3: ["assessment", "impression", "assessment and plan"],
+        2: ["diagnosis", "diagnosed with", "consistent with", "differential", "likely",
+            "most likely", "suspect", "suspicious for", "rule out", "concerning for"],
+        1: ["i think", "looks like", "appears to be", "exam shows", "on exam"],
+    },
+    "plan": {
+        3: ["plan", "treatment plan"],
+        2: ["we will", "we'll", "i will", "i'll", "going to order", "i'm going to",
+            "let's", "recommend", "refer", "referral", "order", "ordering", "prescribe",
+            "schedule", "start you on", "increase", "decrease", "discontinue", "stop taking"],
+    },
+    "medications": {
+        3: ["medications", "medication list", "current medications"],
+        1: ["taking", "prescription", "refill", "dose", "dosage", "milligrams", "mg",
+            "twice a day", "once a day", "daily", "as needed"],
+    },
+    "followUp": {
+        3: ["follow up", "followup"],
+        2: ["come back", "return in", "return if", "see you in", "recheck", "check back",
+            "in two weeks", "in a week", "in a month", "in three months", "next visit",
+            "go to the er", "go to the emergency room", "call us if", "if it gets worse",
+            "if symptoms worsen"],
+    },
+}
+
+# Priority when a sentence scores equally for several sections
+SECTION_PRIORITY = ["followUp", "plan", "assessment", "medications", "chiefComplaint", "ros", "hpi"]
+
+# Common outpatient medications, matched by generic and brand name
+MEDICATIONS = {
+    "acetaminophen": ["acetaminophen", "tylenol"],
+    "albuterol": ["albuterol", "proair", "ventolin"],
+    "alprazolam": ["alprazolam", "xanax"],
+    "amlodipine": ["amlodipine", "norvasc"],
+    "amoxicillin": ["amoxicillin", "augmentin"],
+    "apixaban": ["apixaban", "eliquis"],
+    "aripiprazole": ["aripiprazole", "abilify"],
+    "aspirin": ["aspirin", "baby aspirin"],
+    "atorvastatin": ["atorvastatin", "lipitor"],
+    "azithromycin": ["azithromycin", "z pack", "zithromax"],
+    "bupropion": ["bupropion", "wellbutrin"],
+    "carvedilol": ["carvedilol", "coreg"],
+    "cephalexin": ["cephalexin", "keflex"],
+    "cetirizine": ["cetirizine", "zyrtec"],
+    "ciprofloxacin": ["ciprofloxacin", "cipro"],
+    "citalopram": ["citalopram", "celexa"],
+    "clopidogrel": ["clopidogrel", "plavix"],
+    "cyclobenzaprine": ["cyclobenzaprine", "flexeril"],
+    "doxycycline": ["doxycycline"],
+    "duloxetine": ["duloxetine", "cymbalta"],
+    "empagliflozin": ["empagliflozin", "jardiance"],
+    "escitalopram": ["escitalopram", "lexapro"],
+    "famotidine": ["famotidine", "pepcid"],
+    "fluoxetine": ["fluoxetine", "prozac"],
+    "fluticasone": ["fluticasone", "flonase"],
+    "furosemide": ["furosemide", "lasix"],
+    "gabapentin": ["gabapentin", "neurontin"],
+    "glipizide": ["glipizide"],
+    "hydrochlorothiazide": ["hydrochlorothiazide", "hctz"],
+    "hydrocodone": ["hydrocodone", "norco", "vicodin"],
+    "ibuprofen": ["ibuprofen", "advil", "motrin"],
+    "insulin": ["insulin", "lantus", "humalog", "novolog", "insulin glargine"],
+    "levothyroxine": ["levothyroxine", "synthroid"],
+    "lisinopril": ["lisinopril", "zestril", "prinivil"],
+    "loratadine": ["loratadine", "claritin"],
+    "lorazepam": ["lorazepam", "ativan"],
+    "losartan": ["losartan", "cozaar"],
+    "meloxicam": ["meloxicam", "mobic"],
+    "metformin": ["metformin", "glucophage"],
+    "methylprednisolone": ["methylprednisolone", "medrol"],
+    "metoprolol": ["metoprolol", "lopressor", "toprol"],
+    "montelukast": ["montelukast", "singulair"],
+    "naproxen": ["naproxen", "aleve"],
+    "nitroglycerin": ["nitroglycerin", "nitro"],
+    "omeprazole": ["omeprazole", "prilosec"],
+    "ondansetron": ["ondansetron", "zofran"],
+    "oxycodone": ["oxycodone", "percocet"],
+    "pantoprazole": ["pantoprazole", "protonix"],
+    "prednisone": ["prednisone"],
+    "quetiapine": ["quetiapine", "seroquel"],
+    "rosuvastatin": ["rosuvastatin", "crestor"],
+    "semaglutide": ["semaglutide", "ozempic", "wegovy"],
+    "sertraline": ["sertraline", "zoloft"],
+    "simvastatin": ["simvastatin", "zocor"],
+    "spironolactone": ["spironolactone", "aldactone"],
+    "sumatriptan": ["sumatriptan", "imitrex"],
+    "tamsulosin": ["tamsulosin", "flomax"],
+    "tramadol": ["tramadol", "ultram"],
+    "trazodone": ["trazodone", "desyrel"],
+    "valacyclovir": ["valacyclovir", "valtrex"],
+    "venlafaxine": ["venlafaxine", "effexor"],
+    "warfarin": ["warfarin", "coumadin"],
+}
+
+# Symptoms grouped by review-of-systems category
+SYMPTOMS = {
+    "Constitutional": ["fever", "fevers", "chills", "fatigue", "tired", "weight loss", "weight gain",
+                       "night sweats", "malaise", "loss of appetite"],
+    "HEENT": ["sore throat", "ear pain", "runny nose", "congestion", "blurred vision",
+              "vision changes", "sinus pressure", "hearing loss"],
+    "Cardiovascular": ["chest pain", "chest pressure", "chest tightness", "palpitations",
+                       "racing heart", "leg swelling", "swelling in my legs", "edema"],
+    "Respiratory": ["shortness of breath", "short of breath", "trouble breathing", "dyspnea",
+                    "cough", "coughing", "wheezing"],
+    "Gastrointestinal": ["nausea", "vomiting", "diarrhea", "constipation", "abdominal pain",
+                         "stomach pain", "heartburn", "blood in stool", "bloating"],
+    "Genitourinary": ["burning with urination", "painful urination", "dysuria", "frequent urination",
+                      "blood in urine", "urinary frequency"],
+    "Musculoskeletal": ["back pain", "joint pain", "knee pain", "shoulder pain", "neck pain",
+                        "muscle aches", "stiffness", "hip pain"],
+    "Skin": ["rash", "itching", "itchy", "hives", "lesion", "mole", "bruising"],
+    "Neurological": ["headache", "headaches", "migraine", "dizziness", "dizzy", "lightheaded",
+                     "numbness", "tingling", "weakness", "seizure", "fainting", "passed out"],
+    "Psychiatric": ["anxiety", "anxious", "depression", "depressed", "insomnia", "trouble sleeping",
+                    "panic attacks", "suicidal", "hearing voices"],
+}
+
+# Focus terms from the extension's specialty templates (getSpecialtyTemplate),
+# mapped to the section they most often belong in
+SPECIALTY_TERMS = {
+    "primary-care": {
+        "hpi": ["blood pressure", "blood sugar", "diabetes", "hypertension", "smoking", "diet", "exercise"],
+        "plan": ["vaccination", "vaccine", "flu shot", "screening", "colonoscopy", "mammogram",
+                 "lab work", "blood work", "smoking cessation", "referral"],
+    },
+    "psychiatry": {
+        "hpi": ["mood", "affect", "sleep", "appetite", "stressors", "substance use", "alcohol",
+                "self harm", "suicidal ideation", "homicidal ideation", "previous episodes"],
+        "assessment": ["mental status", "thought process", "cognition", "major depressive disorder",
+                       "generalized anxiety disorder", "bipolar", "psychosis"],
+        "plan": ["therapy", "counseling", "cbt", "safety plan", "medication management"],
+    },
+    "cardiology": {
+        "hpi": ["exertion", "dyspnea on exertion", "orthopnea", "family history of heart disease",
+                "stent", "bypass", "heart attack"],
+        "plan": ["ecg", "ekg", "echocardiogram", "echo", "stress test", "holter monitor",
+                 "cardiac catheterization", "lipid panel"],
+    },
+    "dermatology": {
+        "hpi": ["sun exposure", "sunscreen", "skin care", "itching", "spreading"],
+        "assessment": ["border", "borders", "irregular", "asymmetric", "eczema", "psoriasis",
+                       "dermatitis", "melanoma", "basal cell"],
+        "plan": ["biopsy", "topical", "cream", "ointment", "cryotherapy", "excision"],
+    },
+    "pediatrics": {
+        "hpi": ["milestones", "development", "school", "daycare", "feeding", "behavior"],
+        "assessment": ["growth", "percentile", "height", "weight", "head circumference"],
+        "plan": ["immunizations", "vaccines", "anticipatory guidance", "developmental screening"],
+    },
+    "orthopedics": {
+        "hpi": ["injury", "fell", "fall", "twisted", "range of motion", "swelling", "locking", "giving way"],
+        "assessment": ["fracture", "sprain", "strain", "tear", "tendinitis", "arthritis"],
+        "plan": ["x ray", "xray", "mri", "physical therapy", "brace", "splint", "cast", "surgery", "injection"],
+    },
+    "neurology": {
+        "hpi": ["seizure", "aura", "numbness", "tingling", "weakness", "coordination", "memory"],
+        "assessment": ["cranial nerves", "reflexes", "localization", "neuropathy", "stroke", "tia"],
+        "plan": ["mri of the brain", "ct scan", "eeg", "emg", "nerve conduction", "neurology referral"],
+    },
+    "emergency-medicine": {
+        "hpi": ["trauma", "accident", "sudden onset", "worst headache", "loss of consciousness"],
+        "assessment": ["vital signs", "hemodynamically stable", "unstable", "rule out", "emergent"],
+        "plan": ["admit", "admission", "discharge", "transfer", "iv fluids", "pain management", "observation"],
+    },
+}
+
+NEGATION_CUES = ["denies", "deny", "no", "not", "without", "negative for", "never"]
+# Words that end the scope of a negation within a sentence
+CLAUSE_BREAKS = ["but", "however", "although", "except", "though"]
+
+DOSE_UNITS = {"mg", "milligram", "milligrams", "mcg", "micrograms", "units", "unit", "ml", "puffs", "puff"}
+
+# Sentences end at ., ! or ? unless followed by a non-space ("2.5 mg"), or at a line break
+SENTENCE_PATTERN = re.compile(r"(?:[^.!?\n]|[.!?](?=\S))+[.!?]*")
+
+# Cap sections that collect many sentences so notes stay readable
+MAX_SECTION_SENTENCES = 6
+
+def build_automaton():
+    """Compile every cue, medication, symptom and specialty term into one automaton."""
+    automaton = AhoCorasick()
+    for section, weighted in SECTION_CUES.items():
+        for weight, phrases in weighted.items():
+            for phrase in phrases:
+                automaton.add(phrase, ("section", section, weight))
+    for name, phrases in MEDICATIONS.items():
+        for phrase in phrases:
+            automaton.add(phrase, ("medication", name, None))
+    for system, phrases in SYMPTOMS.items():
+        for phrase in phrases:
+            automaton.add(phrase, ("symptom", system, phrase))
+    for specialty, sections in SPECIALTY_TERMS.items():
+        for section, phrases in sections.items():
+            for phrase in phrases:
+                automaton.add(phrase, ("specialty", specialty, section))
+    for phrase in NEGATION_CUES:
+        automaton.add(phrase, ("negation", None, None))
+    for phrase in CLAUSE_BREAKS:
+        automaton.add(phrase, ("clause", None, None))
+    return automaton.build()
+
+# Built once when the server starts
+NOTE_AUTOMATON = build_automaton()
+
+def split_sentences(text):
+    """Return (start, end) character spans of the sentences in text."""
+    spans = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        while start < end and text[start].isspace():
+            start += 1
+        if start < end:
+            spans.append((start, end))
+    return spans
+
+def find_dose(tokens, index):
+    """Return a dose such as '10 mg' right after a medication mention, or None."""
+    window = tokens[index:index + 3]
+    for offset, (token, _, _) in enumerate(window):
+        if token.isdigit() and offset + 1 < len(window) and window[offset + 1][0] in DOSE_UNITS:
+            unit = window[offset + 1][0]
+            return f"{token} {'mg' if unit.startswith('milligram') else unit}"
+    return None
+
+def summarize(transcript, specialty="primary-care"):
+    """Build the local-mode clinical summary for a transcript.
+
+    The transcript is tokenized once and run through NOTE_AUTOMATON in a
+    single pass; each match is attributed to the sentence containing it,
+    and sentences are then assigned to their highest-scoring section.
+    """
+    sentences = split_sentences(transcript)
+    tokens = tokenize(transcript)
+
+    scores = [dict() for _ in sentences]
+    negated = [False] * len(sentences)
+    symptoms = {}
+    medications = {}
+
+    # Map token index to sentence index with a pointer that only moves forward
+    token_sentence = []
+    sentence_index = 0
+    for _, start, _ in tokens:
+        while sentence_index < len(sentences) - 1 and start >= sentences[sentence_index][1]:
+            sentence_index += 1
+        token_sentence.append(sentence_index)
+
+    for start, end, (kind, key, detail) in NOTE_AUTOMATON.iter_matches(tokens):
+        index = token_sentence[start]
+        sentence_scores = scores[index]
+        if kind == "section":
+            sentence_scores[key] = sentence_scores.get(key, 0) + detail
+        elif kind == "negation":
+            negated[index] = True
+        elif kind == "clause":
+            negated[index] = False
+        elif kind == "symptom":
+            label = symptoms.setdefault(key, {})
+            # Later mentions of a symptom cannot un-negate an earlier denial
+            label.setdefault(detail, not negated[index])
+            sentence_scores["hpi"] = sentence_scores.get("hpi", 0) + 1
+        elif kind == "medication":
+            dose = find_dose(tokens, end)
+            if key not in medications or (dose and not medications[key]):
+                medications[key] = dose
+            sentence_scores["medications"] = sentence_scores.get("medications", 0) + 1
+        elif kind == "specialty" and key == specialty:
+            sentence_scores[detail] = sentence_scores.get(detail, 0) + 1
+
+    sections = {section: [] for section in SECTIONS}
+    for index, sentence_scores in enumerate(scores):
+        if not sentence_scores:
+            continue
+        best = max(sentence_scores.values())
+        for section in SECTION_PRIORITY:
+            if sentence_scores.get(section) == best:
+                sections[section].append(index)
+                break
+
+    def text_of(index):
+        start, end = sentences[index]
+        return transcript[start:end].strip()
+
+    summary = {}
+    for section in ("hpi", "assessment", "plan", "followUp"):
+        summary[section] = " ".join(text_of(i) for i in sections[section][:MAX_SECTION_SENTENCES]) or NOT_SPECIFIED
+
+    if sections["chiefComplaint"]:
+        index = sections["chiefComplaint"][0]
+        # "What brings you in today?" is answered by the next sentence
+        if text_of(index).endswith("?") and index + 1 < len(sentences):
+            index += 1
+        summary["chiefComplaint"] = text_of(index)
+    elif sections["hpi"]:
+        summary["chiefComplaint"] = text_of(sections["hpi"][0])
+    else:
+        summary["chiefComplaint"] = NOT_SPECIFIED
+
+    ros_lines = []
+    for system, found in symptoms.items():
+        positives = [symptom for symptom, present in found.items() if present]
+        negatives = [symptom for symptom, present in found.items() if not present]
+        parts = []
+        if positives:
+            parts.append("reports " + ", ".join(positives))
+        if negatives:
+            parts.append("denies " + ", ".join(negatives))
+        ros_lines.append(f"{system}: {'; '.join(parts)}")
+    summary["ros"] = ". ".join(ros_lines) or NOT_SPECIFIED
+
+    if medications:
+        summary["medications"] = "; ".join(
+            f"{name} {dose}" if dose else name for name, dose in medications.items()
+        )
+    else:
+        summary["medications"] = " ".join(text_of(i) for i in sections["medications"][:MAX_SECTION_SENTENCES]) or NOT_SPECIFIED
+
+    return {section: summary[section] for section in SECTIONS}
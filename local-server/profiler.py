@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Clinote on-demand profiler
+Profiles the next N requests or T seconds of a running server without a
+debugger: a sampling profiler that records collapsed stacks (the input
+format of flamegraph.pl and speedscope), an optional cProfile mode for exact
+call counts, and optional tracemalloc snapshots of where memory was allocated.
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+MODES = ("sample", "cprofile")
+# Frames kept per tracemalloc allocation traceback
+TRACEMALLOC_FRAMES = 25
+TOP_LIMIT = 30
+
+def frame_label(code):
+    """Name a frame as function (file:line) for stacks and tables."""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class ProfileSession:
+    """One profiling run over the next max_requests requests or seconds seconds.
+
+    Request threads call enter_request()/exit_request() around each request;
+    only those threads are sampled, so idle server threads do not dilute
+    the profile. stages is a list of (stage, substrings) used to attribute
+    each sample to the first matching frame from the leaf upwards.
+    """
+
+    def __init__(self, mode="sample", max_requests=None, seconds=None, interval=0.005,
+                 trace_memory=False, stages=()):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.max_requests = max_requests
+        self.seconds = seconds
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.stages = stages
+        self.started_at = None
+        self.finished_at = None
+        self.requests_started = 0
+        self.requests_profiled = 0
+        self.samples = 0
+        self._stacks = Counter()
+        self._stats = None
+        self._threads = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._memory_start = None
+        self._memory_diff = None
+        self._started_tracemalloc = False
+
+    @property
+    def running(self):
+        return self.started_at is not None and not self._done.is_set()
+
+    def start(self):
+        self.started_at = time.time()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._memory_start = tracemalloc.take_snapshot()
+        threading.Thread(target=self._run, name="profiler", daemon=True).start()
+        return self
+
+    def _run(self):
+        deadline = time.monotonic() + self.seconds if self.seconds else None
+        while not self._done.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop()
+                break
+            if self.mode == "sample":
+                self._sample()
+            self._done.wait(self.interval if self.mode == "sample" else 0.1)
+
+    def _sample(self):
+        with self._lock:
+            threads = list(self._threads)
+        if not threads:
+            return
+        frames = sys._current_frames()
+        for ident in threads:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            with self._lock:
+                self._stacks[";".join(stack)] += 1
+                self.samples += 1
+
+    def enter_request(self):
+        """Start profiling the calling thread's request; False once the quota is used."""
+        with self._lock:
+            if self._done.is_set() or (self.max_requests and self.requests_started >= self.max_requests):
+                return False
+            # cProfile hooks are interpreter-wide on newer Pythons, so profile one request at a time
+            if self.mode == "cprofile" and self._threads:
+                return False
+            self.requests_started += 1
+            self._threads[threading.get_ident()] = time.monotonic()
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler or debugger already owns the hooks
+                with self._lock:
+                    self._threads.pop(threading.get_ident(), None)
+                return False
+            self._local.profile = profile
+        return True
+
+    def exit_request(self):
+        profile = getattr(self._local, "profile", None)
+        if profile is not None:
+            profile.disable()
+            self._local.profile = None
+        with self._lock:
+            if self._threads.pop(threading.get_ident(), None) is None:
+                return
+            self.requests_profiled += 1
+            if profile is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+            finished = self.max_requests and self.requests_profiled >= self.max_requests
+        if finished:
+            self.stop()
+
+    def stop(self):
+        """End the session and take the closing memory snapshot."""
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._done.set()
+            self.finished_at = time.time()
+        if self.trace_memory and self._memory_start is not None:
+            snapshot = tracemalloc.take_snapshot()
+            self._memory_diff = snapshot.compare_to(self._memory_start, "lineno")
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+    def collapsed(self):
+        """Collapsed stacks, one "frame;frame;frame count" line per stack.
+
+        Raises ValueError in cprofile mode, which records call counts rather
+        than stacks.
+        """
+        if self.mode != "sample":
+            raise ValueError(f"Collapsed stacks need mode 'sample'; this session used '{self.mode}'")
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def _sample_tables(self):
+        own = Counter()
+        total = Counter()
+        stages = Counter()
+        for stack, count in self._stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+            stages[self._stage(frames)] += count
+        samples = sum(self._stacks.values()) or 1
+        top = [
+            {
+                "function": label,
+                "self_percent": round(100 * own[label] / samples, 1),
+                "total_percent": round(100 * total[label] / samples, 1),
+                "samples": own[label],
+            }
+            for label, _ in own.most_common(TOP_LIMIT)
+        ]
+        breakdown = {stage: round(100 * count / samples, 1) for stage, count in stages.most_common()}
+        return top, breakdown
+
+    def _stage(self, frames):
+        for label in reversed(frames):
+            for stage, patterns in self.stages:
+                if any(pattern in label for pattern in patterns):
+                    return stage
+        return "other"
+
+    def _cprofile_table(self):
+        if self._stats is None:
+            return []
+        rows = sorted(self._stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        return [
+            {
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "self_seconds": round(own, 4),
+                "total_seconds": round(cumulative, 4),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in rows[:TOP_LIMIT]
+        ]
+
+    def result(self):
+        """Summary for the JSON API."""
+        with self._lock:
+            body = {
+                "status": "running" if self.running else "done",
+                "mode": self.mode,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "max_requests": self.max_requests,
+                "seconds": self.seconds,
+                "requests_profiled": self.requests_profiled,
+            }
+            if self.mode == "sample":
+                body["samples"] = self.samples
+                body["interval_ms"] = round(self.interval * 1000, 2)
+                body["top"], body["stages"] = self._sample_tables()
+            else:
+                body["top"] = self._cprofile_table()
+        if self._memory_diff is not None:
+            body["allocations"] = [
+                {
+                    "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size / 1024, 1),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count,
+                }
+                for stat in self._memory_diff[:TOP_LIMIT]
+            ]
+        return body
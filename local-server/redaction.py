@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Clinote PHI redaction
+Masks names, medical record numbers, phone numbers, dates, addresses and
+other identifiers in transcript segments, stored transcripts and log
+records, so they can be kept and logged without the patient's identity.
+
+Each segment is scanned once with the word-token automaton, for cue
+phrases such as "my name is", "Dr." or "MRN" and for any known names,
+and once with a single compiled regular expression for identifiers that
+stand on their own (phone numbers, dates, SSNs, e-mail addresses, street
+addresses). Matches are checked before they are masked: a phone number
+needs a valid area code and a date needs a real month and day.
+
+Usage:
+    python redaction.py "Mr. Alvarez, MRN 00482913, call 415-555-0132"
+    python redaction.py --benchmark
+"""
+
+import re
+import sys
+import time
+import logging
+import argparse
+
+from automaton import AhoCorasick, WORD_PATTERN
+from note_extractor import MEDICATIONS, SYMPTOMS, SPECIALTY_TERMS
+
+# Phrases whose next words are an identifier of the given kind
+CUES = {
+    "name": ("mr", "mrs", "ms", "miss", "dr", "doctor", "my name is", "name is", "patient name",
+             "patient's name", "his name is", "her name is"),
+    "mrn": ("mrn", "m r n", "medical record number", "medical record", "record number", "chart number",
+            "account number", "member id", "insurance id", "policy number"),
+    "date": ("date of birth", "dob", "d o b", "birthday is", "born on", "birth date"),
+    "phone": ("phone number", "phone number is", "cell", "cell number", "call me at", "reach me at",
+              "callback number", "fax"),
+    "address": ("address is", "lives at", "i live at", "we live at", "home address"),
+    "ssn": ("social security number", "social security", "ssn", "s s n"),
+}
+
+# What each kind of identifier becomes
+MASKS = {
+    "name": "[NAME]", "mrn": "[MRN]", "date": "[DATE]", "phone": "[PHONE]", "address": "[ADDRESS]",
+    "ssn": "[SSN]", "email": "[EMAIL]", "age": "[AGE]",
+}
+
+MONTHS = ("January", "February", "March", "April", "May", "June", "July", "August", "September",
+          "October", "November", "December", "Jan", "Feb", "Mar", "Apr", "Jun", "Jul", "Aug", "Sep",
+          "Sept", "Oct", "Nov", "Dec")
+STREET_SUFFIXES = ("street", "st", "avenue", "ave", "road", "rd", "boulevard", "blvd", "lane", "ln",
+                   "drive", "dr", "court", "ct", "way", "place", "pl", "terrace", "circle", "parkway",
+                   "highway", "hwy")
+# Months must be capitalised, so "may" and "mar" in ordinary speech are left alone
+_MONTH = "(?-i:" + "|".join(sorted(MONTHS, key=len, reverse=True)) + ")"
+_SUFFIX = "|".join(sorted(STREET_SUFFIXES, key=len, reverse=True))
+
+# Identifiers found without a cue, as one alternation scanned once per segment
+PATTERNS = re.compile(
+    r"(?P<email>\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b)"
+    r"|(?P<ssn>\b(?P<ssn_area>\d{3})-(?P<ssn_group>\d{2})-(?P<ssn_serial>\d{4})\b)"
+    r"|(?P<phone>(?<![\d/])(?:\+?1[\s.-]?)?\(?(?P<area>[2-9]\d{2})\)?[\s.-]?[2-9]\d{2}[\s.-]?\d{4}\b)"
+    r"|(?P<date_numeric>\b(?:(?P<year_first>\d{4})-(?P<iso_month>\d{1,2})-(?P<iso_day>\d{1,2})"
+    r"|(?P<month>\d{1,2})[/.-](?P<day>\d{1,2})[/.-](?P<year>\d{2}|\d{4}))\b)"
+    rf"|(?P<date_words>\b(?:(?:{_MONTH})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?(?:,?\s+\d{{4}})?"
+    rf"|\d{{1,2}}(?:st|nd|rd|th)?\s+of\s+(?:{_MONTH})(?:,?\s+\d{{4}})?)\b)"
+    rf"|(?P<address>\b\d{{1,6}}\s+(?:[A-Z][\w'-]*\s+){{1,3}}(?:{_SUFFIX})\b\.?"
+    r"(?:,?\s+(?:apartment|apt|unit|suite|#)\.?\s*\w+)?)"
+    r"|(?P<age>\b(?:9\d|1[01]\d)[\s-]years?[\s-]old\b)",
+    re.IGNORECASE,
+)
+# What follows a cue, matched from the cue's end
+VALUES_AFTER_CUE = {
+    # Capitalised words: "Dr. Patel", "my name is Maria Lopez"
+    "name": re.compile(r"[\s.,:]*(?P<value>[A-Z][a-zA-Z'-]+(?:\s+[A-Z]\b\.?)?(?:\s+[A-Z][a-zA-Z'-]+)?)"),
+    # One alphanumeric token ("A12B345") or digit groups ("004 829 13", "MR-0048-2913"), never the words after it
+    "mrn": re.compile(r"[\s.,:#]*(?:is\s+|number\s+)?"
+                      r"(?P<value>(?:[A-Z]{1,3}-?)?\d(?:[\d-]|\s(?=\d)){2,18}\d|(?=[A-Z]*\d)[A-Z0-9]{4,20})\b",
+                      re.IGNORECASE),
+    "date": re.compile(r"[\s.,:]*(?:is\s+)?(?P<value>\d{1,2}[\s/.-]\d{1,2}[\s/.-]\d{2,4}|\d{6,8})\b"),
+    "phone": re.compile(r"[\s.,:]*(?:is\s+)?(?P<value>\(?\d[\d\s().-]{5,16}\d)\b"),
+    "address": re.compile(r"[\s.,:]*(?P<value>\d{1,6}(?:\s+[\w'.-]+){1,6}?)(?=[,;.!?]|\s+(?:and|in|with)\b|$)"),
+    "ssn": re.compile(r"[\s.,:]*(?:number\s+)?(?:is\s+)?(?P<value>\d{3}[\s-]?\d{2}[\s-]?\d{4})\b",
+                      re.IGNORECASE),
+}
+# Digits a value needs before it is masked
+MIN_DIGITS = {"mrn": 4, "phone": 7, "date": 6, "ssn": 9}
+# Words after a name cue that are not names ("this is Tuesday", "Dr. Appointment")
+NOT_NAMES = frozenset(("mr", "mrs", "ms", "miss", "dr", "doctor", "i", "it", "the", "a", "an", "my", "your",
+                       "we", "he", "she", "they", "monday", "tuesday", "wednesday", "thursday", "friday",
+                       "saturday", "sunday", "today", "not", "no", "yes", "okay", "ok"))
+# Drug, symptom and specialty words from the note lexicons, which are not names either ("Dr. Metformin")
+CLINICAL_WORDS = frozenset(
+    word
+    for phrases in [*MEDICATIONS.values(), *SYMPTOMS.values(),
+                    *(terms for sections in SPECIALTY_TERMS.values() for terms in sections.values())]
+    for phrase in phrases
+    for word in phrase.split()
+)
+
+TOKEN_PATTERN = re.compile(WORD_PATTERN.pattern, re.IGNORECASE)
+
+def valid_ssn(match):
+    area, group, serial = match.group("ssn_area"), match.group("ssn_group"), match.group("ssn_serial")
+    return area not in ("000", "666") and area[0] != "9" and group != "00" and serial != "0000"
+
+def valid_date(match):
+    if match.group("year_first"):
+        month, day = int(match.group("iso_month")), int(match.group("iso_day"))
+    else:
+        month, day = int(match.group("month")), int(match.group("day"))
+    return 1 <= month <= 12 and 1 <= day <= 31
+
+class Redactor:
+    """Find and mask PHI in text.
+
+    names is an optional list of known names (a clinic's patient roster,
+    say) masked wherever they appear, cue or not.
+    """
+
+    def __init__(self, names=()):
+        self.automaton = AhoCorasick()
+        for kind, phrases in CUES.items():
+            for phrase in phrases:
+                self.automaton.add(phrase, ("cue", kind))
+        for name in names:
+            self.automaton.add(name, ("known", "name"))
+        self.automaton.build()
+        self.counts = dict.fromkeys(MASKS, 0)
+
+    def find(self, text):
+        """(start, end, kind) character spans of PHI in text, sorted and non-overlapping."""
+        spans = []
+        tokens = [(m.group().lower(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+        for start, end, (source, kind) in self.automaton.iter_matches(tokens):
+            if source == "known":
+                spans.append((tokens[start][1], tokens[end - 1][2], kind))
+                continue
+            value = VALUES_AFTER_CUE[kind].match(text, tokens[end - 1][2])
+            if value is None:
+                continue
+            found = value.group("value")
+            value_start, value_end = value.span("value")
+            if kind == "name":
+                value_end = self.name_end(text, value_start, value_end)
+                if value_end is None:
+                    continue
+            elif sum(c.isdigit() for c in found) < MIN_DIGITS.get(kind, 0):
+                continue
+            spans.append((value_start, value_end, kind))
+        for match in PATTERNS.finditer(text):
+            kind = match.lastgroup
+            if kind == "ssn" and not valid_ssn(match):
+                continue
+            if kind == "date_numeric" and not valid_date(match):
+                continue
+            spans.append((match.start(), match.end(), "date" if kind.startswith("date") else kind))
+        if len(spans) < 2:
+            return spans
+        spans.sort()
+        merged = [spans[0]]
+        for start, end, kind in spans[1:]:
+            last_start, last_end, last_kind = merged[-1]
+            if start < last_end:
+                # Overlaps keep the longer match's kind
+                if end - start > last_end - last_start:
+                    last_kind = kind
+                merged[-1] = (last_start, max(end, last_end), last_kind)
+            else:
+                merged.append((start, end, kind))
+        return merged
+
+    @staticmethod
+    def name_end(text, start, end):
+        """End of the name in text[start:end], stopping at the first word that is not a name, or None."""
+        name_end = None
+        for word in TOKEN_PATTERN.finditer(text, start, end):
+            lowered = word.group().lower()
+            if lowered in NOT_NAMES or lowered in CLINICAL_WORDS:
+                break
+            name_end = word.end()
+        return name_end
+
+    def redact(self, text):
+        """text with every PHI span replaced by its mask, e.g. "[NAME]"."""
+        if not text:
+            return text
+        spans = self.find(text)
+        if not spans:
+            return text
+        parts = []
+        position = 0
+        for start, end, kind in spans:
+            parts.append(text[position:start])
+            parts.append(MASKS[kind])
+            self.counts[kind] += 1
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
+
+    def redact_segments(self, segments):
+        """Copies of transcript segments with their text redacted."""
+        return [dict(segment, text=self.redact(segment["text"])) for segment in segments]
+
+    def stats(self):
+        return {"redacted": dict(self.counts)}
+
+class RedactingFilter(logging.Filter):
+    """Logging filter that redacts each record's message before it is written.
+
+    Add it to handlers rather than loggers, so records from every module
+    pass through it. enabled can be switched off at runtime.
+    """
+
+    def __init__(self, redactor, enabled=True):
+        super().__init__()
+        self.redactor = redactor
+        self.enabled = enabled
+
+    def filter(self, record):
+        if self.enabled:
+            message = record.getMessage()
+            redacted = self.redactor.redact(message)
+            if redacted is not message:
+                record.msg, record.args = redacted, None
+        return True
+
+def load_names(path):
+    """Known names from a file with one name per line; # starts a comment."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+BENCHMARK_SEGMENTS = (
+    " Good morning, my name is Dr. Patel and I'll be seeing you today.",
+    " Can you confirm your date of birth? It's 03/14/1958.",
+    " Blood pressure is 142/88, heart rate 76, and the A1c came back at 7.2.",
+    " We'll start metformin 500 mg BID and recheck labs in 3 months.",
+    " Her MRN is 00482913 and the best callback number is 415-555-0132.",
+    " She lives at 1420 Maple Street, apartment 4B, with her daughter.",
+    " No chest pain, no shortness of breath, sleeping well most nights.",
+    " Follow up on March 3rd, 2025 or sooner if the swelling gets worse.",
+)
+# Conversational clinical speech runs at about 150 words a minute
+WORDS_PER_MINUTE = 150
+
+def benchmark(redactor, minutes=10, repeats=20):
+    """Time redact() over a synthetic transcript, one segment at a time."""
+    words_per_segment = sum(len(segment.split()) for segment in BENCHMARK_SEGMENTS) / len(BENCHMARK_SEGMENTS)
+    count = int(minutes * WORDS_PER_MINUTE / words_per_segment)
+    segments = [BENCHMARK_SEGMENTS[i % len(BENCHMARK_SEGMENTS)] for i in range(count)]
+    characters = sum(map(len, segments))
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for segment in segments:
+            redactor.redact(segment)
+        best = min(best, time.perf_counter() - started)
+    return {
+        "minutes": minutes,
+        "segments": count,
+        "characters": characters,
+        "segments_per_second": round(count / best),
+        "mb_per_second": round(characters / best / 1e6, 2),
+        "ms_per_minute": round(best * 1000 / minutes, 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Mask PHI in transcripts and logs")
+    parser.add_argument("text", nargs="*", help="Text to redact (default: read stdin)")
+    parser.add_argument("--names", metavar="PATH", help="File of known names, one per line")
+    parser.add_argument("--benchmark", action="store_true", help="Measure redaction throughput")
+    parser.add_argument("--minutes", type=float, default=10, help="Benchmark transcript length")
+    args = parser.parse_args()
+
+    redactor = Redactor(load_names(args.names) if args.names else ())
+    if args.benchmark:
+        result = benchmark(redactor, args.minutes)
+        print(f"⏱️  {result['ms_per_minute']:.3f} ms per minute of audio, "
+              f"{result['segments_per_second']} segments/s, {result['mb_per_second']} MB/s "
+              f"({result['segments']} segments, {result['characters']} characters)")
+        return 0
+    for line in ([" ".join(args.text)] if args.text else sys.stdin):
+        print(redactor.redact(line.rstrip("\n")))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Clinote LAN router
+Fronts several whisper servers so thin clinic laptops can share one strong
+machine. Backends are polled for health and queue depth, each request goes
+to the healthy backend with the least outstanding audio, client sessions
+stick to the backend that holds their pinned language, a request whose
+backend fails is retried on the next one, and cancelling a request reaches
+the backend that is running it. Background jobs are fetched from the
+backend that started them.
+"""
+
+import json
+import time
+import socket
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 2.0
+POLL_TIMEOUT = 2.0
+# Transcriptions can legitimately take minutes on a busy backend
+REQUEST_TIMEOUT = 300
+# Extra seconds a request may take per second of audio, so long recordings are not cut off
+REQUEST_TIMEOUT_PER_AUDIO_SECOND = 1.0
+# Consecutive failed polls before a backend is taken out of rotation
+UNHEALTHY_AFTER = 2
+# Audio-seconds charged for each request queued on a backend beyond its
+# workers, since the router cannot see how long those requests are
+QUEUED_REQUEST_SECONDS = 15.0
+STICKY_TTL = 4 * 3600
+MAX_STICKY_SESSIONS = 1000
+# Background jobs whose backend is remembered, oldest forgotten first
+MAX_REMEMBERED_JOBS = 1000
+
+# Statuses that mean "try another backend"; anything else is the answer
+RETRY_STATUSES = (502, 503, 504)
+# Headers that describe one connection and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+class NoBackendAvailable(Exception):
+    """Raised when every backend is down or has failed the request."""
+
+class Backend:
+    """One whisper server and what the router knows about its load."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = False
+        self.ready = False
+        self.failures = 0
+        self.workers = 1
+        self.queue_depth = 0
+        self.model_state = None
+        self.last_poll = None
+        self.last_error = None
+        # Requests and estimated audio-seconds this router has sent and not yet seen answered
+        self.outstanding = 0
+        self.outstanding_seconds = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def load(self):
+        """Estimated seconds of audio ahead of a new request, per worker."""
+        queued = max(0, self.queue_depth - self.outstanding) * QUEUED_REQUEST_SECONDS
+        return (self.outstanding_seconds + queued) / max(1, self.workers)
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ready": self.ready,
+            "model_state": self.model_state,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "outstanding": self.outstanding,
+            "outstanding_seconds": round(self.outstanding_seconds, 1),
+            "load": round(self.load(), 1),
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "last_error": self.last_error,
+        }
+
+class Router:
+    """Pick backends by health and load and forward requests to them.
+
+    Forwarding is plain HTTP with urllib, so a backend can be any whisper
+    server, including another router.
+    """
+
+    def __init__(self, urls, poll_interval=POLL_INTERVAL, on_change=None):
+        if not urls:
+            raise ValueError("Router needs at least one backend URL")
+        self.backends = [Backend(url) for url in urls]
+        self.poll_interval = poll_interval
+        # Called after every poll, e.g. to push backend health to /events subscribers
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._sticky = OrderedDict()
+        # Backend currently running each in-flight request id, for cancellation
+        self._owners = {}
+        # Backend that holds each background job's result
+        self._jobs = OrderedDict()
+        self.failovers = 0
+        self.rejected = 0
+
+    def start(self):
+        """Poll every backend once, then keep polling in the background."""
+        self.poll()
+        threading.Thread(target=self._poll_loop, name="router-poll", daemon=True).start()
+        return self
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.poll()
+
+    def poll(self):
+        for backend in self.backends:
+            self._poll_backend(backend)
+        if self.on_change is not None:
+            self.on_change()
+
+    def _poll_backend(self, backend):
+        try:
+            with urllib.request.urlopen(backend.url + "/status", timeout=POLL_TIMEOUT) as response:
+                status = json.loads(response.read())
+        except (OSError, ValueError) as e:
+            self._mark_failed(backend, e)
+            return
+        load = status.get("load") or {}
+        with self._lock:
+            was_healthy = backend.healthy
+            # Models unloaded while idle reload on the next request, so they still count
+            backend.healthy = status.get("model_loaded", False) or status.get("model_state") == "unloaded"
+            backend.ready = status.get("ready", backend.healthy)
+            backend.model_state = status.get("model_state")
+            backend.workers = load.get("workers") or backend.workers
+            backend.queue_depth = load.get("queue_depth", 0)
+            backend.failures = 0
+            backend.last_poll = time.time()
+            backend.last_error = None if backend.healthy else "model not loaded"
+        if backend.healthy and not was_healthy:
+            logger.info(f"Backend {backend.url} is up ({backend.workers} workers)")
+
+    def _mark_failed(self, backend, error, immediate=False):
+        with self._lock:
+            backend.failures += 1
+            backend.last_error = str(error)
+            backend.last_poll = time.time()
+            was_healthy = backend.healthy
+            if immediate or backend.failures >= UNHEALTHY_AFTER:
+                backend.healthy = False
+        if was_healthy and not backend.healthy:
+            logger.warning(f"Backend {backend.url} is down: {error}")
+
+    def _candidates(self, session_id, exclude):
+        """Healthy backends in the order to try them: sticky one first, then by load."""
+        with self._lock:
+            healthy = [b for b in self.backends if b.healthy and b not in exclude]
+            # Prefer warmed-up backends; a loading one is only used when nothing else is up
+            ranked = sorted(healthy, key=lambda b: (not b.ready, b.load()))
+            if session_id is not None:
+                entry = self._sticky.get(session_id)
+                if entry is not None and time.monotonic() - entry[1] <= STICKY_TTL:
+                    sticky = entry[0]
+                    if sticky in ranked:
+                        ranked.remove(sticky)
+                        ranked.insert(0, sticky)
+            return ranked
+
+    def _stick(self, session_id, backend):
+        with self._lock:
+            previous = self._sticky.get(session_id)
+            if previous is not None and previous[0] is not backend:
+                logger.info(f"Session {session_id} moved from {previous[0].url} to {backend.url}")
+            self._sticky[session_id] = (backend, time.monotonic())
+            self._sticky.move_to_end(session_id)
+            while len(self._sticky) > MAX_STICKY_SESSIONS:
+                self._sticky.popitem(last=False)
+
+    def forward(self, method, path, body=None, headers=None, session_id=None, audio_seconds=0.0,
+                request_id=None):
+        """Send a request to the best backend, failing over to the others.
+
+        Returns (status, headers, body bytes, backend url). Raises
+        NoBackendAvailable once every healthy backend has been tried.
+        A backend that accepted the request but did not answer in time is
+        still working on it, so that is a 504 rather than a failover: the
+        request is not sent to a second backend and the first stays in
+        rotation.
+        """
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        timeout = REQUEST_TIMEOUT + audio_seconds * REQUEST_TIMEOUT_PER_AUDIO_SECOND
+        tried = []
+        while True:
+            candidates = self._candidates(session_id, tried)
+            if not candidates:
+                with self._lock:
+                    self.rejected += 1
+                raise NoBackendAvailable(
+                    f"No whisper backend available ({len(tried)} tried, "
+                    f"{sum(b.healthy for b in self.backends)}/{len(self.backends)} healthy)"
+                )
+            backend = candidates[0]
+            if tried:
+                with self._lock:
+                    self.failovers += 1
+                logger.warning(f"Failing over to {backend.url}")
+            tried.append(backend)
+
+            with self._lock:
+                backend.outstanding += 1
+                backend.outstanding_seconds += audio_seconds
+                backend.requests += 1
+                if request_id is not None:
+                    self._owners[request_id] = backend
+            try:
+                status, response_headers, data = self._send(backend, method, path, body, headers, timeout)
+            except socket.timeout:
+                # Raised only while reading the response; connect and send errors arrive as URLError
+                logger.warning(f"{backend.url} did not answer {method} {path} within {timeout:.0f}s")
+                with self._lock:
+                    backend.timeouts += 1
+                error = {"error": f"Backend did not answer within {timeout:.0f}s", "backend": backend.url}
+                return 504, [("Content-Type", "application/json")], json.dumps(error).encode(), backend.url
+            except OSError as e:
+                self._mark_failed(backend, e, immediate=True)
+                with self._lock:
+                    backend.errors += 1
+                continue
+            finally:
+                with self._lock:
+                    backend.outstanding -= 1
+                    backend.outstanding_seconds -= audio_seconds
+                    if request_id is not None and self._owners.get(request_id) is backend:
+                        del self._owners[request_id]
+
+            if status in RETRY_STATUSES:
+                with self._lock:
+                    backend.errors += 1
+                    backend.last_error = f"HTTP {status}"
+                continue
+            if session_id is not None:
+                self._stick(session_id, backend)
+            return status, response_headers, data, backend.url
+
+    def _send(self, backend, method, path, body, headers, timeout=REQUEST_TIMEOUT):
+        request = urllib.request.Request(backend.url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, response.getheaders(), response.read()
+        except urllib.error.HTTPError as e:
+            # An HTTP error status is still a response from a live backend
+            with e:
+                return e.code, e.headers.items(), e.read()
+
+    def cancel(self, request_id):
+        """Ask the backend running request_id to cancel it.
+
+        Returns (status, headers, body bytes, backend url), or None when no
+        backend is running that request for this router.
+        """
+        with self._lock:
+            backend = self._owners.get(request_id)
+        if backend is None:
+            return None
+        path = "/requests/" + urllib.parse.quote(request_id, safe="")
+        status, headers, data = self._send(backend, "DELETE", path, None, {})
+        return status, headers, data, backend.url
+
+    def remember_job(self, job_id, backend_url):
+        """Note which backend started a background job, so its result can be fetched there."""
+        backend = next((b for b in self.backends if b.url == backend_url), None)
+        if backend is None:
+            return
+        with self._lock:
+            self._jobs[job_id] = backend
+            while len(self._jobs) > MAX_REMEMBERED_JOBS:
+                self._jobs.popitem(last=False)
+
+    def job_status(self, job_id):
+        """Fetch a background job from its backend.
+
+        Returns (status, headers, body bytes, backend url), or None when no
+        backend started that job for this router.
+        """
+        with self._lock:
+            backend = self._jobs.get(job_id)
+        if backend is None:
+            return None
+        path = "/jobs/" + urllib.parse.quote(job_id, safe="")
+        status, headers, data = self._send(backend, "GET", path, None, {})
+        return status, headers, data, backend.url
+
+    def healthy_backends(self):
+        with self._lock:
+            return [b for b in self.backends if b.healthy]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backends": [backend.stats() for backend in self.backends],
+                "healthy": sum(b.healthy for b in self.backends),
+                "sticky_sessions": len(self._sticky),
+                "in_flight": len(self._owners),
+                "failovers": self.failovers,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import EventBus, SUBSCRIBER_BUFFER, stream
+
+class EventBusTest(unittest.TestCase):
+    def test_stalled_subscriber_is_dropped_and_its_stream_ends(self):
+        bus = EventBus()
+        subscription = bus.subscribe()
+        chunks = stream(subscription, heartbeat=0.01)
+        next(chunks)
+
+        for i in range(SUBSCRIBER_BUFFER + 1):
+            bus.publish("queue", {"depth": i})
+
+        self.assertEqual(bus.stats(), {"subscribers": 0, "published": SUBSCRIBER_BUFFER + 1, "dropped": 1})
+        # Bounded, so a stream that never ends fails instead of hanging
+        self.assertEqual(list(islice(chunks, 3)), [])
+
+    def test_close_ends_every_stream(self):
+        bus = EventBus()
+        bus.publish("model", {"state": "resident"}, retain=True)
+        chunks = stream(bus.subscribe(), heartbeat=0.01)
+        next(chunks)
+        self.assertIn("event: model", next(chunks))
+
+        bus.close()
+        # Bounded, so a stream that never ends fails instead of hanging
+        self.assertEqual(list(islice(chunks, 3)), [])
+        self.assertEqual(bus.stats()["subscribers"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redaction import Redactor
+
+class RedactTest(unittest.TestCase):
+    def setUp(self):
+        self.redactor = Redactor()
+
+    def assertRedacts(self, cases):
+        for text, redacted in cases:
+            with self.subTest(text=text):
+                self.assertEqual(self.redactor.redact(text), redacted)
+
+    def test_identifiers_are_masked(self):
+        self.assertRedacts([
+            ("Mr. Alvarez, MRN 00482913, call 415-555-0132", "Mr. [NAME], MRN [MRN], call [PHONE]"),
+            ("My name is Maria Lopez.", "My name is [NAME]."),
+            ("my name is Dr. Patel and I'll see you", "my name is Dr. [NAME] and I'll see you"),
+            ("MRN is MR-0048-2913 today", "MRN is [MRN] today"),
+            ("Chart number A12B345 noted", "Chart number [MRN] noted"),
+            ("Her record number is 12345 and she has a cough today",
+             "Her record number is [MRN] and she has a cough today"),
+            ("Date of birth 03/14/1958.", "Date of birth [DATE]."),
+            ("She lives at 1420 Maple Street, apartment 4B, with her daughter.",
+             "She lives at [ADDRESS], with her daughter."),
+            ("SSN 123-45-6789, email a.b@example.org", "SSN [SSN], email [EMAIL]"),
+        ])
+
+    def test_clinical_content_is_kept(self):
+        self.assertRedacts([
+            ("This is Metformin 500 mg", "This is Metformin 500 mg"),
+            ("This is Tuesday", "This is Tuesday"),
+            ("Dr. Lisinopril", "Dr. Lisinopril"),
+            ("Blood pressure is 142/88, heart rate 76, A1c 7.2.", "Blood pressure is 142/88, heart rate 76, A1c 7.2."),
+            ("she may take 5 mg", "she may take 5 mg"),
+        ])
+
+    def test_known_names(self):
+        redactor = Redactor(["Maria Lopez"])
+        self.assertEqual(redactor.redact("saw maria lopez today"), "saw [NAME] today")
+
+if __name__ == "__main__":
+    unittest.main()
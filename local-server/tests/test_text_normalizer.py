@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_normalizer import normalize, benchmark
+
+class NormalizeTest(unittest.TestCase):
+    def assertNormalizes(self, cases):
+        for spoken, written in cases:
+            with self.subTest(spoken=spoken):
+                self.assertEqual(normalize(spoken), written)
+
+    def test_vitals_and_doses(self):
+        self.assertNormalizes([
+            ("b p one forty over ninety", "BP 140/90"),
+            ("blood pressure is one twenty over eighty five", "blood pressure is 120/85"),
+            ("pulse one oh five", "pulse 105"),
+            ("five hundred milligrams twice a day", "500 mg BID"),
+            ("temperature ninety eight point six degrees fahrenheit", "temperature 98.6°F"),
+            ("o two sat ninety seven percent", "O2 sat 97%"),
+            ("her a one c was seven point two", "her A1c was 7.2"),
+            ("two puffs every four to six hours as needed", "2 puffs q4-6h PRN"),
+            ("take one tablet by mouth", "take 1 tablet PO"),
+            ("zero point five milligrams", "0.5 mg"),
+            ("strength five over five", "strength 5/5"),
+            ("one hundred and twenty five pounds", "125 lb"),
+        ])
+
+    def test_ordinary_speech_is_left_alone(self):
+        self.assertNormalizes([
+            ("At this point one of the nurses came in", "At this point one of the nurses came in"),
+            ("we talked at one point two weeks ago", "we talked at one point two weeks ago"),
+            ("option one two or three", "option one two or three"),
+            ("Hi, I m fine", "Hi, I m fine"),
+            ("no one else at home is sick", "no one else at home is sick"),
+            ("that one is fine", "that one is fine"),
+        ])
+
+    def test_oh_is_only_a_digit_before_more_digits(self):
+        self.assertEqual(normalize("she is seventy oh my goodness"), "she is 70 oh my goodness")
+
+    def test_benchmark_budget(self):
+        # Well above the 1 ms per minute target, so a slow CI machine does not flake
+        self.assertLess(benchmark(minutes=2, repeats=3)["ms_per_minute"], 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Clinote medical text normalizer
+Rewrites spoken numbers, units, vitals, dosing frequencies and spelled-out
+abbreviations in ASR output into the written form clinicians expect:
+"b p one forty over ninety" becomes "BP 140/90" and "five hundred
+milligrams twice a day" becomes "500 mg BID".
+
+All rules are compiled into two regular expressions when the module is
+imported. normalize() makes one pass with each, so it runs in linear time
+and can be applied to every segment as it is decoded.
+
+Usage:
+    python text_normalizer.py "pulse ninety eight point six degrees fahrenheit"
+    python text_normalizer.py --benchmark
+"""
+
+import re
+import sys
+import time
+import argparse
+
+ONES = {
+    "zero": 0, "oh": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9,
+}
+TEENS = {
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60,
+    "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALES = {"hundred": 100, "thousand": 1000}
+
+# Spoken phrases and their written form. Frequencies follow the Joint
+# Commission "do not use" list: no QD, QOD, U or IU.
+PHRASES = {
+    # Dosing frequency and route
+    "once a day": "daily", "once daily": "daily",
+    "twice a day": "BID", "twice daily": "BID", "two times a day": "BID",
+    "three times a day": "TID", "three times daily": "TID",
+    "four times a day": "QID", "four times daily": "QID",
+    "at bedtime": "QHS", "as needed": "PRN", "by mouth": "PO",
+    "b i d": "BID", "t i d": "TID", "q i d": "QID", "p r n": "PRN", "q h s": "QHS",
+    # Vitals and labs spelled out letter by letter
+    "b p": "BP", "h r": "HR", "r r": "RR", "o two sat": "O2 sat", "o two saturation": "O2 saturation",
+    "s p o two": "SpO2", "o two": "O2", "h b a one c": "HbA1c", "a one c": "A1c", "b m i": "BMI",
+    "b m p": "BMP", "c b c": "CBC", "c m p": "CMP", "t s h": "TSH", "l d l": "LDL", "h d l": "HDL",
+    "e k g": "EKG", "e c g": "ECG", "c t": "CT", "m r i": "MRI", "i v": "IV",
+    # Conditions
+    "c o p d": "COPD", "c h f": "CHF", "g e r d": "GERD", "u t i": "UTI", "a fib": "AFib",
+    "c a d": "CAD", "d v t": "DVT", "p e": "PE", "u r i": "URI",
+}
+
+# Units written after a number: spoken pattern -> symbol
+UNITS = (
+    (r"milligrams?|mgs?", "mg"),
+    (r"micrograms?|mcgs?", "mcg"),
+    (r"milliliters?|millilitres?|ccs?", "mL"),
+    (r"milliequivalents?", "mEq"),
+    (r"international units?", "units"),
+    (r"kilograms?|kilos?", "kg"),
+    (r"grams?", "g"),
+    (r"pounds?|lbs?", "lb"),
+    (r"percent|per cent", "%"),
+    (r"degrees fahrenheit", "°F"),
+    (r"degrees celsius|degrees centigrade", "°C"),
+    (r"beats per minute", "bpm"),
+    (r"breaths per minute", "breaths/min"),
+    (r"millimeters of mercury", "mmHg"),
+    (r"centimeters?", "cm"),
+    (r"millimeters?", "mm"),
+)
+# Words after which a small number is a quantity ("two puffs", "three months")
+QUANTITY_WORDS = ("tablet", "tablets", "pill", "pills", "capsule", "capsules", "puff", "puffs",
+                  "drop", "drops", "unit", "units", "dose", "doses", "week", "weeks", "day", "days",
+                  "month", "months", "year", "years", "hour", "hours", "time", "times")
+# Readings whose values are said digit group by digit group ("b p one forty over ninety")
+VITAL_LABELS = ("b p", "bp", "blood pressure", "pressure", "pulse", "heart rate", "h r", "hr",
+                "respiratory rate", "r r", "rr", "temperature", "temp", "weight", "weighs", "o two sat",
+                "o two saturation", "o2 sat", "sat", "sats", "saturation", "spo2", "s p o two", "a one c",
+                "a1c", "glucose", "sugar", "b m i", "bmi", "pain")
+# Words allowed between a vital label and its value ("heart rate today is seventy two")
+VITAL_FILLERS = ("is", "was", "of", "at", "today", "now", "about", "around", "reading", "reads")
+# How far back to look for a vital label, in characters
+VITAL_LOOKBEHIND = 48
+
+def _alternation(words):
+    # Longest first, so "fourteen" is not matched as "four"
+    return "|".join(re.escape(word).replace(r"\ ", r"\s+") for word in sorted(words, key=len, reverse=True))
+
+_WORDS = [word for word in list(ONES) + list(TEENS) + list(TENS) if word != "oh"]
+_NUMBER_WORD = _alternation(list(ONES) + list(TEENS) + list(TENS) + list(SCALES))
+_STARTING_WORD = _alternation(_WORDS)
+_SEPARATOR = r"(?:[\s-]+(?:and\s+)?)"
+# "oh" is a zero only when more digits follow ("one oh five", not "seventy oh my")
+_CONTINUING_WORD = rf"(?:{_alternation(_WORDS + list(SCALES))}|oh(?={_SEPARATOR}(?:{_NUMBER_WORD})\b))"
+_NUMBER_RUN = (rf"(?:{_STARTING_WORD})(?:{_SEPARATOR}(?:{_CONTINUING_WORD}))*"
+               rf"(?:\s+point(?:\s+(?:{_NUMBER_WORD}))+)?")
+_UNIT_GROUPS = "|".join(rf"(?P<unit{index}>{pattern})".replace(" ", r"\s+") for index, (pattern, _) in enumerate(UNITS))
+_UNIT_WORDS = "|".join(pattern for pattern, _ in UNITS).replace(" ", r"\s+")
+
+# Pass 1: spoken phrases and number-word runs. Phrases come first, so "a one c" stays an abbreviation.
+WORD_RULES = re.compile(rf"\b(?:(?P<phrase>{_alternation(PHRASES)})|(?P<number>{_NUMBER_RUN}))\b", re.IGNORECASE)
+# Pass 2: patterns over the digits pass 1 produced
+NUMBER_RULES = re.compile(
+    rf"\b(?P<over>\d+)\s+over\s+(?P<under>\d+)\b"
+    rf"|\bevery\s+(?P<every>\d+)(?:\s*(?:to|-)\s*(?P<every_to>\d+))?\s+hours?\b"
+    rf"|\b(?P<amount>\d+(?:\.\d+)?)(?:\s+|-)(?:{_UNIT_GROUPS})\b",
+    re.IGNORECASE,
+)
+# Context that makes a run a measurement, tried from the run's end or up to its start
+_UNIT_AFTER = re.compile(rf"[\s-]+(?:{_UNIT_WORDS})\b", re.IGNORECASE)
+_QUANTITY_AFTER = re.compile(
+    rf"(?:\s+(?:to|or|-)\s+[\w-]+)?\s+(?:{_alternation(QUANTITY_WORDS)}|{_UNIT_WORDS}|over)\b", re.IGNORECASE
+)
+_VITAL_BEFORE = re.compile(
+    rf"(?:\b(?:{_alternation(VITAL_LABELS)})(?:[\s,:]+(?:{_alternation(VITAL_FILLERS)}))*"
+    rf"|(?:\d|\b(?:{_NUMBER_WORD}))\s+over)[\s,:]+$",
+    re.IGNORECASE,
+)
+_PHRASE_LOOKUP = {" ".join(phrase.split()): written for phrase, written in PHRASES.items()}
+
+def words_to_number(words):
+    """(digits, grouped) for a run of number words, or (None, False) if it does not read as a number.
+
+    Besides ordinary cardinals ("one hundred and twenty five") this reads
+    the way numbers are said in clinic: "one forty" is 140, "one oh five"
+    is 105 and "ninety eight point six" is 98.6. grouped is True when the
+    digits were joined from groups like that, which only makes sense for
+    a measurement.
+    """
+    if "point" in words:
+        split = words.index("point")
+        whole, grouped = words_to_number(words[:split])
+        decimals = words[split + 1:]
+        if whole is None or not decimals or any(word not in ONES for word in decimals):
+            return None, False
+        return f"{whole}.{''.join(str(ONES[word]) for word in decimals)}", grouped
+
+    pieces = []
+    big = current = 0
+    last = None
+    for word in words:
+        if word == "and":
+            if last != "scale":
+                return None, False
+            continue
+        if word in SCALES:
+            if last in (None, "scale"):
+                return None, False
+            if word == "thousand":
+                big, current = big + (current or 1) * 1000, 0
+            else:
+                current = (current or 1) * 100
+            last = "scale"
+            continue
+        value = ONES.get(word, TEENS.get(word, TENS.get(word)))
+        kind = "ones" if word in ONES else "teens" if word in TEENS else "tens"
+        # "twenty five" adds; "one forty" and "one oh five" are said digit group by digit group
+        adds = last == "scale" or (last == "tens" and kind == "ones")
+        if last is not None and not adds:
+            pieces.append(big + current)
+            big = current = 0
+        current += value
+        last = kind
+    pieces.append(big + current)
+    return "".join(str(piece) for piece in pieces), len(pieces) > 1
+
+def in_vital_context(text, start):
+    """Whether a vital label ("BP", "heart rate is") or "<number> over" ends just before start."""
+    return _VITAL_BEFORE.search(text, max(0, start - VITAL_LOOKBEHIND), start) is not None
+
+def _replace_words(match):
+    phrase = match.group("phrase")
+    if phrase is not None:
+        return _PHRASE_LOOKUP[" ".join(phrase.lower().split())]
+    text = match.group("number")
+    words = re.split(r"[\s-]+", text.lower())
+    number, grouped = words_to_number(words)
+    if number is None:
+        return text
+    string, start, end = match.string, match.start(), match.end()
+    if "point" in words:
+        # "at one point two weeks ago" is not a decimal; "ninety eight point six degrees" is
+        if not (_UNIT_AFTER.match(string, end) or in_vital_context(string, start)):
+            return text
+    elif grouped or (len(words) == 1 and words[0] in ONES):
+        # Digit groups and single digits are ordinary words ("option one two", "no one")
+        # unless they measure something
+        if not (_QUANTITY_AFTER.match(string, end) or in_vital_context(string, start)):
+            return text
+    return number
+
+def _replace_numbers(match):
+    if match.group("over") is not None:
+        return f"{match.group('over')}/{match.group('under')}"
+    if match.group("every") is not None:
+        hours = match.group("every") + (f"-{match.group('every_to')}" if match.group("every_to") else "")
+        return f"q{hours}h"
+    amount = match.group("amount")
+    if amount.endswith(".0"):
+        # Trailing zeros are on the "do not use" list: 5.0 mg is misread as 50 mg
+        amount = amount[:-2]
+    for index, (_, symbol) in enumerate(UNITS):
+        if match.group(f"unit{index}") is not None:
+            return f"{amount}{symbol}" if symbol in ("%", "°F", "°C") else f"{amount} {symbol}"
+    return match.group()
+
+def normalize(text):
+    """Rewrite one segment or transcript into written clinical form."""
+    if not text:
+        return text
+    return NUMBER_RULES.sub(_replace_numbers, WORD_RULES.sub(_replace_words, text))
+
+BENCHMARK_SEGMENTS = (
+    " Blood pressure today is b p one forty over ninety and heart rate seventy two beats per minute.",
+    " Temperature ninety eight point six degrees fahrenheit, o two sat ninety seven percent on room air.",
+    " We'll start metformin five hundred milligrams twice a day with meals.",
+    " Continue lisinopril ten milligrams once a day and albuterol two puffs every four to six hours as needed.",
+    " Her a one c was seven point two last month, so we'll recheck in three months.",
+    " No one else at home has been sick, and she denies chest pain or shortness of breath.",
+)
+# Conversational clinical speech runs at about 150 words a minute
+WORDS_PER_MINUTE = 150
+
+def benchmark(minutes=10, repeats=20):
+    """Time normalize() over a synthetic transcript, per segment as the server applies it."""
+    words_per_segment = sum(len(segment.split()) for segment in BENCHMARK_SEGMENTS) / len(BENCHMARK_SEGMENTS)
+    count = int(minutes * WORDS_PER_MINUTE / words_per_segment)
+    segments = [BENCHMARK_SEGMENTS[i % len(BENCHMARK_SEGMENTS)] for i in range(count)]
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for segment in segments:
+            normalize(segment)
+        best = min(best, time.perf_counter() - started)
+    return {
+        "minutes": minutes,
+        "segments": count,
+        "characters": sum(map(len, segments)),
+        "ms_per_minute": round(best * 1000 / minutes, 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize spoken numbers, units and abbreviations in transcripts")
+    parser.add_argument("text", nargs="*", help="Text to normalize (default: read stdin)")
+    parser.add_argument("--benchmark", action="store_true", help="Measure milliseconds per minute of audio")
+    parser.add_argument("--minutes", type=float, default=10, help="Benchmark transcript length")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = benchmark(args.minutes)
+        verdict = "✅" if result["ms_per_minute"] < 1.0 else "⚠️"
+        print(f"{verdict} {result['ms_per_minute']:.3f} ms per minute of audio "
+              f"({result['segments']} segments, {result['characters']} characters)")
+        return 0
+    for line in ([" ".join(args.text)] if args.text else sys.stdin):
+        print(normalize(line.rstrip("\n")))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
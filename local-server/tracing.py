@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Clinote tracing
+Minimal OpenTelemetry-compatible tracing without the SDK: W3C traceparent
+propagation, parent-based ratio sampling, nested spans per request thread,
+and a batching exporter that posts OTLP/HTTP JSON to a local collector or
+appends spans to a JSONL file. When a request is not sampled every span
+call returns a shared no-op object, so tracing costs almost nothing.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import functools
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+# Exporter batching, in the style of the transcript store writer
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 2.0
+MAX_PENDING_SPANS = 10000
+EXPORT_TIMEOUT = 2.0
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id, sampled) from a W3C traceparent, or None."""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, sampled
+
+def format_traceparent(trace_id, span_id, sampled=True):
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled requests."""
+
+    trace_id = None
+    span_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self, error=None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """A timed operation; use as a context manager or call end()."""
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._pop(self)
+        self.end(exc)
+        return False
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+        self.tracer._finish(self)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+    def to_record(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporter.
+
+    Tracing is off unless an OTLP endpoint or a JSONL path is configured.
+    A request is traced when its traceparent says the caller sampled it,
+    or otherwise with probability sample_rate.
+    """
+
+    def __init__(self, service_name, sample_rate=0.0, otlp_endpoint=None, path=None):
+        self.service_name = service_name
+        self._local = threading.local()
+        self.exported = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=MAX_PENDING_SPANS)
+        self._exporter = None
+        self._otlp_failed = False
+        self.configure(sample_rate, otlp_endpoint, path)
+
+    def configure(self, sample_rate=0.0, otlp_endpoint=None, path=None):
+        """Set sampling and destinations, starting the exporter on first use."""
+        self.sample_rate = sample_rate
+        self.otlp_endpoint = otlp_endpoint
+        self.path = path
+        self.enabled = bool(otlp_endpoint or path)
+        if self.enabled and self._exporter is None:
+            self._exporter = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._exporter.start()
+
+    def current(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def _push(self, span):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = getattr(self._local, "stack", None)
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def start_trace(self, name, traceparent=None, attributes=None):
+        """Start a server span for an incoming request and make it current.
+
+        Returns NOOP_SPAN when the request is not sampled. The caller must
+        call finish_trace() on the same thread.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            # Keep the caller's trace id either way so its logs correlate with ours
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = "%032x" % random.getrandbits(128), None, False
+        if not sampled and random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        span = Span(self, name, trace_id, parent_id, SPAN_KIND_SERVER, attributes)
+        self._push(span)
+        return span
+
+    def finish_trace(self, span, error=None):
+        if span is NOOP_SPAN:
+            return
+        self._pop(span)
+        span.end(error)
+
+    def span(self, name, **attributes):
+        """Child span of the thread's current span, or NOOP_SPAN outside a trace."""
+        parent = self.current()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, SPAN_KIND_INTERNAL, attributes)
+
+    def wrap(self, function, name):
+        """Wrap a callable so calls made inside a trace get their own span."""
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            if self.current() is None:
+                return function(*args, **kwargs)
+            with self.span(name):
+                return function(*args, **kwargs)
+        return traced
+
+    def _finish(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=EXPORT_INTERVAL))
+                deadline = time.monotonic() + EXPORT_INTERVAL
+                while len(batch) < EXPORT_BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                pass
+            if batch:
+                self._export(batch)
+
+    def _export(self, spans):
+        if self.otlp_endpoint and self._post_otlp(spans):
+            self.exported += len(spans)
+            return
+        if self.path:
+            try:
+                with open(self.path, "a") as f:
+                    f.write("".join(json.dumps(span.to_record()) + "\n" for span in spans))
+                self.exported += len(spans)
+                return
+            except OSError as e:
+                logger.warning(f"Could not write spans to {self.path}: {e}")
+        self.dropped += len(spans)
+
+    def _post_otlp(self, spans):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": otlp_value(self.service_name)},
+                    {"key": "process.pid", "value": otlp_value(os.getpid())},
+                ]},
+                "scopeSpans": [{"scope": {"name": "clinote"}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }
+        request = urllib.request.Request(
+            self.otlp_endpoint, data=json.dumps(body).encode(), method="POST",
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=EXPORT_TIMEOUT) as response:
+                response.read()
+            if self._otlp_failed:
+                logger.info(f"Trace collector at {self.otlp_endpoint} is reachable again")
+            self._otlp_failed = False
+            return True
+        except OSError as e:
+            if not self._otlp_failed:
+                fallback = f", writing to {self.path}" if self.path else ", dropping spans"
+                logger.warning(f"Trace collector at {self.otlp_endpoint} unreachable ({e}){fallback}")
+            self._otlp_failed = True
+            return False
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "otlp_endpoint": self.otlp_endpoint,
+            "path": self.path,
+            "pending": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Clinote local transcript store
+Keeps transcripts, segments, timings and metadata in a local SQLite database
+with an FTS5 full-text index. Writes are queued and committed in batches by a
+background thread so they never block a transcription request.
+"""
+
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    duration REAL,
+    language TEXT,
+    model TEXT,
+    transcript TEXT NOT NULL,
+    segments TEXT,
+    timings TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS transcripts_created_at ON transcripts(created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+    transcript,
+    content='transcripts',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS transcripts_ai AFTER INSERT ON transcripts BEGIN
+    INSERT INTO transcripts_fts(rowid, transcript) VALUES (new.id, new.transcript);
+END;
+CREATE TRIGGER IF NOT EXISTS transcripts_ad AFTER DELETE ON transcripts BEGIN
+    INSERT INTO transcripts_fts(transcripts_fts, rowid, transcript) VALUES ('delete', old.id, old.transcript);
+END;
+"""
+
+# Writer batching: commit after this many records or this many seconds
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0
+# Records waiting beyond this are dropped rather than growing memory unbounded
+MAX_PENDING = 5000
+# How often the retention policy is applied
+PURGE_INTERVAL = 3600
+
+SNIPPET_TOKENS = 16
+
+def build_match_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, words as prefixes."""
+    words = [word.replace('"', '') for word in text.split()]
+    words = [word for word in words if word]
+    if not words:
+        return None
+    # "cough" should find "coughing", but "7" should not find "70"
+    return " ".join(f'"{word}"' if word.isdigit() else f'"{word}"*' for word in words)
+
+class TranscriptStore:
+    """SQLite/FTS5 transcript store with a batched background writer."""
+
+    def __init__(self, path, retention_days=None, max_records=None):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_records = max_records
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._stopping = threading.Event()
+
+        # One connection serves every request thread; a fresh connection per
+        # werkzeug thread would leak a handle (and its page cache) per request
+        self._connection = self._connect()
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+        self._writer = threading.Thread(target=self._write_loop, name="transcript-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        # WAL lets searches run while the writer commits
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def save(self, transcript, duration=None, language=None, model=None,
+             segments=None, timings=None, metadata=None):
+        """Queue a transcript for storage without waiting for the write."""
+        record = (
+            time.time(), duration, language, model, transcript,
+            json.dumps(segments or []), json.dumps(timings or {}), json.dumps(metadata or {}),
+        )
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Transcript store queue is full, {self.dropped} records dropped so far")
+            return False
+
+    def _write_loop(self):
+        connection = self._connect()
+        next_purge = time.monotonic()
+        while not self._stopping.is_set() or not self._queue.empty():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=FLUSH_INTERVAL))
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while len(batch) < BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany(
+                            "INSERT INTO transcripts (created_at, duration, language, model, transcript, "
+                            "segments, timings, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            batch
+                        )
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    self.dropped += len(batch)
+                    logger.error(f"Failed to write {len(batch)} transcripts: {e}")
+
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + PURGE_INTERVAL
+                try:
+                    self._apply_retention(connection)
+                except sqlite3.Error as e:
+                    logger.error(f"Transcript retention purge failed: {e}")
+        connection.close()
+
+    def _apply_retention(self, connection):
+        removed = 0
+        if self.retention_days:
+            removed += self._purge(connection, before=time.time() - self.retention_days * 86400)
+        if self.max_records:
+            with connection:
+                cursor = connection.execute(
+                    "DELETE FROM transcripts WHERE id IN (SELECT id FROM transcripts "
+                    "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_records,)
+                )
+            removed += cursor.rowcount
+        if removed:
+            logger.info(f"Transcript retention removed {removed} records")
+        return removed
+
+    def _purge(self, connection, before=None, ids=None):
+        with connection:
+            if ids is not None:
+                cursor = connection.executemany("DELETE FROM transcripts WHERE id = ?", [(i,) for i in ids])
+            elif before is not None:
+                cursor = connection.execute("DELETE FROM transcripts WHERE created_at < ?", (before,))
+            else:
+                cursor = connection.execute("DELETE FROM transcripts")
+        return cursor.rowcount
+
+    def purge(self, before=None, ids=None, everything=False):
+        """Delete transcripts created before a timestamp, by id, or all of them."""
+        with self._lock:
+            if before is None and ids is None and not everything:
+                return self._apply_retention(self._connection)
+            return self._purge(self._connection, before=before, ids=ids)
+
+    def search(self, text, limit=20, offset=0, since=None, until=None):
+        """Return ranked hits with highlighted snippets for a free-text query."""
+        match = build_match_query(text)
+        if match is None:
+            return []
+        # Rank in the inner query so snippets are only built for the returned page
+        filters = ""
+        params = [match]
+        if since is not None:
+            filters += " AND t.created_at >= ?"
+            params.append(since)
+        if until is not None:
+            filters += " AND t.created_at < ?"
+            params.append(until)
+        params.extend([limit, offset])
+        # Date filters need the content table; plain searches stay inside the FTS index
+        join = "JOIN transcripts t ON t.id = transcripts_fts.rowid " if filters else ""
+        sql = (
+            "WITH hits AS ("
+            "SELECT transcripts_fts.rowid AS id, transcripts_fts.rank AS rank FROM transcripts_fts "
+            f"{join}WHERE transcripts_fts MATCH ?{filters} ORDER BY transcripts_fts.rank LIMIT ? OFFSET ?) "
+            "SELECT t.id, t.created_at, t.duration, t.language, t.model, t.metadata, hits.rank AS rank, "
+            f"snippet(transcripts_fts, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet "
+            "FROM hits JOIN transcripts t ON t.id = hits.id "
+            "JOIN transcripts_fts ON transcripts_fts.rowid = hits.id "
+            "WHERE transcripts_fts MATCH ? ORDER BY hits.rank"
+        )
+        params.append(match)
+
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [
+            {
+                "id": row["id"],
+                "created_at": row["created_at"],
+                "duration": row["duration"],
+                "language": row["language"],
+                "model": row["model"],
+                "metadata": json.loads(row["metadata"] or "{}"),
+                # bm25() is lower-is-better; flip it so clients can sort descending
+                "score": round(-row["rank"], 4),
+                "snippet": row["snippet"],
+            }
+            for row in rows
+        ]
+
+    def get(self, transcript_id):
+        """Return one stored transcript with its segments, or None."""
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        for field in ("segments", "timings", "metadata"):
+            record[field] = json.loads(record[field] or "null")
+        return record
+
+    def stats(self):
+        """Return counts for /status."""
+        with self._lock:
+            count = self._connection.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+        return {
+            "path": self.path,
+            "records": count,
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "retention_days": self.retention_days,
+            "max_records": self.max_records,
+        }
+
+    def close(self, timeout=10):
+        """Flush queued writes and stop the writer thread."""
+        self._stopping.set()
+        self._writer.join(timeout)
+        with self._lock:
+            self._connection.close()
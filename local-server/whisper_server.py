@@ -5,41 +5,816 @@ A lightweight Flask server for local speech-to-text transcription using faster-w
 """
 
 import os
+import gc
+import hmac
+import sys
+import json
+import time
+import uuid
+import ctypes
+import signal
+import argparse
 import base64
 import tempfile
 import logging
-from flask import Flask, request, jsonify
-from faster_whisper import WhisperModel
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import Flask, Response, request, jsonify, g
+from werkzeug.serving import make_server
+from faster_whisper import WhisperModel, decode_audio
+from faster_whisper.utils import download_model
+from faster_whisper.tokenizer import _LANGUAGE_CODES
 import torch
 
+from note_extractor import summarize, SPECIALTY_TERMS
+import code_index
+import model_cache
+from coalescer import Coalescer, request_key
+from memory_governor import MemoryGovernor, MemoryBudgetExceeded, MB
+from profiler import ProfileSession, MODES as PROFILE_MODES
+from tracing import Tracer, NOOP_SPAN, format_traceparent
+from router import Router, NoBackendAvailable
+from diarization import Diarizer, MelStatsEmbedder, OnnxEmbedder, VoiceProfiles, label_segments
+from cancellation import RequestRegistry, RequestCancelled, socket_disconnect_probe
+from jobs import JobStore, JobLimitReached
+from config import parse_layered
+from events import EventBus, TooManySubscribers, stream as event_stream
+from text_normalizer import normalize as normalize_text
+from redaction import Redactor, RedactingFilter, load_names
+import faster_whisper.transcribe as faster_whisper_transcribe
+from transcript_store import TranscriptStore
+
+# Optional wire compression for raw PCM uploads
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# Optional accurate current RSS on macOS/Windows for the memory governor
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Masks PHI in log records from every module, werkzeug's included
+phi_redactor = Redactor()
+log_redaction = RedactingFilter(phi_redactor)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(log_redaction)
 
 app = Flask(__name__)
 
-# Global model instance
+# Model configuration
+# Use base model for speed, can be changed to 'small', 'medium', 'large'
+DEFAULT_MODEL = "base"
+# Additional model sizes the latency-budget planner may pick from, e.g. ["tiny", "small"]
+EXTRA_MODELS = []
+DEVICE = "cpu"
+COMPUTE_TYPE = "int8"
+DEVICES = ("cpu", "cuda", "auto")
+COMPUTE_TYPES = ("default", "auto", "int8", "int8_float32", "int8_float16", "int16", "float16", "float32")
+SAMPLE_RATE = 16000
+# Decoding replicas per model. Replicas share one copy of the weights inside
+# this process, so extra workers cost only their working buffers.
+NUM_WORKERS = 1
+# CPU threads per replica, 0 lets CTranslate2 choose
+CPU_THREADS = 0
+# Transcriptions that may wait for a busy worker before new ones get a 503; None queues without limit
+MAX_QUEUE_DEPTH = None
+
+# Network configuration
+HOST = "0.0.0.0"
+PORT = 11434
+# Seconds a draining server waits for in-flight requests before exiting
+DRAIN_TIMEOUT = 120
+
+# Raw PCM uploads: MIME types and little-endian sample formats
+PCM_MIME_TYPES = ("audio/pcm", "audio/l16", "application/octet-stream")
+PCM_FORMATS = {
+    "s16le": np.dtype("<i2"),
+    "f32le": np.dtype("<f4"),
+}
+
+# Model sizes from fastest to most accurate
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large-v2", "large-v3"]
+
+# Starting real-time factors (seconds of compute per second of audio) for
+# the "accurate" decoding tier on a typical laptop CPU with int8 weights.
+# These are replaced by measured values as requests complete.
+DEFAULT_RTF = {
+    "tiny": 0.06,
+    "base": 0.12,
+    "small": 0.35,
+    "medium": 1.0,
+    "large-v2": 2.0,
+    "large-v3": 2.0,
+}
+RTF_SMOOTHING = 0.3
+
+# Decoding tiers from cheapest to most accurate. "cost" is the expected
+# compute relative to the accurate tier and is used to normalise measured RTF.
+DECODE_TIERS = [
+    {
+        "name": "fast",
+        "beam_size": 1,
+        "best_of": 1,
+        "temperature": [0.0],
+        "without_timestamps": True,
+        "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 300},
+        "cost": 0.4,
+    },
+    {
+        "name": "balanced",
+        "beam_size": 2,
+        "best_of": 2,
+        "temperature": [0.0, 0.4, 0.8],
+        "without_timestamps": True,
+        "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 500},
+        "cost": 0.6,
+    },
+    {
+        "name": "accurate",
+        "beam_size": 5,
+        "best_of": 5,
+        "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+        "without_timestamps": False,
+        "vad_filter": False,
+        "vad_parameters": None,
+        "cost": 1.0,
+    },
+]
+SPEED_PROFILES = [tier["name"] for tier in DECODE_TIERS]
+# Tier parameters the config file and PATCH /config may change
+TUNABLE_TIER_KEYS = ("beam_size", "best_of", "temperature", "without_timestamps", "vad_filter", "vad_parameters")
+# VadOptions fields in the pinned faster-whisper 0.9.0
+VAD_PARAMETER_KEYS = ("threshold", "min_speech_duration_ms", "max_speech_duration_s",
+                      "min_silence_duration_ms", "speech_pad_ms")
+# Fraction of the latency budget the planner aims for, leaving headroom
+# for decoding, queueing and RTF variance
+BUDGET_HEADROOM = 0.8
+
+# A session's language is pinned once detection is at least this confident,
+# so later requests from that session skip language detection
+LANGUAGE_PIN_PROBABILITY = 0.9
+# Pinned sessions are forgotten after this many idle seconds, oldest first beyond the cap
+SESSION_TTL = 4 * 3600
+MAX_SESSIONS = 1000
+# Header clients can use instead of a sessionId field
+SESSION_HEADER = "X-Clinote-Session"
+# Clients name a transcription with this header (or "requestId") to cancel it later
+REQUEST_ID_HEADER = "X-Request-Id"
+# Status returned to a cancelled request, after nginx's "client closed request"
+CANCELLED_STATUS = 499
+
+# Opt-in local transcript store (SQLite + FTS5); None keeps transcripts in memory only
+TRANSCRIPT_STORE_PATH = None
+# Stored transcripts older than this many days are purged; None keeps them forever
+TRANSCRIPT_RETENTION_DAYS = 30
+# Optional cap on the number of stored transcripts, oldest removed first
+TRANSCRIPT_MAX_RECORDS = None
+
+# Unload models after this many idle seconds and reload on the next request; None keeps them resident
+IDLE_UNLOAD_SECONDS = None
+# Hand freed memory back to the OS after unloading
+TRIM_ALLOCATOR = True
+
+# Resident memory budget in MB enforced by the memory governor; None only accounts
+MEMORY_BUDGET_MB = None
+# Seconds between background checks of RSS against the budget
+GOVERNOR_INTERVAL = 5
+# Decoded float32 PCM is roughly this many times larger than compressed webm/ogg/mp3 audio
+COMPRESSED_EXPANSION = 16
+# Minimum working memory reserved per transcription; the measured per-worker overhead wins when larger
+TRANSCRIPTION_OVERHEAD_MB = 100
+
+# Token required by /debug and /config (Authorization: Bearer <token>); None disables them
+ADMIN_TOKEN = os.environ.get("CLINOTE_ADMIN_TOKEN")
+# Settings file the server started with (see config.py); PATCH /config changes are not written back
+CONFIG_PATH = None
+# Longest profiling session /debug/profile will start
+MAX_PROFILE_SECONDS = 600
+# Profile samples are attributed to the first frame, from the leaf up, matching one of these
+PROFILE_STAGES = (
+    ("base64", ("b64decode", "b64encode")),
+    ("decode", ("decode_audio", "pcm_to_array", "save_audio_file", "(audio.py:")),
+    ("encoder", ("encode (transcribe.py", "detect_language")),
+    ("decoder", ("generate_with_fallback",)),
+    ("vad", ("get_speech_timestamps", "(vad.py:")),
+    ("inference", ("(transcribe.py:", "run_transcription")),
+    ("json", ("jsonify", "get_json", "(json")),
+    ("flask", ("(app.py:", "(serving.py:", "(werkzeug", "(socketserver.py:")),
+)
+
+# Tracing: spans go to an OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces)
+# and/or a JSONL file; with neither set tracing is off
+OTLP_ENDPOINT = os.environ.get("CLINOTE_OTLP_ENDPOINT")
+TRACE_FILE = os.environ.get("CLINOTE_TRACE_FILE")
+# Share of requests traced when the client did not ask for it via traceparent
+TRACE_SAMPLE_RATE = float(os.environ.get("CLINOTE_TRACE_SAMPLE_RATE", "0.1"))
+# faster-whisper internals that get their own span inside a traced request
+TRACED_MODEL_METHODS = (
+    ("detect_language", "language_detection"),
+    ("encode", "encoder"),
+    ("generate_with_fallback", "decoder"),
+)
+
+# Offline model cache (see model_cache.py). When either is set, models load
+# only from local files and the Hugging Face hub is never contacted.
+MODEL_CACHE_DIR = None
+# Archive bundled by the installers, extracted into the cache on first use
+MODEL_ARCHIVE = model_cache.DEFAULT_ARCHIVE if os.path.exists(model_cache.DEFAULT_ARCHIVE) else None
+# Check cached files against their sha256 manifest before loading
+MODEL_VERIFY = True
+
+# Router mode: forward requests to these whisper servers instead of loading a model
+ROUTER_BACKENDS = []
+# Compressed uploads (Opus in WebM from MediaRecorder) per second of audio,
+# used to estimate how much audio a request adds to a backend's load
+COMPRESSED_BYTES_PER_SECOND = 16000
+# Paths the router answers itself instead of forwarding
+ROUTER_LOCAL_PATHS = ('/ping', '/status', '/debug/profile', '/config', '/events')
+
+# Requests with a deadlineMs shorter than this are refused; the first window
+# has to have a chance to decode
+MIN_DEADLINE_MS = 1000
+
+# Label segments by speaker unless a request sets "diarize": false
+DIARIZE = False
+# Optional ONNX speaker-embedding model; the built-in embedder needs none
+DIARIZATION_MODEL = None
+# Persist clinician voice profiles here (kept in memory only when None)
+VOICE_PROFILES_PATH = None
+
+# Rewrite spoken numbers, units and abbreviations ("b p one forty over ninety" -> "BP 140/90"); opt-in
+NORMALIZE_TEXT = False
+
+# Mask PHI (names, MRNs, phone numbers, dates, addresses) in log records and stored transcripts
+REDACT_LOGS = True
+REDACT_STORE = True
+# Also mask it in the segments and transcript returned to clients
+REDACT_SEGMENTS = False
+# Log each finished transcript (masked while REDACT_LOGS is on)
+LOG_TRANSCRIPTS = False
+# File of known patient names, one per line, masked wherever they appear
+PHI_NAMES_PATH = None
+
+# Default number of suggestions returned per code system
+CODE_SUGGESTION_LIMIT = 5
+# Note sections that carry the most coding signal are counted twice
+CODE_WEIGHTED_SECTIONS = ("chiefComplaint", "assessment", "plan")
+
+# Memory-mapped CPT/ICD-10 suggestion index, opened on first use
+codes = None
+codes_lock = threading.Lock()
+# Queries running on each open index; an evicted index is closed by its last query
+codes_users = {}
+
+# Transcript store instance when enabled
+transcript_store = None
+
+tracer = Tracer("clinote-whisper-server", TRACE_SAMPLE_RATE, OTLP_ENDPOINT, TRACE_FILE)
+
+# Active or most recent /debug/profile session
+profile_session = None
+
+# Backend router when running with --backend
+router = None
+
+# Speaker diarizer and the threads it runs on beside decoding, created on first use
+diarizer = None
+diarization_pool = None
+diarizer_lock = threading.Lock()
+
+# Identical transcriptions that overlap share one inference
+transcriptions = Coalescer()
+
+# Running transcriptions by request id, for cancellation
+active_requests = RequestRegistry()
+
+# State changes pushed to /events subscribers
+server_events = EventBus()
+
+# Remainders of transcriptions that hit their deadline. One at a time, so
+# they never take workers from live requests for long
+background_jobs = JobStore(workers=1)
+
+# Tracks RSS, request reservations, caches and models against MEMORY_BUDGET_MB
+memory_governor = MemoryGovernor(None, lambda: get_rss_bytes(current=True) or estimated_rss_bytes())
+
+# True once models are loaded and warmed up, so supervisors can hand over traffic
+server_ready = False
+# Requests currently being handled, used to drain before exiting
+in_flight = 0
+in_flight_lock = threading.Lock()
+
+# Loaded model instances by size name
+whisper_models = {}
+# Default model instance, kept for existing health checks
 whisper_model = None
+# Measured real-time factor per model, normalised to the accurate tier
+model_rtf = dict(DEFAULT_RTF)
+rtf_lock = threading.Lock()
+# Pinned language per client session: session id -> (language, probability, last used)
+session_languages = OrderedDict()
+session_lock = threading.Lock()
+# Smoothed transcribe() setup time per (model, VAD, detection ran), in ms.
+# The gap between detecting and pinned runs estimates the detection cost.
+setup_ms = {}
+
+# Where each model was loaded from and how long it took
+model_load_info = {}
+# "loading", "resident" or "unloaded" (idle, reloads on the next request)
+model_state = "loading"
+# Guards loading/unloading against transcriptions using the models
+model_lock = threading.Lock()
+# Set while a staged reload swaps models in; new transcriptions wait on models_changed
+models_swapping = False
+models_changed = threading.Condition(model_lock)
+active_transcriptions = 0
+last_activity = time.monotonic()
+model_lifecycle = {"unloads": 0, "reloads": 0, "last_reload_ms": None, "last_unload_freed_mb": None}
+# Resident bytes each model added when it was first loaded
+model_bytes = {}
+# Resident memory snapshots in bytes: before loading, after loading, after warming every replica
+memory_snapshots = {}
+
+def get_rss_bytes(current=False):
+    """Resident set size of this process in bytes, or None when unavailable.
+
+    With current=True, None is also returned where only the peak is known.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if current:
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Without /proc only the peak is available; it tracks startup growth closely
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def memory_report():
+    """Summarise how much memory the weights and each worker replica cost."""
+    def mb(value):
+        return None if value is None else round(value / 1e6, 1)
+    
+    baseline = memory_snapshots.get("baseline")
+    loaded = memory_snapshots.get("loaded")
+    warm = memory_snapshots.get("warm")
+    return {
+        "workers": NUM_WORKERS,
+        "rss_mb": mb(get_rss_bytes()),
+        "models_mb": mb(loaded - baseline) if baseline and loaded else None,
+        "per_worker_overhead_mb": mb((warm - loaded) / NUM_WORKERS) if loaded and warm else None
+    }
+
+def prefetch_model_file(path):
+    """Ask the OS to read model weights ahead so a reload hits the page cache."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(os.path.join(path, "model.bin"), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
 
 def load_model():
-    """Load the Whisper model on startup."""
-    global whisper_model
+    """Load the Whisper model on startup, or reload it after an idle unload."""
+    global whisper_model, model_state
+    reloading = model_state == "unloaded"
+    model_state = "loading"
+    publish_state()
     try:
         print("🎙️ Loading Whisper model...")
         logger.info("Loading Whisper model...")
-        # Use base model for speed, can be changed to 'small', 'medium', 'large'
-        whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
+        memory_snapshots.setdefault("baseline", get_rss_bytes())
+        for model_name in [DEFAULT_MODEL] + EXTRA_MODELS:
+            if model_name in whisper_models:
+                continue
+            rss_before = get_rss_bytes()
+            whisper_models[model_name], info = open_model(model_name, DEVICE, COMPUTE_TYPE, CPU_THREADS, NUM_WORKERS)
+            rss_after = get_rss_bytes()
+            if rss_before and rss_after and rss_after > rss_before:
+                model_bytes[model_name] = rss_after - rss_before
+            model_load_info[model_name] = info
+        whisper_model = whisper_models[DEFAULT_MODEL]
+        memory_snapshots.setdefault("loaded", get_rss_bytes())
+        model_state = "resident"
+        publish_state()
         print("✅ Whisper model loaded successfully!")
-        logger.info("Whisper model loaded successfully")
+        logger.info(f"Whisper models loaded successfully: {', '.join(whisper_models)}")
         return True
     except Exception as e:
+        model_state = "unloaded" if reloading else "loading"
+        publish_state()
         print(f"❌ Failed to load Whisper model: {e}")
         logger.error(f"Failed to load Whisper model: {e}")
         return False
 
+def open_model(model_name, device, compute_type, cpu_threads, num_workers):
+    """Resolve one model's files and construct it, returning (model, load info)."""
+    logger.info(f"Loading model '{model_name}' on {device} ({num_workers} workers)")
+    started = time.perf_counter()
+    info = model_load_info.get(model_name)
+    if info is not None:
+        # Reload from the path resolved at startup: no hub lookup and no re-verification
+        path = info["path"]
+        prefetch_model_file(path)
+        info = dict(info, source="reload", cache_hit=True)
+    elif MODEL_CACHE_DIR or MODEL_ARCHIVE or model_cache.is_registered(model_name):
+        # Custom models imported with model_import.py live only in the cache
+        path, info = model_cache.resolve(model_name, MODEL_CACHE_DIR or model_cache.DEFAULT_CACHE_DIR,
+                                         MODEL_ARCHIVE, check=MODEL_VERIFY)
+        info["fixed_compute_type"] = info.get("compute_type")
+    else:
+        path = download_model(model_name)
+        info = {"path": path, "source": "hub", "cache_hit": None, "verified": False}
+    # Models converted at a fixed quantization load as saved
+    compute_type = info.get("fixed_compute_type") or compute_type
+    model = WhisperModel(path, device=device, compute_type=compute_type, cpu_threads=cpu_threads,
+                         num_workers=num_workers, local_files_only=True)
+    instrument_model(model)
+    info["compute_type"] = compute_type
+    info["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Loaded '{model_name}' from {info['source']} in {info['load_ms']:.0f}ms "
+                f"(cache hit: {info['cache_hit']}, verified: {info['verified']})")
+    return model, info
+
+def instrument_model(model):
+    """Give the encoder, decoder, VAD and language detection their own trace spans."""
+    for method, span_name in TRACED_MODEL_METHODS:
+        if hasattr(model, method):
+            setattr(model, method, tracer.wrap(getattr(model, method), span_name))
+    vad = getattr(faster_whisper_transcribe, "get_speech_timestamps", None)
+    if vad is not None and not hasattr(vad, "__wrapped__"):
+        faster_whisper_transcribe.get_speech_timestamps = tracer.wrap(vad, "vad")
+
+def trim_allocator():
+    """Return freed heap pages to the OS where the C allocator supports it."""
+    try:
+        if sys.platform.startswith("linux"):
+            return bool(ctypes.CDLL("libc.so.6").malloc_trim(0))
+        if sys.platform == "darwin":
+            libc = ctypes.CDLL("/usr/lib/libSystem.B.dylib")
+            libc.malloc_zone_pressure_relief(None, 0)
+            return True
+    except (OSError, AttributeError):
+        pass
+    return False
+
+def unload_models():
+    """Drop every model so its memory goes back to the OS; the next request reloads."""
+    global whisper_model, model_state
+    rss_before = get_rss_bytes()
+    whisper_models.clear()
+    whisper_model = None
+    model_state = "unloaded"
+    publish_state()
+    gc.collect()
+    trimmed = trim_allocator() if TRIM_ALLOCATOR else False
+    rss_after = get_rss_bytes()
+    model_lifecycle["unloads"] += 1
+    if rss_before and rss_after:
+        model_lifecycle["last_unload_freed_mb"] = round((rss_before - rss_after) / 1e6, 1)
+    logger.info(f"Unloaded idle models (freed {model_lifecycle['last_unload_freed_mb']} MB, allocator trimmed: {trimmed})")
+
+def acquire_models():
+    """Mark a transcription as using the models, reloading them if they were unloaded."""
+    global active_transcriptions, last_activity
+    with model_lock:
+        # A staged reload is swapping models in; start on the new ones
+        while models_swapping:
+            models_changed.wait()
+        if model_state == "unloaded":
+            started = time.perf_counter()
+            if not load_model():
+                raise RuntimeError("Failed to reload the Whisper model")
+            model_lifecycle["reloads"] += 1
+            model_lifecycle["last_reload_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        active_transcriptions += 1
+        last_activity = time.monotonic()
+    publish_load()
+
+def release_models():
+    global active_transcriptions, last_activity
+    with model_lock:
+        active_transcriptions -= 1
+        last_activity = time.monotonic()
+        models_changed.notify_all()
+    publish_load()
+
+def load_snapshot():
+    """Queue depth as reported by /status and the load event."""
+    queued = active_transcriptions - NUM_WORKERS
+    return {
+        "active_transcriptions": active_transcriptions,
+        "workers": NUM_WORKERS,
+        "queue_depth": max(0, queued),
+        "max_queue_depth": MAX_QUEUE_DEPTH,
+        # The next transcription would be refused
+        "overloaded": MAX_QUEUE_DEPTH is not None and queued >= MAX_QUEUE_DEPTH,
+    }
+
+def publish_load():
+    server_events.publish("load", load_snapshot(), retain=True)
+
+def publish_state():
+    server_events.publish("state", readiness(), retain=True)
+
+def estimated_rss_bytes():
+    """Fallback RSS estimate where the platform only reports peak memory."""
+    return (memory_snapshots.get("baseline") or 0) + sum(
+        model_bytes.get(name, 0) for name in whisper_models
+    )
+
+def estimate_request_bytes(encoded_bytes, audio_type, pcm_format='s16le', base64_encoded=True):
+    """Estimate the peak memory a transcription of this upload will need."""
+    raw_bytes = encoded_bytes * 3 // 4 if base64_encoded else encoded_bytes
+    if is_pcm_type(audio_type):
+        decoded_bytes = raw_bytes * 4 // np.dtype(PCM_FORMATS.get(pcm_format, PCM_FORMATS['s16le'])).itemsize
+    else:
+        decoded_bytes = raw_bytes * COMPRESSED_EXPANSION
+    overhead = max(memory_report()["per_worker_overhead_mb"] or 0, TRANSCRIPTION_OVERHEAD_MB)
+    return raw_bytes + decoded_bytes + int(overhead * MB)
+
+def estimate_audio_seconds(raw_bytes, audio_type, sample_rate=None, pcm_format='s16le', compressed=False):
+    """Estimate the duration of an upload without decoding it."""
+    if not is_pcm_type(audio_type):
+        return raw_bytes / COMPRESSED_BYTES_PER_SECOND
+    try:
+        rate = int(sample_rate or pcm_type_rate(audio_type))
+    except (TypeError, ValueError):
+        rate = SAMPLE_RATE
+    seconds = raw_bytes / (max(1, rate) * PCM_FORMATS.get(pcm_format, PCM_FORMATS['s16le']).itemsize)
+    # lz4/zstd PCM typically shrinks to about half
+    return seconds * 2 if compressed else seconds
+
+def drop_extra_models():
+    """Governor step: keep only the default model while nothing is transcribing."""
+    if not model_lock.acquire(blocking=False):
+        return False
+    try:
+        extra = [name for name in whisper_models if name != DEFAULT_MODEL]
+        if active_transcriptions or not extra:
+            return False
+        for name in extra:
+            del whisper_models[name]
+        gc.collect()
+        if TRIM_ALLOCATOR:
+            trim_allocator()
+        logger.info(f"Dropped extra models under memory pressure: {', '.join(extra)}")
+        return True
+    finally:
+        model_lock.release()
+
+def unload_idle_models():
+    """Governor step: unload every model while nothing is transcribing."""
+    if not model_lock.acquire(blocking=False):
+        return False
+    try:
+        if active_transcriptions or model_state != "resident":
+            return False
+        unload_models()
+        return True
+    finally:
+        model_lock.release()
+
+def evict_code_index():
+    """Drop the code index; it is closed now, or by the last query still using it."""
+    global codes
+    with codes_lock:
+        if codes is not None:
+            if not codes_users.get(codes):
+                codes.close()
+            codes = None
+
+def code_index_bytes():
+    # Upper bound: the mapped file, whose pages count towards RSS once touched
+    index = codes
+    return os.path.getsize(index.path) if index is not None else 0
+
+def clear_session_languages():
+    with session_lock:
+        session_languages.clear()
+
+def setup_memory_governor():
+    """Register the caches and models the governor may shrink, in the order it should try them."""
+    memory_governor.register_cache("code_index", code_index_bytes, evict_code_index)
+    memory_governor.register_cache("language_sessions", lambda: len(session_languages) * 256,
+                                   clear_session_languages)
+    memory_governor.register_reclaimer("extra_models", drop_extra_models)
+    # An admitted request would reload these straight away, so only unload from the background check
+    memory_governor.register_reclaimer("idle_models", unload_idle_models, on_admission=False)
+
+def governor_loop():
+    while True:
+        time.sleep(GOVERNOR_INTERVAL)
+        if memory_governor.budget is not None:
+            memory_governor.check()
+
+def idle_unload_loop():
+    """Unload the models once nothing has used them for IDLE_UNLOAD_SECONDS."""
+    while True:
+        # PATCH /config can turn idle unloading on and off
+        time.sleep(min(60, max(1, (IDLE_UNLOAD_SECONDS or 240) / 4)))
+        if not IDLE_UNLOAD_SECONDS:
+            continue
+        with model_lock:
+            idle = time.monotonic() - last_activity
+            if model_state == "resident" and active_transcriptions == 0 and idle >= IDLE_UNLOAD_SECONDS:
+                unload_models()
+
+def model_rank(model_name):
+    """Return the speed rank of a model, smaller is faster."""
+    base_name = model_name.replace(".en", "")
+    if base_name in MODEL_SIZES:
+        return MODEL_SIZES.index(base_name)
+    return len(MODEL_SIZES)
+
+def predict_seconds(model_name, tier, duration):
+    """Predict compute time for decoding audio of the given duration."""
+    with rtf_lock:
+        rtf = model_rtf.get(model_name, DEFAULT_RTF.get(model_name, 1.0))
+    return duration * rtf * tier["cost"]
+
+def record_rtf(model_name, tier, duration, elapsed):
+    """Fold a measured run into the model's smoothed real-time factor."""
+    if duration < 1.0:
+        return
+    measured = elapsed / duration / tier["cost"]
+    with rtf_lock:
+        previous = model_rtf.get(model_name)
+        if previous is None:
+            model_rtf[model_name] = measured
+        else:
+            model_rtf[model_name] = previous + RTF_SMOOTHING * (measured - previous)
+
+def plan_decoding(duration, latency_budget=None, speed_profile=None):
+    """Choose model and decoding settings for a request.
+
+    With a latency budget, picks the most accurate model/tier combination
+    whose predicted time fits the budget. With a speed profile, uses that
+    tier on the smallest, default or largest loaded model. Otherwise uses
+    the accurate tier on the default model.
+    """
+    models = sorted(whisper_models, key=model_rank)
+    tiers = {tier["name"]: tier for tier in DECODE_TIERS}
+
+    if latency_budget is not None:
+        target = latency_budget * BUDGET_HEADROOM
+        # Candidates ordered from least to most accurate
+        candidates = [(model_name, tier) for model_name in models for tier in DECODE_TIERS]
+        model_name, tier = candidates[0]
+        for candidate_model, candidate_tier in candidates:
+            if predict_seconds(candidate_model, candidate_tier, duration) <= target:
+                model_name, tier = candidate_model, candidate_tier
+    elif speed_profile == "fast":
+        model_name, tier = models[0], tiers["fast"]
+    elif speed_profile == "accurate":
+        model_name, tier = models[-1], tiers["accurate"]
+    elif speed_profile == "balanced":
+        model_name, tier = DEFAULT_MODEL, tiers["balanced"]
+    else:
+        model_name, tier = DEFAULT_MODEL, tiers["accurate"]
+
+    return model_name, tier, predict_seconds(model_name, tier, duration)
+
+def parse_decoding_request(data):
+    """Validate latencyBudget/speedProfile fields, returning (budget, profile, error)."""
+    latency_budget = data.get('latencyBudget')
+    speed_profile = data.get('speedProfile')
+
+    if latency_budget is not None:
+        try:
+            latency_budget = float(latency_budget)
+        except (TypeError, ValueError):
+            return None, None, "latencyBudget must be a number of seconds"
+        if latency_budget <= 0:
+            return None, None, "latencyBudget must be greater than zero"
+
+    if speed_profile is not None and speed_profile not in SPEED_PROFILES:
+        return None, None, f"speedProfile must be one of: {', '.join(SPEED_PROFILES)}"
+
+    return latency_budget, speed_profile, None
+
+def parse_deadline_request(data):
+    """Validate the deadlineMs field, returning (monotonic deadline or None, deadline ms, error)."""
+    deadline_ms = data.get('deadlineMs')
+    if deadline_ms is None:
+        return None, None, None
+    try:
+        deadline_ms = int(deadline_ms)
+    except (TypeError, ValueError):
+        return None, None, "deadlineMs must be a whole number of milliseconds"
+    if deadline_ms < MIN_DEADLINE_MS:
+        return None, None, f"deadlineMs must be at least {MIN_DEADLINE_MS}"
+    return time.monotonic() + deadline_ms / 1000, deadline_ms, None
+
+def parse_language_request(data, headers=None):
+    """Validate language/sessionId fields, returning (language, session id, error)."""
+    language = data.get('language') or None
+    session_id = data.get('sessionId') or (headers.get(SESSION_HEADER) if headers is not None else None)
+    
+    if language is not None:
+        language = str(language).lower()
+        if language not in _LANGUAGE_CODES:
+            return None, None, "language must be a Whisper language code such as 'en' or 'es'"
+    if session_id is not None:
+        session_id = str(session_id)[:128]
+    
+    return language, session_id, None
+
+def parse_diarization_request(data):
+    """Read the diarize/clinicianId fields, returning (diarize, clinician id)."""
+    diarize = data.get('diarize', DIARIZE)
+    if isinstance(diarize, str):
+        diarize = diarize.lower() not in ('', '0', 'false', 'no')
+    clinician_id = data.get('clinicianId') or None
+    if clinician_id is not None:
+        clinician_id = str(clinician_id)[:128]
+    return bool(diarize), clinician_id
+
+def get_diarizer():
+    """Create the diarizer and its thread pool on first use."""
+    global diarizer, diarization_pool
+    with diarizer_lock:
+        if diarizer is None:
+            embedder = OnnxEmbedder(DIARIZATION_MODEL) if DIARIZATION_MODEL else MelStatsEmbedder()
+            diarizer = Diarizer(embedder, VoiceProfiles(VOICE_PROFILES_PATH))
+            diarization_pool = ThreadPoolExecutor(max_workers=NUM_WORKERS, thread_name_prefix="diarization")
+            logger.info(f"Speaker diarization enabled ({embedder.name} embeddings)")
+        return diarizer
+
+def start_diarization(audio, clinician_id=None):
+    """Find speakers on the diarization pool, returning a future of the result."""
+    speaker_finder = get_diarizer()
+    return diarization_pool.submit(speaker_finder.diarize, audio, clinician_id)
+
+def pinned_language(session_id):
+    """Return the language pinned for a session, or None."""
+    if session_id is None:
+        return None
+    now = time.monotonic()
+    with session_lock:
+        entry = session_languages.get(session_id)
+        if entry is None:
+            return None
+        language, probability, last_used = entry
+        if now - last_used > SESSION_TTL:
+            del session_languages[session_id]
+            return None
+        session_languages[session_id] = (language, probability, now)
+        session_languages.move_to_end(session_id)
+        return language
+
+def pin_language(session_id, language, probability):
+    """Remember a confidently detected language for the session."""
+    with session_lock:
+        session_languages[session_id] = (language, probability, time.monotonic())
+        session_languages.move_to_end(session_id)
+        while len(session_languages) > MAX_SESSIONS:
+            session_languages.popitem(last=False)
+    logger.info(f"Pinned language '{language}' for session {session_id} ({probability:.2f})")
+
+def record_setup_time(model_name, vad_filter, detected, elapsed_ms):
+    """Fold a transcribe() setup time into the smoothed average for its kind."""
+    key = (model_name, vad_filter, detected)
+    with rtf_lock:
+        previous = setup_ms.get(key)
+        setup_ms[key] = elapsed_ms if previous is None else previous + RTF_SMOOTHING * (elapsed_ms - previous)
+
+def detection_cost_ms(model_name, vad_filter):
+    """Estimated language detection time for a model, or None until both kinds were seen."""
+    with rtf_lock:
+        detecting = setup_ms.get((model_name, vad_filter, True))
+        pinned = setup_ms.get((model_name, vad_filter, False))
+    if detecting is None or pinned is None:
+        return None
+    return max(0.0, detecting - pinned)
+
 def save_audio_file(audio_base64, audio_type):
     """Save base64 audio to temporary file."""
     try:
@@ -68,100 +843,1544 @@ def save_audio_file(audio_base64, audio_type):
         logger.error(f"Failed to save audio file: {e}")
         return None
 
-@app.route('/ping', methods=['GET'])
-def health_check():
-    """Health check endpoint."""
-    return jsonify({
+def is_pcm_type(audio_type):
+    """Return True for raw PCM MIME types such as audio/pcm or audio/l16;rate=16000."""
+    return audio_type.split(';')[0].strip().lower() in PCM_MIME_TYPES
+
+def pcm_type_rate(audio_type):
+    """Read the rate parameter from a PCM MIME type, defaulting to 16 kHz."""
+    for param in audio_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'rate':
+            return value.strip()
+    return SAMPLE_RATE
+
+def pcm_to_array(raw, sample_rate, pcm_format, compression=None):
+    """Wrap raw little-endian PCM bytes as the float32 16 kHz array Whisper expects.
+
+    float32 input at 16 kHz is used in place without copying; int16 needs a
+    single scaling pass. Raises ValueError for unsupported parameters.
+    """
+    if pcm_format not in PCM_FORMATS:
+        raise ValueError(f"pcmFormat must be one of: {', '.join(PCM_FORMATS)}")
+    try:
+        sample_rate = int(sample_rate)
+    except (TypeError, ValueError):
+        raise ValueError("sampleRate must be an integer")
+    if sample_rate <= 0:
+        raise ValueError("sampleRate must be greater than zero")
+    
+    if compression in (None, '', 'identity'):
+        pass
+    elif compression == 'lz4':
+        if lz4_frame is None:
+            raise ValueError("lz4 compression requires the 'lz4' package")
+        raw = lz4_frame.decompress(raw)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        with zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+            raw = reader.read()
+    else:
+        raise ValueError("compression must be one of: lz4, zstd")
+    
+    dtype = PCM_FORMATS[pcm_format]
+    if len(raw) % dtype.itemsize:
+        raise ValueError(f"PCM payload is not a whole number of {pcm_format} samples")
+    
+    samples = np.frombuffer(raw, dtype=dtype)
+    if dtype.kind == 'f':
+        audio = samples.astype(np.float32, copy=False)
+    else:
+        audio = samples.astype(np.float32)
+        audio *= 1.0 / 32768.0
+    
+    if sample_rate != SAMPLE_RATE:
+        # Linear resampling; capture at 16 kHz to skip this step entirely
+        duration = len(audio) / sample_rate
+        target_length = int(round(duration * SAMPLE_RATE))
+        positions = np.arange(target_length, dtype=np.float64) * (sample_rate / SAMPLE_RATE)
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    
+    return audio
+
+def warm_up():
+    """Run a short silent clip through each model so the first real request is not cold.
+
+    One clip per worker runs concurrently so every replica allocates its
+    buffers now, which also makes the per-worker memory overhead measurable.
+    """
+    global server_ready
+    for model_name, model in whisper_models.items():
+        warm_model(model_name, model, NUM_WORKERS)
+    memory_snapshots["warm"] = get_rss_bytes()
+    memory = memory_report()
+    logger.info(f"Memory: {memory['rss_mb']} MB resident, {memory['models_mb']} MB for models, "
+                f"{memory['per_worker_overhead_mb']} MB per worker ({NUM_WORKERS} workers)")
+    server_ready = True
+    publish_state()
+
+def warm_model(model_name, model, workers):
+    """Transcribe a second of silence on every replica of one model."""
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    
+    def run():
+        segments, _ = model.transcribe(silence, beam_size=1, best_of=1, temperature=[0.0], language="en")
+        for _ in segments:
+            pass
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.info(f"Warmed up '{model_name}' in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+@app.before_request
+def count_request_start():
+    global in_flight
+    with in_flight_lock:
+        in_flight += 1
+
+@app.teardown_request
+def count_request_end(exc):
+    global in_flight
+    with in_flight_lock:
+        in_flight -= 1
+
+@app.before_request
+def start_request_trace():
+    g.trace_span = tracer.start_trace(
+        f"{request.method} {request.path}",
+        request.headers.get('traceparent'),
+        {"http.method": request.method, "http.target": request.path}
+    )
+
+@app.after_request
+def add_trace_headers(response):
+    span = g.get('trace_span', NOOP_SPAN)
+    if span is not NOOP_SPAN:
+        span.set_attribute("http.status_code", response.status_code)
+        # Lets the client find the server span for its request
+        response.headers['traceresponse'] = format_traceparent(span.trace_id, span.span_id)
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    tracer.finish_trace(g.pop('trace_span', NOOP_SPAN), exc)
+
+@app.before_request
+def start_request_profile():
+    session = profile_session
+    if session is not None and session.running and not request.path.startswith('/debug') \
+            and request.path != '/ping':
+        g.profile_session = session if session.enter_request() else None
+
+@app.teardown_request
+def end_request_profile(exc):
+    session = g.pop('profile_session', None)
+    if session is not None:
+        session.exit_request()
+
+@app.before_request
+def route_to_backend():
+    """In router mode, forward everything but the router's own endpoints."""
+    if router is None or request.path in ROUTER_LOCAL_PATHS:
+        return None
+    
+    if request.method == 'DELETE' and request.path.startswith('/requests/'):
+        return cancel_routed_request(request.view_args['request_id'])
+    if request.path.startswith('/jobs/'):
+        try:
+            return routed_backend_response(router.job_status(request.view_args['job_id']), "No such job")
+        except OSError as e:
+            return jsonify({"error": f"Could not reach the backend: {e}"}), 502
+    
+    headers = dict(request.headers)
+    session_id = request.headers.get(SESSION_HEADER)
+    request_id = None
+    audio_seconds = 0.0
+    if request.path == '/transcribe':
+        # Name every transcription, so it can be cancelled on whichever backend runs it
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+            session_id = data.get('sessionId') or session_id
+            request_id = data.get('requestId') or request_id
+            if isinstance(data.get('audioBase64'), str):
+                audio_type = data.get('audioType', 'audio/webm')
+                audio_seconds = estimate_audio_seconds(
+                    len(data['audioBase64']) * 3 // 4, audio_type, data.get('sampleRate'),
+                    data.get('pcmFormat', 's16le'), bool(data.get('compression'))
+                )
+        else:
+            audio_seconds = estimate_audio_seconds(
+                request.content_length or 0, request.mimetype, request.args.get('sampleRate'),
+                request.args.get('pcmFormat', 's16le'),
+                bool(request.args.get('compression') or request.headers.get('Content-Encoding'))
+            )
+        request_id = str(request_id)[:128] if request_id else uuid.uuid4().hex
+        headers[REQUEST_ID_HEADER] = request_id
+    
+    span = g.get('trace_span', NOOP_SPAN)
+    if span is not NOOP_SPAN:
+        # Make the backend's spans children of the router's
+        headers['traceparent'] = format_traceparent(span.trace_id, span.span_id)
+    path = request.full_path if request.query_string else request.path
+    try:
+        with tracer.span("route", audio_seconds=round(audio_seconds, 1)):
+            status, response_headers, body, backend_url = router.forward(
+                request.method, path, request.get_data(), headers,
+                str(session_id)[:128] if session_id else None, audio_seconds, request_id
+            )
+    except NoBackendAvailable as e:
+        logger.warning(str(e))
+        return jsonify({"error": str(e)}), 503
+    if request.path == '/transcribe' and status == 200 and b'"job"' in body:
+        # A partial result; its remainder is finishing on that backend
+        job = (json.loads(body).get("job") or {}).get("id")
+        if job:
+            router.remember_job(job, backend_url)
+    
+    response = Response(body, status=status)
+    for name, value in response_headers:
+        if name.lower() not in ('content-length', 'transfer-encoding', 'connection', 'traceresponse'):
+            response.headers[name] = value
+    response.headers['X-Clinote-Backend'] = backend_url
+    return response
+
+def cancel_routed_request(request_id):
+    """Pass a cancellation to the backend running the request."""
+    try:
+        result = router.cancel(request_id)
+    except OSError as e:
+        return jsonify({"error": f"Could not reach the backend: {e}"}), 502
+    return routed_backend_response(result, "No running request with that id")
+
+def routed_backend_response(result, not_found):
+    """Relay a Router.cancel/job_status result, or 404 when no backend owns the id."""
+    if result is None:
+        return jsonify({"error": not_found}), 404
+    status, _, body, backend_url = result
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['X-Clinote-Backend'] = backend_url
+    return response
+
+def readiness():
+    """The parts of /ping that change only with the server's state."""
+    if router is not None:
+        # Ready as soon as any backend can take a transcription
+        healthy = router.healthy_backends()
+        return {
+            "status": "ok",
+            "model_loaded": bool(healthy),
+            "model_state": "resident" if healthy else "loading",
+            "ready": any(backend.ready for backend in healthy),
+            "backends": len(router.backends),
+            "healthy_backends": len(healthy),
+            "service": "clinote-whisper-router"
+        }
+    return {
         "status": "ok",
         "model_loaded": whisper_model is not None,
+        "model_state": model_state,
+        "ready": server_ready,
         "service": "clinote-whisper-server"
-    })
+    }
+
+@app.route('/ping', methods=['GET'])
+def health_check():
+    """Health check endpoint.
+
+    The weak ETag covers the readiness fields only, so a poller sending
+    If-None-Match gets 304 until the model state changes.
+    """
+    state = readiness()
+    response = jsonify(dict(state, pid=os.getpid(), in_flight=in_flight))
+    response.set_etag(request_key(*sorted(state.items()))[:16], weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events: state, load, overload, config and shutdown."""
+    try:
+        subscription = server_events.subscribe()
+    except TooManySubscribers as e:
+        return jsonify({"error": str(e)}), 503
+    return Response(event_stream(subscription), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def transcribe_array(audio, latency_budget=None, speed_profile=None, timings=None, metadata=None, store=True,
+                     language=None, session_id=None, diarize=False, clinician_id=None, cancel_token=None,
+                     deadline=None, decoding=None):
+    """Plan decoding for a 16 kHz float32 array, transcribe it and build the response.
+
+    An explicit language, or one pinned for the session, skips language detection.
+    With diarize, speakers are found while Whisper decodes and each segment gets
+    a speaker label. Models unloaded while idle are reloaded first. Once
+    cancel_token is cancelled, decoding stops at the next segment and
+    RequestCancelled is raised. Once time.monotonic() passes deadline,
+    decoding stops the same way and the segments so far are returned with
+    "partial": true while a background job transcribes the rest. A
+    (model name, tier name) pair in decoding skips planning and uses that
+    model and tier, as long as the model is still loaded.
+    """
+    stop_if_cancelled(cancel_token, len(audio) / SAMPLE_RATE)
+    acquire_models()
+    try:
+        return run_transcription(audio, latency_budget, speed_profile, timings, metadata, store,
+                                 language, session_id, diarize, clinician_id, cancel_token, deadline, decoding)
+    finally:
+        release_models()
+
+def stop_if_cancelled(cancel_token, remaining_seconds):
+    """Raise RequestCancelled if the request was cancelled, counting the audio left undecoded."""
+    if cancel_token is not None and cancel_token.cancelled:
+        active_requests.record_cancelled(remaining_seconds)
+        logger.info(f"Request {cancel_token.request_id} {cancel_token.reason}; "
+                    f"skipped {remaining_seconds:.1f}s of audio")
+        raise RequestCancelled(cancel_token.reason)
+
+def run_transcription(audio, latency_budget, speed_profile, timings, metadata, store, language, session_id,
+                      diarize=False, clinician_id=None, cancel_token=None, deadline=None, decoding=None):
+    timings = dict(timings or {})
+    language_source = "request" if language else None
+    if language is None:
+        language = pinned_language(session_id)
+        language_source = "session" if language else "detected"
+    audio_duration = len(audio) / SAMPLE_RATE
+    
+    if decoding is not None and decoding[0] in whisper_models:
+        model_name, tier = decoding[0], {tier["name"]: tier for tier in DECODE_TIERS}[decoding[1]]
+        predicted = predict_seconds(model_name, tier, audio_duration)
+    else:
+        model_name, tier, predicted = plan_decoding(audio_duration, latency_budget, speed_profile)
+    model = whisper_models[model_name]
+    if language_source == "detected" and model_name.endswith(".en"):
+        # English-only models never run detection
+        language_source = "model"
+    
+    # Diarization runs on its own thread while Whisper decodes
+    diarization = start_diarization(audio, clinician_id) if diarize else None
+    
+    logger.info(f"Transcribing {audio_duration:.2f}s of audio with {model_name}/{tier['name']}")
+    inference_started = time.perf_counter()
+    with tracer.span("transcribe.setup", model=model_name, profile=tier["name"],
+                     vad_filter=tier["vad_filter"], language_source=language_source):
+        segments, info = model.transcribe(
+            audio,
+            beam_size=tier["beam_size"],
+            best_of=tier["best_of"],
+            temperature=tier["temperature"],
+            without_timestamps=tier["without_timestamps"],
+            vad_filter=tier["vad_filter"],
+            vad_parameters=tier["vad_parameters"],
+            language=language
+        )
+    # transcribe() runs VAD and language detection eagerly, decoding is lazy
+    setup_elapsed_ms = (time.perf_counter() - inference_started) * 1000
+    detected = language_source == "detected"
+    record_setup_time(model_name, tier["vad_filter"], detected, setup_elapsed_ms)
+    
+    with tracer.span("transcribe.segments", audio_seconds=round(audio_duration, 2)) as segments_span:
+        segment_list = []
+        partial = False
+        normalize = NORMALIZE_TEXT
+        redact = REDACT_SEGMENTS
+        normalize_elapsed = redact_elapsed = 0.0
+        try:
+            for segment in segments:
+                text = segment.text
+                if normalize:
+                    # Per segment, as it is decoded, so partial results are normalized too
+                    normalize_started = time.perf_counter()
+                    text = normalize_text(text)
+                    normalize_elapsed += time.perf_counter() - normalize_started
+                if redact:
+                    redact_started = time.perf_counter()
+                    text = phi_redactor.redact(text)
+                    redact_elapsed += time.perf_counter() - redact_started
+                segment_list.append({"start": round(segment.start, 2), "end": round(segment.end, 2),
+                                     "text": text})
+                # The generator decodes the next window only when pulled, so stop here
+                stop_if_cancelled(cancel_token, audio_duration - segment.end)
+                if deadline is not None and time.monotonic() >= deadline and segment.end < audio_duration:
+                    partial = True
+                    break
+        except RequestCancelled:
+            segments.close()
+            if diarization is not None:
+                diarization.cancel()
+            raise
+        if partial:
+            segments.close()
+            if diarization is not None:
+                # Labels come with the full result instead
+                diarization.cancel()
+                diarization = None
+        segments_span.set_attribute("segments", len(segment_list))
+        segments_span.set_attribute("partial", partial)
+    
+    # Combine all segments into full transcript
+    transcript = " ".join([segment["text"] for segment in segment_list])
+    
+    inference_elapsed = time.perf_counter() - inference_started
+    if not partial:
+        record_rtf(model_name, tier, audio_duration, inference_elapsed)
+    timings["inference_ms"] = round(inference_elapsed * 1000, 2)
+    speakers = None
+    if diarization is not None:
+        # Only the wait beyond decoding adds latency
+        wait_started = time.perf_counter()
+        try:
+            with tracer.span("diarization.wait"):
+                speakers = diarization.result()
+            label_segments(segment_list, speakers["turns"])
+        except Exception as e:
+            logger.warning(f"Diarization failed: {e}")
+        timings["diarization_added_ms"] = round((time.perf_counter() - wait_started) * 1000, 2)
+    elapsed = sum(timings.values()) / 1000
+    timings["total_ms"] = round(elapsed * 1000, 2)
+    if speakers is not None:
+        # Ran in parallel with inference, not part of total_ms
+        timings["diarization_ms"] = speakers["elapsed_ms"]
+    if normalize:
+        # Spent inside inference_ms, not added to total_ms
+        timings["normalize_ms"] = round(normalize_elapsed * 1000, 3)
+    if redact:
+        timings["redact_ms"] = round(redact_elapsed * 1000, 3)
+    detection_ms = detection_cost_ms(model_name, tier["vad_filter"])
+    if detection_ms is not None:
+        # Estimates, not part of total_ms
+        timings["language_detection_ms" if detected else "language_detection_saved_ms"] = round(detection_ms, 2)
+    
+    if detected and session_id is not None and info.language_probability >= LANGUAGE_PIN_PROBABILITY:
+        pin_language(session_id, info.language, info.language_probability)
+    
+    logger.info(f"Transcription completed. Language: {info.language}, Duration: {info.duration:.2f}s")
+    if LOG_TRANSCRIPTS:
+        logger.info(f"Transcript: {transcript}")
+    
+    if transcript_store is not None and store and not partial:
+        save_transcript(
+            transcript,
+            segment_list,
+            redacted=redact,
+            duration=info.duration,
+            language=info.language,
+            model=model_name,
+            timings=timings,
+            metadata=metadata
+        )
+    
+    result = {
+        "transcript": transcript,
+        "language": info.language,
+        "language_probability": round(info.language_probability, 3),
+        "duration": info.duration,
+        "segments": segment_list,
+        "partial": partial,
+        "redacted": redact,
+        "speakers": format_speakers(speakers),
+        "timings": timings,
+        "decoding": {
+            "model": model_name,
+            "profile": tier["name"],
+            "beam_size": tier["beam_size"],
+            "best_of": tier["best_of"],
+            "temperature": tier["temperature"],
+            "without_timestamps": tier["without_timestamps"],
+            "vad_filter": tier["vad_filter"],
+            "vad_parameters": tier["vad_parameters"],
+            "language_source": language_source,
+            "latency_budget": latency_budget,
+            "predicted_seconds": round(predicted, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "budget_met": None if latency_budget is None else elapsed <= latency_budget
+        }
+    }
+    if partial:
+        covered_end = segment_list[-1]["end"]
+        result["covered"] = {"start": 0.0, "end": covered_end}
+        logger.info(f"Deadline reached after {covered_end:.1f}s of {audio_duration:.1f}s; "
+                    "transcribing the rest in the background")
+        try:
+            job_id = background_jobs.submit("transcription", complete_transcription, audio, dict(result),
+                                            session_id, diarize, clinician_id, metadata, store)
+            result["job"] = {"id": job_id, "url": f"/jobs/{job_id}"}
+        except JobLimitReached as e:
+            logger.warning(f"Not finishing the partial transcription: {e}")
+            result["job"] = None
+    return result
+
+def save_transcript(transcript, segments, redacted=False, **record):
+    """Queue a transcript for the store, masking PHI first unless it already is."""
+    if REDACT_STORE and not redacted:
+        segments = phi_redactor.redact_segments(segments)
+        transcript = " ".join(segment["text"] for segment in segments)
+    # Written by the store's writer thread; never blocks the response
+    transcript_store.save(transcript, segments=segments, **record)
+
+def format_speakers(speakers):
+    """The response's speakers section from a diarization result."""
+    return None if speakers is None else {
+        "talk_seconds": speakers["speakers"],
+        "turns": speakers["turns"],
+        "clinician_source": speakers["clinician_source"]
+    }
+
+def complete_transcription(audio, partial, session_id, diarize, clinician_id, metadata, store):
+    """Background job: transcribe what a deadline cut off and merge it with the partial result."""
+    offset = partial["covered"]["end"]
+    reservation = memory_governor.admit(audio.nbytes + TRANSCRIPTION_OVERHEAD_MB * MB)
+    try:
+        diarization = start_diarization(audio, clinician_id) if diarize else None
+        # Same model, tier and language as the first part, so the transcript reads as one
+        rest = transcribe_array(audio[int(offset * SAMPLE_RATE):], store=False, language=partial["language"],
+                                session_id=session_id,
+                                decoding=(partial["decoding"]["model"], partial["decoding"]["profile"]))
+        segment_list = partial["segments"] + [
+            dict(segment, start=round(segment["start"] + offset, 2), end=round(segment["end"] + offset, 2))
+            for segment in rest["segments"]
+        ]
+        speakers = None
+        if diarization is not None:
+            try:
+                speakers = diarization.result()
+                label_segments(segment_list, speakers["turns"])
+            except Exception as e:
+                logger.warning(f"Diarization failed: {e}")
+    finally:
+        memory_governor.release(reservation)
+    
+    transcript = " ".join(segment["text"] for segment in segment_list)
+    timings = {
+        "partial_ms": partial["timings"]["total_ms"],
+        "completion_ms": rest["timings"]["total_ms"],
+    }
+    redacted = partial["redacted"] and rest["redacted"]
+    if transcript_store is not None and store:
+        save_transcript(
+            transcript,
+            segment_list,
+            redacted=redacted,
+            duration=partial["duration"],
+            language=partial["language"],
+            model=partial["decoding"]["model"],
+            timings=timings,
+            metadata=metadata
+        )
+    result = dict(partial, transcript=transcript, segments=segment_list, partial=False, redacted=redacted,
+                  covered={"start": 0.0, "end": round(partial["duration"], 2)},
+                  speakers=format_speakers(speakers), timings=timings)
+    result.pop("job", None)
+    return result
+
+def transcribe_payload(data, headers=None, disconnected=None):
+    """Transcribe a JSON request body, returning (response body, status code).
+
+    Shared by the HTTP API and the launcher's native-messaging host.
+    disconnected is an optional probe that cancels the work once the
+    client has gone away.
+    """
+    if not data or 'audioBase64' not in data:
+        return {"error": "Missing audioBase64 in request"}, 400
+    
+    audio_type = data.get('audioType', 'audio/webm')
+    
+    latency_budget, speed_profile, error = parse_decoding_request(data)
+    if error:
+        return {"error": error}, 400
+    language, session_id, error = parse_language_request(data, headers)
+    if error:
+        return {"error": error}, 400
+    diarize, clinician_id = parse_diarization_request(data)
+    deadline, deadline_ms, error = parse_deadline_request(data)
+    if error:
+        return {"error": error}, 400
+    
+    # Check if model is loaded (idle-unloaded models reload on demand)
+    if whisper_model is None and model_state != "unloaded":
+        return {"error": "Whisper model not loaded"}, 503
+    
+    key = request_key(
+        data['audioBase64'], audio_type, data.get('sampleRate'), data.get('pcmFormat'),
+        data.get('compression'), latency_budget, speed_profile, data.get('store', True),
+        language or pinned_language(session_id), diarize, clinician_id, deadline_ms
+    )
+    estimated_bytes = estimate_request_bytes(len(data['audioBase64']), audio_type, data.get('pcmFormat', 's16le'))
+    request_id = data.get('requestId') or (headers.get(REQUEST_ID_HEADER) if headers is not None else None)
+    cancel_token = active_requests.register(request_id, disconnected)
+    try:
+        return coalesce_transcription(key, lambda: decode_and_transcribe(
+            data, audio_type, latency_budget, speed_profile, language, session_id, diarize, clinician_id,
+            cancel_token, deadline
+        ), estimated_bytes, cancel_token)
+    finally:
+        active_requests.finish(cancel_token)
+
+def coalesce_transcription(key, compute, estimated_bytes=0, cancel_token=None):
+    """Run compute() for this request, or join an identical one already running.
+
+    Only the request that runs compute() reserves memory with the governor;
+    requests that join it share the same buffers. A cancelled leader keeps
+    going while other requests are waiting on its result.
+    """
+    if cancel_token is not None:
+        cancel_token.keep_alive = lambda: transcriptions.waiters(key) > 0
+    
+    def admitted_compute():
+        queued = active_transcriptions - NUM_WORKERS
+        if MAX_QUEUE_DEPTH is not None and queued >= MAX_QUEUE_DEPTH:
+            logger.warning(f"Refusing a transcription: {queued} already waiting for a worker")
+            error = f"Server is busy ({queued} transcriptions queued); try again shortly"
+            server_events.publish("overload", {"reason": "queue", "error": error, "queue_depth": queued})
+            return {"error": error}, 503
+        try:
+            reservation = memory_governor.admit(estimated_bytes)
+        except MemoryBudgetExceeded as e:
+            logger.warning(str(e))
+            server_events.publish("overload", {"reason": "memory", "error": str(e), "queue_depth": queued})
+            return {"error": str(e)}, 503
+        try:
+            return compute()
+        finally:
+            memory_governor.release(reservation)
+    
+    try:
+        (body, status), shared = transcriptions.run(key, admitted_compute,
+                                                    cost=lambda result: result[0].get("duration") or 0)
+    except RequestCancelled as e:
+        body, status, shared = {"error": f"Request cancelled: {e}", "cancelled": True}, CANCELLED_STATUS, False
+    if shared:
+        logger.info("Joined an identical transcription already in progress")
+        body = dict(body, coalesced=True)
+    if cancel_token is not None:
+        body = dict(body, request_id=cancel_token.request_id)
+    return body, status
+
+def decode_and_transcribe(data, audio_type, latency_budget, speed_profile, language=None, session_id=None,
+                          diarize=False, clinician_id=None, cancel_token=None, deadline=None):
+    """Decode the audio in a JSON request body and transcribe it."""
+    decode_started = time.perf_counter()
+    
+    if is_pcm_type(audio_type):
+        try:
+            with tracer.span("decode", audio_type=audio_type):
+                audio = pcm_to_array(
+                    base64.b64decode(data['audioBase64']),
+                    data.get('sampleRate', pcm_type_rate(audio_type)),
+                    data.get('pcmFormat', 's16le'),
+                    data.get('compression')
+                )
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        timings = {"decode_ms": round((time.perf_counter() - decode_started) * 1000, 2)}
+        return transcribe_array(audio, latency_budget, speed_profile, timings,
+                                data.get('metadata'), data.get('store', True), language, session_id,
+                                diarize, clinician_id, cancel_token, deadline), 200
+    
+    # Save audio to temporary file
+    with tracer.span("decode.base64", audio_type=audio_type):
+        temp_file_path = save_audio_file(data['audioBase64'], audio_type)
+    if not temp_file_path:
+        return {"error": "Failed to process audio data"}, 400
+    
+    try:
+        # Decode once up front so the planner knows the audio duration
+        logger.info(f"Decoding audio file: {temp_file_path}")
+        with tracer.span("decode", audio_type=audio_type):
+            audio = decode_audio(temp_file_path, sampling_rate=SAMPLE_RATE)
+        timings = {"decode_ms": round((time.perf_counter() - decode_started) * 1000, 2)}
+        return transcribe_array(audio, latency_budget, speed_profile, timings,
+                                data.get('metadata'), data.get('store', True), language, session_id,
+                                diarize, clinician_id, cancel_token, deadline), 200
+        
+    finally:
+        # Clean up temporary file
+        try:
+            os.unlink(temp_file_path)
+        except:
+            pass
+
+def client_disconnect_probe():
+    """Probe for the current HTTP client hanging up, or None if the server cannot tell."""
+    sock = request.environ.get('werkzeug.socket')
+    return socket_disconnect_probe(sock) if sock is not None else None
+
+@app.route('/requests', methods=['GET'])
+def list_requests():
+    """Transcriptions currently running."""
+    return jsonify({"requests": active_requests.active(), **active_requests.stats()})
+
+@app.route('/requests/<request_id>', methods=['DELETE'])
+def cancel_request(request_id):
+    """Cancel a running transcription; it stops at the next segment."""
+    if not active_requests.cancel(request_id):
+        return jsonify({"error": "No running request with that id"}), 404
+    return jsonify({"request_id": request_id, "cancelling": True}), 202
+
+def job_payload(job_id):
+    """A background job's status and, once done, its result, as (body, status code)."""
+    job = background_jobs.get(job_id)
+    if job is None:
+        return {"error": "No such job; results are kept for an hour"}, 404
+    return job, 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Fetch the full transcript for a request that returned a partial one."""
+    body, status = job_payload(job_id)
+    return jsonify(body), status
 
 @app.route('/transcribe', methods=['POST'])
 def transcribe_audio():
-    """Transcribe audio from base64 data."""
+    """Transcribe audio from base64 data or a raw PCM request body."""
     try:
-        # Validate request
-        if not request.is_json:
-            return jsonify({"error": "Content-Type must be application/json"}), 400
-        
-        data = request.get_json()
+        disconnected = client_disconnect_probe()
+        if request.is_json:
+            body, status = transcribe_payload(request.get_json(), request.headers, disconnected)
+            with tracer.span("response"):
+                return jsonify(body), status
         
-        if not data or 'audioBase64' not in data:
-            return jsonify({"error": "Missing audioBase64 in request"}), 400
+        # Raw PCM can be posted as the request body, skipping JSON and base64
+        if request.mimetype not in PCM_MIME_TYPES:
+            return jsonify({"error": "Content-Type must be application/json or audio/pcm"}), 400
         
-        audio_base64 = data['audioBase64']
-        audio_type = data.get('audioType', 'audio/webm')
+        latency_budget, speed_profile, error = parse_decoding_request(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        language, session_id, error = parse_language_request(request.args, request.headers)
+        if error:
+            return jsonify({"error": error}), 400
+        diarize, clinician_id = parse_diarization_request(request.args)
+        deadline, deadline_ms, error = parse_deadline_request(request.args)
+        if error:
+            return jsonify({"error": error}), 400
         
-        # Check if model is loaded
-        if whisper_model is None:
+        # Check if model is loaded (idle-unloaded models reload on demand)
+        if whisper_model is None and model_state != "unloaded":
             return jsonify({"error": "Whisper model not loaded"}), 503
         
-        # Save audio to temporary file
-        temp_file_path = save_audio_file(audio_base64, audio_type)
-        if not temp_file_path:
-            return jsonify({"error": "Failed to process audio data"}), 400
+        raw = request.get_data(cache=False)
+        sample_rate = request.args.get('sampleRate', SAMPLE_RATE)
+        pcm_format = request.args.get('pcmFormat', 's16le')
+        compression = request.args.get('compression') or request.headers.get('Content-Encoding')
+        store = request.args.get('store', 'true').lower() != 'false'
+        
+        def decode_and_transcribe_pcm():
+            decode_started = time.perf_counter()
+            try:
+                with tracer.span("decode", audio_type=request.mimetype):
+                    audio = pcm_to_array(raw, sample_rate, pcm_format, compression)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            timings = {"decode_ms": round((time.perf_counter() - decode_started) * 1000, 2)}
+            return transcribe_array(audio, latency_budget, speed_profile, timings, store=store,
+                                    language=language, session_id=session_id,
+                                    diarize=diarize, clinician_id=clinician_id, cancel_token=cancel_token,
+                                    deadline=deadline), 200
         
+        key = request_key(raw, "pcm", sample_rate, pcm_format, compression, latency_budget, speed_profile, store,
+                          language or pinned_language(session_id), diarize, clinician_id, deadline_ms)
+        estimated_bytes = estimate_request_bytes(len(raw), 'audio/pcm', pcm_format, base64_encoded=False)
+        if compression:
+            estimated_bytes *= 2
+        cancel_token = active_requests.register(request.headers.get(REQUEST_ID_HEADER), disconnected)
         try:
-            # Transcribe audio
-            logger.info(f"Transcribing audio file: {temp_file_path}")
-            segments, info = whisper_model.transcribe(temp_file_path)
-            
-            # Combine all segments into full transcript
-            transcript = " ".join([segment.text for segment in segments])
-            
-            logger.info(f"Transcription completed. Language: {info.language}, Duration: {info.duration:.2f}s")
-            
-            return jsonify({
-                "transcript": transcript,
-                "language": info.language,
-                "duration": info.duration
-            })
-            
+            body, status = coalesce_transcription(key, decode_and_transcribe_pcm, estimated_bytes, cancel_token)
         finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+            active_requests.finish(cancel_token)
+        with tracer.span("response"):
+            return jsonify(body), status
                 
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         return jsonify({"error": f"Transcription failed: {str(e)}"}), 500
 
+def summarize_payload(data):
+    """Summarize a JSON request body, returning (response body, status code)."""
+    if not data or not isinstance(data.get('transcript'), str):
+        return {"error": "Missing transcript in request"}, 400
+    
+    specialty = data.get('specialty', 'primary-care')
+    if specialty not in SPECIALTY_TERMS:
+        specialty = 'primary-care'
+    
+    started = time.perf_counter()
+    summary = summarize(data['transcript'], specialty)
+    logger.info(f"Summarized {len(data['transcript'])} characters in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return summary, 200
+
+@app.route('/summarize', methods=['POST'])
+def summarize_transcript():
+    """Build a structured clinical summary from a transcript."""
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Content-Type must be application/json"}), 400
+        body, status = summarize_payload(request.get_json())
+        return jsonify(body), status
+    except Exception as e:
+        logger.error(f"Summarization error: {e}")
+        return jsonify({"error": f"Summarization failed: {str(e)}"}), 500
+
+def get_code_index(hold=False):
+    """Open the memory-mapped code index, building it if it is missing or stale.
+
+    With hold, the index stays open until release_code_index(), even if
+    it is evicted meanwhile.
+    """
+    global codes
+    with codes_lock:
+        if codes is None:
+            started = time.perf_counter()
+            codes = code_index.load_index()
+            logger.info(f"Code index loaded: {codes.code_count} codes, {codes.term_count} terms "
+                        f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        if hold:
+            codes_users[codes] = codes_users.get(codes, 0) + 1
+        return codes
+
+def release_code_index(index):
+    with codes_lock:
+        codes_users[index] -= 1
+        if codes_users[index]:
+            return
+        del codes_users[index]
+        if index is not codes:
+            # Evicted while this query ran
+            index.close()
+
+def format_code_suggestions(suggestions):
+    """Shape index results like the cloud prompt's {"code", "name"} entries."""
+    return [
+        {"code": s["code"], "name": s["description"], "score": s["score"], "matched": s["matched"]}
+        for s in suggestions
+    ]
+
+def suggest_codes_payload(data):
+    """Suggest CPT and ICD-10 codes for a JSON request body, returning (response body, status code)."""
+    if not data:
+        return {"error": "Missing transcript, note or query in request"}, 400
+    
+    try:
+        limit = int(data.get('limit', CODE_SUGGESTION_LIMIT))
+    except (TypeError, ValueError):
+        return {"error": "limit must be an integer"}, 400
+    
+    note = data.get('note')
+    if isinstance(note, dict):
+        parts = []
+        for section, value in note.items():
+            if isinstance(value, str) and value != "Not specified":
+                parts.extend([value] * (2 if section in CODE_WEIGHTED_SECTIONS else 1))
+        text = " ".join(parts)
+    else:
+        text = data.get('transcript') or data.get('query')
+    if not isinstance(text, str):
+        return {"error": "Missing transcript, note or query in request"}, 400
+    
+    started = time.perf_counter()
+    index = get_code_index(hold=True)
+    try:
+        # A bare query is treated as typeahead on its last word
+        rank = index.complete if 'query' in data and 'transcript' not in data and not note else index.suggest
+        body = {
+            "cptCodes": format_code_suggestions(rank(text, limit, "CPT")),
+            "diagnosisCodes": format_code_suggestions(rank(text, limit, "ICD10")),
+        }
+    finally:
+        release_code_index(index)
+    body["timings"] = {"suggest_ms": round((time.perf_counter() - started) * 1000, 2)}
+    return body, 200
+
+@app.route('/codes/suggest', methods=['GET', 'POST'])
+def suggest_codes():
+    """Rank CPT and ICD-10 codes for a transcript, extracted note or typeahead query."""
+    try:
+        if request.method == 'GET':
+            data = request.args
+        elif request.is_json:
+            data = request.get_json()
+        else:
+            return jsonify({"error": "Content-Type must be application/json"}), 400
+        body, status = suggest_codes_payload(data)
+        return jsonify(body), status
+    except Exception as e:
+        logger.error(f"Code suggestion error: {e}")
+        return jsonify({"error": f"Code suggestion failed: {str(e)}"}), 500
+
+def open_transcript_store():
+    """Open the transcript store if TRANSCRIPT_STORE_PATH is set."""
+    global transcript_store
+    if TRANSCRIPT_STORE_PATH and transcript_store is None:
+        transcript_store = TranscriptStore(
+            TRANSCRIPT_STORE_PATH,
+            retention_days=TRANSCRIPT_RETENTION_DAYS,
+            max_records=TRANSCRIPT_MAX_RECORDS
+        )
+        logger.info(f"Transcript store enabled: {TRANSCRIPT_STORE_PATH}")
+    return transcript_store
+
+@app.route('/transcripts/search', methods=['GET'])
+def search_transcripts():
+    """Full-text search over stored transcripts."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if transcript_store is None:
+        return jsonify({"error": "Transcript store is not enabled"}), 404
+    
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+        offset = int(request.args.get('offset', 0))
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    
+    started = time.perf_counter()
+    results = transcript_store.search(query, limit=limit, offset=offset, since=since, until=until)
+    return jsonify({
+        "query": query,
+        "results": results,
+        "timings": {"search_ms": round((time.perf_counter() - started) * 1000, 2)}
+    })
+
+@app.route('/transcripts/<int:transcript_id>', methods=['GET', 'DELETE'])
+def stored_transcript(transcript_id):
+    """Fetch or delete one stored transcript."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if transcript_store is None:
+        return jsonify({"error": "Transcript store is not enabled"}), 404
+    
+    if request.method == 'DELETE':
+        removed = transcript_store.purge(ids=[transcript_id])
+        return jsonify({"deleted": removed}), 200 if removed else 404
+    
+    record = transcript_store.get(transcript_id)
+    if record is None:
+        return jsonify({"error": "Transcript not found"}), 404
+    return jsonify(record)
+
+@app.route('/transcripts/purge', methods=['POST'])
+def purge_transcripts():
+    """Apply the retention policy now, or purge before a timestamp / everything."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if transcript_store is None:
+        return jsonify({"error": "Transcript store is not enabled"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    older_than_days = data.get('olderThanDays')
+    if older_than_days is not None and (isinstance(older_than_days, bool)
+                                        or not isinstance(older_than_days, (int, float)) or older_than_days < 0):
+        return jsonify({"error": "olderThanDays must be a number of days, zero or more"}), 400
+    if data.get('all') is True:
+        removed = transcript_store.purge(everything=True)
+    elif older_than_days is not None:
+        removed = transcript_store.purge(before=time.time() - older_than_days * 86400)
+    else:
+        removed = transcript_store.purge()
+    logger.info(f"Purged {removed} stored transcripts")
+    return jsonify({"deleted": removed})
+
+def check_admin_token():
+    """Return an error response unless the request carries ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled; start the server with --admin-token"}), 404
+    supplied = request.headers.get('Authorization', '')
+    if supplied.startswith('Bearer '):
+        supplied = supplied[len('Bearer '):]
+    if not hmac.compare_digest(supplied.strip().encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Invalid or missing admin token"}), 401
+    return None
+
+def tier_overrides(value):
+    """Validate {"tier": {"beam_size": 2, ...}} decoding overrides (a dict or JSON text)."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError("decode tiers must be an object of tier name to parameters")
+    checked = {}
+    for name, params in value.items():
+        if name not in SPEED_PROFILES:
+            raise ValueError(f"unknown decode tier '{name}'; tiers are {', '.join(SPEED_PROFILES)}")
+        if not isinstance(params, dict) or not set(params) <= set(TUNABLE_TIER_KEYS):
+            raise ValueError(f"decode tier parameters must be among: {', '.join(TUNABLE_TIER_KEYS)}")
+        params = dict(params)
+        for key in ("beam_size", "best_of"):
+            if key in params and (not isinstance(params[key], int) or isinstance(params[key], bool)
+                                  or not 1 <= params[key] <= 10):
+                raise ValueError(f"{key} must be a whole number from 1 to 10")
+        if "temperature" in params:
+            temperature = params["temperature"]
+            temperature = temperature if isinstance(temperature, list) else [temperature]
+            if not temperature or not all(isinstance(t, (int, float)) and 0 <= t <= 1 for t in temperature):
+                raise ValueError("temperature must be a number or list of numbers from 0 to 1")
+            params["temperature"] = [float(t) for t in temperature]
+        for key in ("without_timestamps", "vad_filter"):
+            if key in params and not isinstance(params[key], bool):
+                raise ValueError(f"{key} must be true or false")
+        vad = params.get("vad_parameters")
+        if vad is not None and (not isinstance(vad, dict) or not set(vad) <= set(VAD_PARAMETER_KEYS)):
+            raise ValueError(f"vad_parameters must be an object with keys among: {', '.join(VAD_PARAMETER_KEYS)}")
+        checked[name] = params
+    return checked
+
+def optional_number(minimum, integer=False):
+    """Validator for a number at least minimum, or null to switch the feature off."""
+    def check(value):
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or (integer and value != int(value)):
+            raise ValueError(f"must be a {'whole ' if integer else ''}number or null")
+        if value < minimum:
+            raise ValueError(f"must be at least {minimum}")
+        return int(value) if integer else float(value)
+    return check
+
+def required(check):
+    def required_check(value):
+        if value is None:
+            raise ValueError("cannot be null")
+        return check(value)
+    return required_check
+
+def one_of(choices):
+    def check(value):
+        if value not in choices:
+            raise ValueError(f"must be one of: {', '.join(choices)}")
+        return value
+    return check
+
+def boolean(value):
+    if not isinstance(value, bool):
+        raise ValueError("must be true or false")
+    return value
+
+def model_names(value):
+    if not isinstance(value, list) or not all(isinstance(name, str) and name for name in value):
+        raise ValueError("must be a list of model names")
+    return value
+
+def fraction(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= 1:
+        raise ValueError("must be a number above 0 and at most 1")
+    return float(value)
+
+# Settings PATCH /config accepts: name -> (module global, validator, needs a model reload)
+RUNTIME_SETTINGS = {
+    "model": ("DEFAULT_MODEL", required(lambda v: model_names([v])[0]), True),
+    "extra_models": ("EXTRA_MODELS", model_names, True),
+    "device": ("DEVICE", one_of(DEVICES), True),
+    "compute_type": ("COMPUTE_TYPE", one_of(COMPUTE_TYPES), True),
+    "workers": ("NUM_WORKERS", required(optional_number(1, integer=True)), True),
+    "cpu_threads": ("CPU_THREADS", required(optional_number(0, integer=True)), True),
+    "max_queue_depth": ("MAX_QUEUE_DEPTH", optional_number(0, integer=True), False),
+    "memory_budget": ("MEMORY_BUDGET_MB", optional_number(1), False),
+    "idle_unload": ("IDLE_UNLOAD_SECONDS", optional_number(1), False),
+    "budget_headroom": ("BUDGET_HEADROOM", fraction, False),
+    "language_pin_probability": ("LANGUAGE_PIN_PROBABILITY", fraction, False),
+    "diarize": ("DIARIZE", boolean, False),
+    "normalize_text": ("NORMALIZE_TEXT", boolean, False),
+    "redact_logs": ("REDACT_LOGS", boolean, False),
+    "redact_store": ("REDACT_STORE", boolean, False),
+    "redact_segments": ("REDACT_SEGMENTS", boolean, False),
+    "log_transcripts": ("LOG_TRANSCRIPTS", boolean, False),
+    "trace_sample_rate": ("TRACE_SAMPLE_RATE", lambda v: 0.0 if v == 0 else fraction(v), False),
+}
+
+# Latest staged model reload: state is "staging", "swapped" or "failed"
+config_reload = None
+config_lock = threading.Lock()
+
+def current_config():
+    """Effective values of every runtime setting, with the decode tiers."""
+    config = {name: globals()[setting] for name, (setting, _, _) in RUNTIME_SETTINGS.items()}
+    config["decode_tiers"] = {
+        tier["name"]: {key: tier[key] for key in TUNABLE_TIER_KEYS} for tier in DECODE_TIERS
+    }
+    return config
+
+def apply_decode_tiers(overrides):
+    """Swap in new tier definitions; requests already planned keep the old ones."""
+    global DECODE_TIERS
+    DECODE_TIERS = [dict(tier, **overrides.get(tier["name"], {})) for tier in DECODE_TIERS]
+
+def apply_config(changes):
+    """Validate and apply a PATCH /config body, returning (response body, status code).
+
+    Nothing is applied unless every setting is valid. Settings that only
+    need new values take effect for the next request; settings that need
+    new models are loaded in the background and swapped in when ready.
+    """
+    global config_reload
+    if not isinstance(changes, dict) or not changes:
+        return {"error": "Send a JSON object of settings to change"}, 400
+    live, reload, errors = {}, {}, {}
+    for key, value in changes.items():
+        name = key.replace("-", "_")
+        try:
+            if name == "decode_tiers":
+                live[name] = tier_overrides(value)
+            elif name in RUNTIME_SETTINGS:
+                _, check, needs_reload = RUNTIME_SETTINGS[name]
+                (reload if needs_reload else live)[name] = check(value)
+            else:
+                errors[key] = f"not a runtime setting; change it in the config file and restart"
+        except ValueError as e:
+            errors[key] = str(e)
+    if reload and router is not None:
+        errors.update({name: "a router loads no models; change it on each backend" for name in reload})
+    if errors:
+        return {"error": "Invalid settings", "settings": errors}, 400
+    
+    with config_lock:
+        if reload and config_reload is not None and config_reload["state"] == "staging":
+            return {"error": "A model reload is already being staged", "reload": config_reload}, 409
+        for name, value in live.items():
+            if name == "decode_tiers":
+                apply_decode_tiers(value)
+            else:
+                globals()[RUNTIME_SETTINGS[name][0]] = value
+        if "memory_budget" in live:
+            memory_governor.budget = int(MEMORY_BUDGET_MB * MB) if MEMORY_BUDGET_MB else None
+        if "redact_logs" in live:
+            log_redaction.enabled = REDACT_LOGS
+        if "trace_sample_rate" in live:
+            tracer.configure(TRACE_SAMPLE_RATE, OTLP_ENDPOINT, TRACE_FILE)
+        if live:
+            logger.info(f"Applied settings: {', '.join(sorted(live))}")
+        if "max_queue_depth" in live:
+            publish_load()
+        if reload:
+            config_reload = {"state": "staging", "settings": reload, "started": time.time()}
+            threading.Thread(target=stage_reload, args=(reload,), name="config-reload", daemon=True).start()
+    
+    body = {"applied": sorted(live), "config": current_config()}
+    server_events.publish("config", {"applied": sorted(live), "reload": config_reload if reload else None})
+    if reload:
+        body["reload"] = config_reload
+        return body, 202
+    return body, 200
+
+def stage_reload(settings):
+    """Load and warm models with new settings next to the current ones, then swap them in."""
+    global config_reload, whisper_model, whisper_models, models_swapping
+    values = {RUNTIME_SETTINGS[name][0]: value for name, value in settings.items()}
+    staged = dict({setting: globals()[setting] for setting in
+                   ("DEFAULT_MODEL", "EXTRA_MODELS", "DEVICE", "COMPUTE_TYPE", "NUM_WORKERS", "CPU_THREADS")},
+                  **values)
+    reservation = 0
+    try:
+        with model_lock:
+            unloaded = model_state == "unloaded"
+            if unloaded:
+                # Nothing resident: the next request loads with the new settings
+                globals().update(staged)
+        if not unloaded:
+            names = [staged["DEFAULT_MODEL"]] + [n for n in staged["EXTRA_MODELS"] if n != staged["DEFAULT_MODEL"]]
+            # Both sets of models are resident until the swap
+            reservation = memory_governor.admit(sum(model_bytes.get(name, 0) for name in names))
+            models, infos = {}, {}
+            for name in names:
+                models[name], infos[name] = open_model(name, staged["DEVICE"], staged["COMPUTE_TYPE"],
+                                                       staged["CPU_THREADS"], staged["NUM_WORKERS"])
+                warm_model(name, models[name], staged["NUM_WORKERS"])
+            with model_lock:
+                # Let transcriptions on the old models finish; new ones wait for the swap
+                models_swapping = True
+                try:
+                    while active_transcriptions:
+                        models_changed.wait()
+                    globals().update(staged)
+                    whisper_models = models
+                    whisper_model = models[DEFAULT_MODEL]
+                    model_load_info.update(infos)
+                finally:
+                    models_swapping = False
+                    models_changed.notify_all()
+            gc.collect()
+            if TRIM_ALLOCATOR:
+                trim_allocator()
+        state = {"state": "swapped", "finished": time.time()}
+        logger.info(f"Reloaded models with new settings: {', '.join(sorted(settings))}")
+    except Exception as e:
+        state = {"state": "failed", "error": str(e), "finished": time.time()}
+        logger.error(f"Staged model reload failed, keeping the current models: {e}")
+    finally:
+        memory_governor.release(reservation)
+    with config_lock:
+        config_reload = dict(config_reload, **state)
+    server_events.publish("config", {"applied": [], "reload": config_reload})
+    publish_state()
+    publish_load()
+
+@app.route('/config', methods=['GET'])
+def get_config():
+    """Current runtime settings and the state of the last staged reload."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    return jsonify({"config": current_config(), "config_file": CONFIG_PATH, "reload": config_reload})
+
+@app.route('/config', methods=['PATCH'])
+def patch_config():
+    """Change runtime settings without a restart."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    body, status = apply_config(request.get_json(silent=True))
+    return jsonify(body), status
+
+@app.route('/voice-profiles/<clinician_id>', methods=['DELETE'])
+def delete_voice_profile(clinician_id):
+    """Forget a clinician's cached voice profile."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    removed = get_diarizer().profiles.delete(clinician_id)
+    return jsonify({"deleted": removed}), 200 if removed else 404
+
+@app.route('/debug/profile', methods=['POST'])
+def start_profile():
+    """Profile the next N requests and/or T seconds."""
+    global profile_session
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        max_requests = int(data['requests']) if data.get('requests') is not None else None
+        seconds = float(data['seconds']) if data.get('seconds') is not None else None
+        interval = float(data.get('intervalMs', 5)) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"error": "requests, seconds and intervalMs must be numbers"}), 400
+    if max_requests is None and seconds is None:
+        seconds = 30
+    if (max_requests is not None and max_requests < 1) or (seconds is not None and seconds <= 0) or interval <= 0:
+        return jsonify({"error": "requests, seconds and intervalMs must be greater than zero"}), 400
+    mode = data.get('mode', 'sample')
+    if mode not in PROFILE_MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(PROFILE_MODES)}"}), 400
+    
+    if profile_session is not None and profile_session.running:
+        return jsonify({"error": "A profiling session is already running"}), 409
+    
+    profile_session = ProfileSession(
+        mode=mode,
+        max_requests=max_requests,
+        seconds=min(seconds or MAX_PROFILE_SECONDS, MAX_PROFILE_SECONDS),
+        interval=interval,
+        trace_memory=bool(data.get('tracemalloc')),
+        stages=PROFILE_STAGES
+    ).start()
+    logger.info(f"Profiling started: mode={mode}, requests={max_requests}, seconds={profile_session.seconds}")
+    return jsonify(profile_session.result()), 202
+
+@app.route('/debug/profile', methods=['GET', 'DELETE'])
+def get_profile():
+    """Return the current or last profile; DELETE stops a running session first."""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if profile_session is None:
+        return jsonify({"error": "No profiling session has been started"}), 404
+    if request.method == 'DELETE':
+        profile_session.stop()
+    if request.args.get('format') == 'collapsed':
+        try:
+            return profile_session.collapsed(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify(profile_session.result())
+
 @app.route('/models', methods=['GET'])
 def list_models():
     """List available models and current model info."""
+    with rtf_lock:
+        rtf = {name: round(model_rtf[name], 4) for name in whisper_models if name in model_rtf}
     return jsonify({
-        "current_model": "base",
+        "current_model": DEFAULT_MODEL,
         "available_models": ["tiny", "base", "small", "medium", "large"],
-        "device": "cpu",
-        "compute_type": "int8"
+        "registered_models": [
+            {"name": manifest["model"], "compute_type": manifest.get("compute_type"), "source": manifest.get("source")}
+            for manifest in model_cache.list_models(MODEL_CACHE_DIR or model_cache.DEFAULT_CACHE_DIR)
+        ],
+        "loaded_models": sorted(whisper_models, key=model_rank),
+        "speed_profiles": SPEED_PROFILES,
+        "rtf": rtf,
+        "model_load": model_load_info,
+        "workers": NUM_WORKERS,
+        "device": DEVICE,
+        "compute_type": COMPUTE_TYPE
     })
 
 @app.route('/status', methods=['GET'])
 def server_status():
     """Detailed server status."""
+    if router is not None:
+        return jsonify({
+            "status": "running",
+            "port": PORT,
+            "in_flight": in_flight,
+            "router": router.stats(),
+            "events": server_events.stats(),
+            "tracing": tracer.stats(),
+            "service": "clinote-whisper-router"
+        })
     return jsonify({
         "status": "running",
         "model_loaded": whisper_model is not None,
-        "model_name": "base" if whisper_model else None,
-        "device": "cpu",
-        "port": 11434,
-        "service": "clinote-whisper-server"
+        "ready": server_ready,
+        "model_name": DEFAULT_MODEL if whisper_model else None,
+        "model_state": model_state,
+        "model_lifecycle": dict(
+            model_lifecycle,
+            idle_unload_seconds=IDLE_UNLOAD_SECONDS,
+            idle_seconds=round(time.monotonic() - last_activity, 1),
+            active_transcriptions=active_transcriptions,
+            load_ms={name: info["load_ms"] for name, info in model_load_info.items()}
+        ),
+        "device": DEVICE,
+        "port": PORT,
+        "model_cache": {
+            "offline": bool(MODEL_CACHE_DIR or MODEL_ARCHIVE),
+            "cache_dir": MODEL_CACHE_DIR or (model_cache.DEFAULT_CACHE_DIR if MODEL_ARCHIVE else None),
+            "archive": MODEL_ARCHIVE,
+            "models": model_load_info
+        },
+        # What a router needs to balance load: requests beyond the workers are queued
+        "load": dict(load_snapshot(), in_flight=in_flight),
+        "memory": memory_report(),
+        "memory_governor": memory_governor.stats({name: model_bytes.get(name) for name in whisper_models}),
+        # "saved" is audio seconds that did not need a second inference
+        "coalescing": transcriptions.stats(),
+        "cancellation": active_requests.stats(),
+        "jobs": background_jobs.stats(),
+        "events": server_events.stats(),
+        "tracing": tracer.stats(),
+        "pinned_sessions": len(session_languages),
+        "diarization": diarizer.stats() if diarizer else None,
+        "redaction": dict(phi_redactor.stats(), logs=REDACT_LOGS, store=REDACT_STORE, segments=REDACT_SEGMENTS),
+        "service": "clinote-whisper-server",
+        "transcript_store": transcript_store.stats() if transcript_store else None
     })
 
+def start_health_server(port):
+    """Serve the API on a loopback side port so a supervisor can watch this worker."""
+    health_server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=health_server.serve_forever, name="health-server", daemon=True).start()
+    logger.info(f"Health endpoint listening on http://127.0.0.1:{port}/ping")
+    return health_server
+
+def serve(host, port, listen_fd=None):
+    """Serve until SIGTERM, then stop accepting and drain in-flight requests.
+
+    With listen_fd the server accepts on a socket inherited from the
+    launcher's supervisor, so old and new workers can share the port.
+    """
+    server = make_server(host, port, app, threaded=True, fd=listen_fd)
+    
+    def request_drain(signum, frame):
+        logger.info("Received shutdown signal, draining requests")
+        # Event streams would otherwise stay open; clients reconnect to the next worker
+        server_events.publish("shutdown", {"draining": True})
+        server_events.close()
+        # shutdown() blocks until serve_forever() returns, so call it off the serving thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, request_drain)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while in_flight > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if in_flight > 0:
+        logger.warning(f"Exiting with {in_flight} requests still in flight")
+    if transcript_store is not None:
+        transcript_store.close()
+    logger.info("Server stopped")
+
+def parse_args(argv=None):
+    """Parse command-line options that override the settings above."""
+    parser = argparse.ArgumentParser(description="Clinote Local Whisper Server")
+    parser.add_argument("--host", default=HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=PORT, help="Port to listen on")
+    parser.add_argument("--listen-fd", type=int, default=None,
+                        help="Accept on an inherited listening socket instead of binding the port")
+    parser.add_argument("--health-port", type=int, default=None,
+                        help="Also serve on this loopback port for supervisor health checks")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help="Whisper model size, or a model registered with model_import.py")
+    parser.add_argument("--extra-model", dest="extra_models", action="append", default=list(EXTRA_MODELS),
+                        help="Also load this model for the latency-budget planner (repeat for more)")
+    parser.add_argument("--device", choices=DEVICES, default=DEVICE, help="Inference device")
+    parser.add_argument("--compute-type", choices=COMPUTE_TYPES, default=COMPUTE_TYPE,
+                        help="Weight quantization for models without a fixed one")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS,
+                        help="Decoding replicas per model, sharing one copy of the weights")
+    parser.add_argument("--cpu-threads", type=int, default=CPU_THREADS,
+                        help="CPU threads per worker (0 picks automatically)")
+    parser.add_argument("--max-queue-depth", type=int, default=MAX_QUEUE_DEPTH,
+                        help="Refuse transcriptions with 503 once this many are waiting for a worker")
+    parser.add_argument("--decode-tiers", type=tier_overrides, metavar="JSON", default={},
+                        help='Override decoding tiers, e.g. \'{"fast": {"beam_size": 2}}\'')
+    parser.add_argument("--idle-unload", type=float, metavar="SECONDS", default=IDLE_UNLOAD_SECONDS,
+                        help="Unload models after this many idle seconds and reload on the next request")
+    parser.add_argument("--no-trim", action="store_true",
+                        help="Do not return freed memory to the OS after unloading")
+    parser.add_argument("--memory-budget", type=float, metavar="MB", default=MEMORY_BUDGET_MB,
+                        help="Resident memory budget; over it caches are evicted, idle models unloaded and requests refused")
+    parser.add_argument("--admin-token", default=ADMIN_TOKEN,
+                        help="Enable /debug and /config for requests bearing this token")
+    parser.add_argument("--otlp-endpoint", default=OTLP_ENDPOINT,
+                        help="Export trace spans as OTLP/HTTP JSON to this collector URL")
+    parser.add_argument("--trace-file", metavar="PATH", default=TRACE_FILE,
+                        help="Append trace spans to this JSONL file (also the fallback when the collector is down)")
+    parser.add_argument("--trace-sample-rate", type=float, default=TRACE_SAMPLE_RATE,
+                        help="Share of requests traced unless the client's traceparent marks them sampled")
+    parser.add_argument("--model-cache", metavar="DIR", default=MODEL_CACHE_DIR,
+                        help="Load models only from this offline cache (see model_cache.py)")
+    parser.add_argument("--model-archive", metavar="PATH", default=MODEL_ARCHIVE,
+                        help="Extract models missing from the cache out of this archive")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="Skip checksum verification of cached models")
+    parser.add_argument("--backend", metavar="URL", action="append", default=list(ROUTER_BACKENDS),
+                        help="Run as a router in front of this whisper server (repeat for each backend)")
+    parser.add_argument("--diarize", action="store_true", default=DIARIZE,
+                        help="Label segments by speaker unless a request opts out")
+    parser.add_argument("--normalize", action="store_true", default=NORMALIZE_TEXT,
+                        help="Rewrite spoken numbers, units and abbreviations in transcripts")
+    parser.add_argument("--no-redact-logs", action="store_true", default=not REDACT_LOGS,
+                        help="Write log records without masking PHI")
+    parser.add_argument("--no-redact-store", action="store_true", default=not REDACT_STORE,
+                        help="Store transcripts without masking PHI")
+    parser.add_argument("--redact-segments", action="store_true", default=REDACT_SEGMENTS,
+                        help="Mask PHI in the transcripts returned to clients too")
+    parser.add_argument("--log-transcripts", action="store_true", default=LOG_TRANSCRIPTS,
+                        help="Log each finished transcript")
+    parser.add_argument("--phi-names", metavar="PATH", default=PHI_NAMES_PATH,
+                        help="File of known patient names to mask, one per line")
+    parser.add_argument("--diarization-model", metavar="PATH", default=DIARIZATION_MODEL,
+                        help="ONNX speaker-embedding model (default: built-in log-mel embeddings)")
+    parser.add_argument("--voice-profiles", metavar="PATH", default=VOICE_PROFILES_PATH,
+                        help="Keep clinician voice profiles in this JSON file across restarts")
+    parser.add_argument("--store", metavar="PATH", default=TRANSCRIPT_STORE_PATH,
+                        help="Enable the local transcript store at this SQLite path")
+    parser.add_argument("--retention-days", type=float, default=TRANSCRIPT_RETENTION_DAYS,
+                        help="Purge stored transcripts older than this many days (0 keeps them)")
+    parser.add_argument("--max-records", type=int, default=TRANSCRIPT_MAX_RECORDS,
+                        help="Keep at most this many stored transcripts")
+    return parse_layered(parser, argv)
+
 if __name__ == '__main__':
+    args, CONFIG_PATH = parse_args()
+    HOST = args.host
+    PORT = args.port
+    DEFAULT_MODEL = args.model
+    EXTRA_MODELS = [name for name in args.extra_models if name != DEFAULT_MODEL]
+    DEVICE = args.device
+    COMPUTE_TYPE = args.compute_type
+    NUM_WORKERS = max(1, args.workers)
+    CPU_THREADS = args.cpu_threads
+    MAX_QUEUE_DEPTH = args.max_queue_depth
+    apply_decode_tiers(args.decode_tiers)
+    IDLE_UNLOAD_SECONDS = args.idle_unload or None
+    TRIM_ALLOCATOR = not args.no_trim
+    MEMORY_BUDGET_MB = args.memory_budget
+    ADMIN_TOKEN = args.admin_token
+    OTLP_ENDPOINT = args.otlp_endpoint
+    TRACE_FILE = args.trace_file
+    TRACE_SAMPLE_RATE = args.trace_sample_rate
+    tracer.configure(TRACE_SAMPLE_RATE, OTLP_ENDPOINT, TRACE_FILE)
+    MODEL_CACHE_DIR = args.model_cache
+    MODEL_ARCHIVE = args.model_archive
+    MODEL_VERIFY = not args.no_verify
+    TRANSCRIPT_STORE_PATH = args.store
+    TRANSCRIPT_RETENTION_DAYS = args.retention_days or None
+    TRANSCRIPT_MAX_RECORDS = args.max_records
+    ROUTER_BACKENDS = args.backend
+    DIARIZE = args.diarize
+    NORMALIZE_TEXT = args.normalize
+    REDACT_LOGS = not args.no_redact_logs
+    REDACT_STORE = not args.no_redact_store
+    REDACT_SEGMENTS = args.redact_segments
+    LOG_TRANSCRIPTS = args.log_transcripts
+    PHI_NAMES_PATH = args.phi_names
+    log_redaction.enabled = REDACT_LOGS
+    if PHI_NAMES_PATH:
+        try:
+            names = load_names(PHI_NAMES_PATH)
+        except OSError as e:
+            logger.error(f"Cannot read names file: {e}")
+            exit(1)
+        phi_redactor = Redactor(names)
+        log_redaction.redactor = phi_redactor
+        logger.info(f"Masking {len(names)} known names from {PHI_NAMES_PATH}")
+    DIARIZATION_MODEL = args.diarization_model
+    VOICE_PROFILES_PATH = args.voice_profiles
+    
+    if args.health_port:
+        start_health_server(args.health_port)
+    
+    if ROUTER_BACKENDS:
+        # Router mode: no model here, just spread requests over the backends
+        router = Router(ROUTER_BACKENDS, on_change=publish_state)
+        router.start()
+        server_ready = True
+        print(f"🔀 Starting Clinote Whisper Router on http://localhost:{PORT}")
+        for backend in router.backends:
+            print(f"   → {backend.url} ({'up' if backend.healthy else 'down'})")
+        print("⏹️  Press Ctrl+C to stop the router")
+        print("")
+        logger.info(f"Routing to {len(ROUTER_BACKENDS)} backends")
+        serve(HOST, PORT, args.listen_fd)
+        sys.exit(0)
+    
     # Load model on startup
     if not load_model():
         logger.error("Failed to load Whisper model. Exiting.")
         exit(1)
     
+    open_transcript_store()
+    
+    # Map the code suggestion index now so the first request does not pay for it
+    try:
+        get_code_index()
+    except Exception as e:
+        logger.warning(f"Code suggestion index unavailable: {e}")
+    
+    warm_up()
+    if DIARIZE:
+        # Loads the VAD model now rather than on the first request
+        start_diarization(np.zeros(SAMPLE_RATE, dtype=np.float32)).result()
+    setup_memory_governor()
+    # Both loops idle while their setting is off, so PATCH /config can turn them on
+    threading.Thread(target=governor_loop, name="memory-governor", daemon=True).start()
+    threading.Thread(target=idle_unload_loop, name="idle-unload", daemon=True).start()
+    if MEMORY_BUDGET_MB:
+        memory_governor.budget = int(MEMORY_BUDGET_MB * MB)
+        logger.info(f"Memory budget: {MEMORY_BUDGET_MB:.0f} MB")
+    if IDLE_UNLOAD_SECONDS:
+        logger.info(f"Models unload after {IDLE_UNLOAD_SECONDS:.0f}s idle")
+    
     # Run server
-    print("🚀 Starting Clinote Whisper Server on http://localhost:11434")
+    print(f"🚀 Starting Clinote Whisper Server on http://localhost:{PORT}")
     print("✅ Server is ready to accept transcription requests!")
     print("📱 Use the Clinote Chrome extension to start transcribing")
     print("⏹️  Press Ctrl+C to stop the server")
     print("")
-    logger.info("Starting Clinote Whisper Server on http://localhost:11434")
-    app.run(host='0.0.0.0', port=11434, debug=False) 
\ No newline at end of file
+    logger.info(f"Starting Clinote Whisper Server on http://localhost:{PORT}")
+    serve(HOST, PORT, args.listen_fd) 
\ No newline at end of file